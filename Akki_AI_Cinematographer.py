@@ -1,9 +1,60 @@
 # Node: AI Cinematographer (Pro)
-# Version: 3.9.0
+# Version: 3.11.0
 
-import traceback
 import re
-from .shared_utils import report_token_usage
+from .shared_utils import report_token_usage, run_completion_batch, raise_batch_failures, OutputGrammar, gbnf_literal, ProcessLog
+from .llm_metrics import metrics_node
+from .akki_logging import get_logger
+
+log = get_logger(__name__)
+
+SHOT_TYPES = ("WIDE SHOT", "LONG SHOT", "MEDIUM SHOT", "MEDIUM CLOSE UP", "CLOSE UP", "EXTREME CLOSE UP", "LOW ANGLE SHOT")
+# (line label, JSON key, GBNF rule) in the order the prompt's <output_format> mandates.
+# Per-character PROPS/COSTUMES lines go between the two groups.
+SHOT_HEAD_FIELDS = (("SHOT", "SHOT", "shot-letter"), ("LOCATION", "LOCATION", "value"), ("SET_DRESSING", "SET_DRESSING", "value"),
+                    ("SHOT_TYPE", "SHOT_TYPE", "shot-type"), ("SHOT_FRAMING", "SHOT_FRAMING", "value"), ("Camera & Lens", "CAMERA_AND_LENS", "value"),
+                    ("DESCRIPTION", "DESCRIPTION", "value"), ("Movement & Angle", "MOVEMENT_AND_ANGLE", "value"), ("CHARACTERS", "CHARACTERS", "value"))
+SHOT_TAIL_FIELDS = (("VFX", "VFX", "value"), ("Sound Design Cue", "SOUND_DESIGN_CUE", "value"), ("SFX", "SFX", "value"),
+                    ("PERFORMANCE", "PERFORMANCE", "value"), ("DIALOGUE", "DIALOGUE", "value"), ("Director's Rationale", "DIRECTORS_RATIONALE", "value"))
+
+def _build_shot_block_gbnf():
+    field_line = lambda label, rule: rf'{gbnf_literal(label + ": ")} {rule} "\n"'
+    return "\n".join([
+        "root ::= block+",
+        r'block ::= "//---SHOT_START---//\n" ' + " ".join(field_line(label, rule) for label, _, rule in SHOT_HEAD_FIELDS)
+        + " assets " + " ".join(field_line(label, rule) for label, _, rule in SHOT_TAIL_FIELDS) + r' "//---SHOT_END---//\n"',
+        r'assets ::= ("PROPS (" name "): " value "\n" "COSTUMES (" name "): " value "\n")*',
+        "shot-letter ::= [A-Z]",
+        "shot-type ::= " + " | ".join(gbnf_literal(shot_type) for shot_type in SHOT_TYPES),
+        r"name ::= [^()\n:]+",
+        r"value ::= [^\n]+",
+    ])
+
+def _render_shot_blocks(data):
+    blocks = []
+    for shot in data["shots"]:
+        lines = [f"{label}: {shot[key]}" for label, key, _ in SHOT_HEAD_FIELDS]
+        for asset in shot.get("CHARACTER_ASSETS", []):
+            lines += [f"PROPS ({asset['name']}): {asset['props']}", f"COSTUMES ({asset['name']}): {asset['costumes']}"]
+        lines += [f"{label}: {shot[key]}" for label, key, _ in SHOT_TAIL_FIELDS]
+        blocks.append("//---SHOT_START---//\n" + "\n".join(lines) + "\n//---SHOT_END---//")
+    return "\n".join(blocks)
+
+_SHOT_JSON_PROPERTIES = {key: {"type": "string"} for _, key, _ in SHOT_HEAD_FIELDS + SHOT_TAIL_FIELDS}
+_SHOT_JSON_PROPERTIES["SHOT"] = {"type": "string", "pattern": "^[A-Z]$"}
+_SHOT_JSON_PROPERTIES["SHOT_TYPE"] = {"type": "string", "enum": list(SHOT_TYPES)}
+_SHOT_JSON_PROPERTIES["CHARACTER_ASSETS"] = {"type": "array", "items": {
+    "type": "object", "additionalProperties": False, "required": ["name", "props", "costumes"],
+    "properties": {"name": {"type": "string"}, "props": {"type": "string"}, "costumes": {"type": "string"}}}}
+
+SHOT_BLOCK_GRAMMAR = OutputGrammar(
+    name="shot_blocks",
+    gbnf=_build_shot_block_gbnf(),
+    json_schema={"type": "object", "additionalProperties": False, "required": ["shots"], "properties": {"shots": {
+        "type": "array", "minItems": 1, "items": {"type": "object", "additionalProperties": False,
+                                                  "required": list(_SHOT_JSON_PROPERTIES), "properties": _SHOT_JSON_PROPERTIES}}}},
+    render=_render_shot_blocks,
+)
 
 class AICinematographer_Akki:
     """
@@ -11,7 +62,10 @@ class AICinematographer_Akki:
     architecture. It correctly delegates complex dialogue parsing to downstream
     nodes, introduces a "Factual Fidelity" protocol to prevent factual
     contradictions, and uses a deterministic Python helper to resolve
-    unambiguous pronouns from the screenplay context.
+    unambiguous pronouns from the screenplay context. v3.10 constrains
+    generation to the shot block format (SHOT_BLOCK_GRAMMAR). v3.11 writes
+    the per-scene prompts to a process log file in the project folder and
+    returns its path and a summary as `full_llm_prompt`.
     """
     DEFAULT_PROMPT_TEMPLATE = """<role>
 You are an acclaimed, award-winning professional Cinematographer and Director. Your task is to translate the provided text of a single screenplay scene into a complete and actionable shot breakdown.
@@ -103,6 +157,12 @@ Now, perform this breakdown for the single scene text provided below. Follow all
                 "top_k": ("INT", {"default": 40}),
                 "seed": ("INT", {"default": 1234}),
                 "max_tokens": ("INT", {"default": 4096, "min": 1024, "max": 65536}),
+            },
+            "optional": {
+                "max_concurrency": ("INT", {"default": 4, "min": 1, "max": 32}),
+                "constrain_output": ("BOOLEAN", {"default": True}),
+                "use_llm_cache": ("BOOLEAN", {"default": True}),
+                "project_path": ("STRING", {"forceInput": True}),
             }
         }
     
@@ -167,7 +227,7 @@ Now, perform this breakdown for the single scene text provided below. Follow all
                     rebuilt_block_lines.append(line)
             
             if was_corrected:
-                print(f"    - Pronoun resolved in shot. Replaced with '{unambiguous_character}'")
+                log.debug("    - Pronoun resolved in shot. Replaced with '%s'", unambiguous_character)
 
             corrected_blocks.append("\n".join(rebuilt_block_lines))
 
@@ -178,7 +238,7 @@ Now, perform this breakdown for the single scene text provided below. Follow all
         # This function is being retained for now as per the lead programmer's analysis
         # of the AI QC Supervisor's dependency. It will be removed in a future refactor
         # of the entire pipeline.
-        print("[AICinematographer-v3.9] Normalizing character names in breakdown (legacy pre-normalization for QC Supervisor)...")
+        log.debug("[AICinematographer-v3.9] Normalizing character names in breakdown (legacy pre-normalization for QC Supervisor)...")
         
         heading_pattern = re.compile(r"^\s*([A-Z\s(V.O.)(CONT'D)]{2,})\s*$", re.MULTILINE)
         slugline_pattern = re.compile(r"^\s*(INT|EXT)\..*")
@@ -190,7 +250,7 @@ Now, perform this breakdown for the single scene text provided below. Follow all
                 canonical_names.add(name)
         
         if not canonical_names:
-            print("    - Warning: No canonical names found in screenplay. Skipping normalization.")
+            log.warning("    - Warning: No canonical names found in screenplay. Skipping normalization.")
             return breakdown_text
 
         variation_map = {}
@@ -228,9 +288,11 @@ Now, perform this breakdown for the single scene text provided below. Follow all
         
         return "\n".join(corrected_lines)
 
-    def generate_shot_list(self, llm_model, screenplay, temperature, top_p, top_k, seed, max_tokens):
+    @metrics_node("AICinematographer")
+    def generate_shot_list(self, llm_model, screenplay, temperature, top_p, top_k, seed, max_tokens, max_concurrency=4, use_llm_cache=True, constrain_output=True,
+                           project_path=None):
         final_full_report = []
-        full_llm_prompts_log = ""
+        process_log = None
         try:
             if not hasattr(llm_model, 'create_completion'):
                 raise ValueError("LLM Model not provided or is invalid.")
@@ -242,15 +304,23 @@ Now, perform this breakdown for the single scene text provided below. Follow all
 
             scenes = [screenplay[current.start():(anchors[i+1].start() if i + 1 < len(anchors) else len(screenplay))].strip() for i, current in enumerate(anchors)]
             
-            print(f"[AICinematographer-Pro-v3.9] Found {len(scenes)} scenes to process.")
+            log.info("[AICinematographer-Pro-v3.11] Found %d scenes to process.", len(scenes))
 
+            process_log = ProcessLog("AICinematographer", project_path)
+            batch = []
             for i, scene_text in enumerate(scenes):
-                scene_num = i + 1
-                print(f"[AICinematographer-Pro-v3.9] Processing Scene {scene_num}...")
                 current_prompt = self.DEFAULT_PROMPT_TEMPLATE.format(current_scene_text=scene_text)
-                full_llm_prompts_log += f"--- PROMPT FOR SCENE {scene_num} ---\n{current_prompt}\n\n"
+                process_log.write(f"PROMPT FOR SCENE {i + 1}", current_prompt)
+                batch.append(dict(prompt=current_prompt, max_tokens=max_tokens, temperature=temperature, top_p=top_p, top_k=top_k, seed=seed if seed > 0 else -1, stop=["</response>"], use_cache=use_llm_cache,
+                                  grammar=SHOT_BLOCK_GRAMMAR if constrain_output else None, metrics_item=f"Scene {i + 1}"))
 
-                output = llm_model.create_completion(prompt=current_prompt, max_tokens=max_tokens, temperature=temperature, top_p=top_p, top_k=top_k, seed=seed if seed > 0 else -1, stop=["</response>"])
+            log.info("[AICinematographer-Pro-v3.11] Sending %d scenes to the LLM (max concurrency %s)...", len(batch), max_concurrency)
+            outputs = run_completion_batch(llm_model, batch, max_concurrency=max_concurrency)
+            raise_batch_failures(outputs, "Scene")
+
+            for i, (scene_text, output) in enumerate(zip(scenes, outputs)):
+                scene_num = i + 1
+                log.debug("[AICinematographer-Pro-v3.11] Processing Scene %d...", scene_num)
                 report_token_usage(f"AICinematographer (Scene {scene_num})", output)
                 creative_breakdown = output['choices'][0]['text'].strip()
                 
@@ -270,13 +340,15 @@ Now, perform this breakdown for the single scene text provided below. Follow all
                 final_full_report.append(corrected_breakdown)
 
             shot_breakdown_report = "\n\n".join(final_full_report)
-            print("[AICinematographer-Pro-v3.9] All scenes processed successfully.")
+            log.info("[AICinematographer-Pro-v3.11] All scenes processed successfully.")
 
         except Exception as e:
             shot_breakdown_report = f"ERROR: An exception occurred. Check console.\n\nDetails: {e}"
-            print(f"[AICinematographer-Pro-v3.9] Error:"); traceback.print_exc()
+            log.exception("[AICinematographer-Pro-v3.11] Error:")
+        finally:
+            if process_log: process_log.close()
 
-        return (shot_breakdown_report, full_llm_prompts_log)
+        return (shot_breakdown_report, process_log.summary() if process_log else "")
 
 NODE_CLASS_MAPPINGS = {"AICinematographer_Akki": AICinematographer_Akki}
-NODE_DISPLAY_NAME_MAPPINGS = {"AICinematographer_Akki": "AI Cinematographer (Pro) v3.9 - Akki"}
\ No newline at end of file
+NODE_DISPLAY_NAME_MAPPINGS = {"AICinematographer_Akki": "AI Cinematographer (Pro) v3.11 - Akki"}
\ No newline at end of file
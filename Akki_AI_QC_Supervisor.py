@@ -1,8 +1,29 @@
-# Node: AI QC Supervisor v2.1
+# Node: AI QC Supervisor v2.3
 
-import traceback
 import re
-from .shared_utils import report_token_usage, extract_tagged_content
+from .shared_utils import report_token_usage, extract_tagged_content, run_completion_batch, raise_batch_failures, OutputGrammar, llm_request_scope, ProcessLog
+from .llm_metrics import metrics_node
+from .akki_logging import get_logger
+
+log = get_logger(__name__)
+
+QC_REPORT_KEYS = ("CLEANED_PROPS", "CLEANED_COSTUMES", "CLEANED_SET_DRESSING")
+
+def _render_qc_report(data):
+    lines = [f"{key}: {', '.join(item.strip() for item in data[key] if item.strip()) or 'None'}" for key in QC_REPORT_KEYS]
+    return "//---START_QC_REPORT--//\n" + "\n".join(lines) + "\n//---END_QC_REPORT--//"
+
+QC_REPORT_GRAMMAR = OutputGrammar(
+    name="qc_report",
+    gbnf=r'''
+root ::= "//---START_QC_REPORT--//\n" "CLEANED_PROPS: " list "\n" "CLEANED_COSTUMES: " list "\n" "CLEANED_SET_DRESSING: " list "\n" "//---END_QC_REPORT--//"
+list ::= "None" | item (", " item)*
+item ::= [^,\n ] [^,\n]*
+''',
+    json_schema={"type": "object", "additionalProperties": False, "required": list(QC_REPORT_KEYS),
+                 "properties": {key: {"type": "array", "items": {"type": "string"}} for key in QC_REPORT_KEYS}},
+    render=_render_qc_report,
+)
 
 class AIQCSupervisor_Akki:
     """
@@ -11,6 +32,10 @@ class AIQCSupervisor_Akki:
     The AI prompt is refined with a clearer cognitive model to prevent over-
     aggressive cleaning, and the Python rebuilder is hardened to deterministically
     reject and discard malformed junk keys like `PROPS (None)`.
+    v2.2 constrains generation to the QC report format (QC_REPORT_GRAMMAR).
+    v2.3 writes the prompts and QC reports to a process log file in the
+    project folder and returns its path and a summary as
+    `full_llm_process_log`.
     """
 
     # --- DEFINITIVE FIX v2.1: Refined prompt with a context-free cognitive model ---
@@ -57,6 +82,11 @@ CLEANED_SET_DRESSING: [comma-separated list of valid set dressing items]
             "required": {
                 "llm_model": ("LLM_MODEL",),
                 "shot_breakdown_report": ("STRING", {"forceInput": True}),
+            },
+            "optional": {
+                "max_concurrency": ("INT", {"default": 4, "min": 1, "max": 32}),
+                "constrain_output": ("BOOLEAN", {"default": True}),
+                "project_path": ("STRING", {"forceInput": True}),
             }
         }
     
@@ -65,17 +95,18 @@ CLEANED_SET_DRESSING: [comma-separated list of valid set dressing items]
     FUNCTION = "supervise_and_correct"
     CATEGORY = "AkkiNodes/Production"
 
-    def supervise_and_correct(self, llm_model, shot_breakdown_report):
-        clean_blocks, full_llm_process_log = [], ""
+    @metrics_node("AIQCSupervisor")
+    def supervise_and_correct(self, llm_model, shot_breakdown_report, max_concurrency=4, constrain_output=True, project_path=None):
+        clean_blocks, process_log = [], None
         try:
             if not hasattr(llm_model, 'create_completion'):
                 raise ValueError("LLM Model not provided or is invalid.")
             
             shot_blocks = [block for block in shot_breakdown_report.split('//---SHOT_START---//') if block.strip()]
 
+            block_jobs, batch = [], []
             for i, block in enumerate(shot_blocks):
                 original_shot_block = block.replace('//---SHOT_END---//', '').strip()
-                print(f"  - Sanitizing shot block {i+1}/{len(shot_blocks)}...")
 
                 # --- STAGE 1 (Python Extractor) ---
                 raw_asset_lists = []
@@ -87,14 +118,24 @@ CLEANED_SET_DRESSING: [comma-separated list of valid set dressing items]
                         asset_lines_to_replace.add(line.strip())
                 asset_lists_text = "\n".join(raw_asset_lists)
 
-                # --- STAGE 2 (AI Sanitizer) ---
                 final_llm_prompt = self.DEFAULT_PROMPT_TEMPLATE.format(asset_lists_text=asset_lists_text)
-                full_llm_process_log += f"--- PROMPT FOR BLOCK {i+1} ---\n{final_llm_prompt}\n\n"
-                
-                output = llm_model.create_completion(prompt=final_llm_prompt, max_tokens=1024, temperature=0.1, stop=["</response>"])
+                block_jobs.append((original_shot_block, asset_lines_to_replace, final_llm_prompt))
+                batch.append(dict(prompt=final_llm_prompt, end_tags=["//---END_QC_REPORT--//"], max_tokens=1024, temperature=0.1, stop=["</response>"],
+                                  grammar=QC_REPORT_GRAMMAR if constrain_output else None, metrics_item=f"Block {i + 1}"))
+
+            # --- STAGE 2 (AI Sanitizer) ---
+            log.info("  - Sanitizing %d shot blocks (max concurrency %s)...", len(batch), max_concurrency)
+            # Asset sanitizing is mechanical: an LLM Router sends it to its smallest model.
+            with llm_request_scope(tier="mechanical"):
+                outputs = run_completion_batch(llm_model, batch, max_concurrency=max_concurrency)
+            raise_batch_failures(outputs, "Block")
+            process_log = ProcessLog("AIQCSupervisor", project_path)
+
+            for i, ((original_shot_block, asset_lines_to_replace, final_llm_prompt), output) in enumerate(zip(block_jobs, outputs)):
+                process_log.write(f"PROMPT FOR BLOCK {i+1}", final_llm_prompt)
                 report_token_usage(f"AIQCSupervisor (Block {i+1})", output)
                 qc_report_text = extract_tagged_content(output['choices'][0]['text'].strip(), "qc_report")
-                full_llm_process_log += f"--- QC REPORT FOR BLOCK {i+1} ---\n{qc_report_text}\n\n"
+                process_log.write(f"QC REPORT FOR BLOCK {i+1}", qc_report_text)
                 
                 clean_lists = {}
                 for line in qc_report_text.splitlines():
@@ -118,7 +159,7 @@ CLEANED_SET_DRESSING: [comma-separated list of valid set dressing items]
                 for char, items in original_props:
                     # --- DEFINITIVE FIX v2.1: Deterministic check for junk keys ---
                     if char.lower() == 'none':
-                        print(f"    - Discarded malformed PROPS key: PROPS ({char})")
+                        log.debug("    - Discarded malformed PROPS key: PROPS (%s)", char)
                         continue # Skip and discard this junk entry entirely
                     
                     retained_items = sorted([item for item in items if item in clean_props_items])
@@ -128,7 +169,7 @@ CLEANED_SET_DRESSING: [comma-separated list of valid set dressing items]
                 for char, items in original_costumes:
                     # --- DEFINITIVE FIX v2.1: Deterministic check for junk keys ---
                     if char.lower() == 'none':
-                        print(f"    - Discarded malformed COSTUMES key: COSTUMES ({char})")
+                        log.debug("    - Discarded malformed COSTUMES key: COSTUMES (%s)", char)
                         continue # Skip and discard this junk entry entirely
                         
                     retained_items = sorted([item for item in items if item in clean_costumes_items])
@@ -141,13 +182,15 @@ CLEANED_SET_DRESSING: [comma-separated list of valid set dressing items]
                 clean_blocks.append("\n".join(rebuilt_block_lines))
             
             final_report = "//---SHOT_START---//\n" + "\n//---SHOT_END---//\n\n//---SHOT_START---//\n".join(clean_blocks) + "\n//---SHOT_END---//"
-            print("[AIQCSupervisor-v2.1] All shot blocks sanitized and reassembled successfully.")
+            log.info("[AIQCSupervisor-v2.3] All shot blocks sanitized and reassembled successfully.")
 
         except Exception as e:
             final_report = f"ERROR: An exception occurred. Check console.\n\nDetails: {e}"
-            print(f"[AIQCSupervisor-v2.1] Error:"); traceback.print_exc()
+            log.exception("[AIQCSupervisor-v2.3] Error:")
+        finally:
+            if process_log: process_log.close()
             
-        return (final_report, full_llm_process_log)
+        return (final_report, process_log.summary() if process_log else "")
 
     def _extract_assets_by_char(self, block_text, asset_type):
         pattern = re.compile(rf"^{asset_type.upper()}\s*\((.*?)\):\s*(.*)", re.IGNORECASE | re.MULTILINE)
@@ -155,4 +198,4 @@ CLEANED_SET_DRESSING: [comma-separated list of valid set dressing items]
 
 # --- Mappings ---
 NODE_CLASS_MAPPINGS = {"AIQCSupervisor-Akki": AIQCSupervisor_Akki}
-NODE_DISPLAY_NAME_MAPPINGS = {"AIQCSupervisor-Akki": "AI QC Supervisor v2.1 - Akki"}
\ No newline at end of file
+NODE_DISPLAY_NAME_MAPPINGS = {"AIQCSupervisor-Akki": "AI QC Supervisor v2.3 - Akki"}
\ No newline at end of file
@@ -1,41 +1,31 @@
-# Node: AI Shot Duration Calculator v1.6 (List Output Refactor)
+# Node: AI Shot Duration Calculator v1.8 (Constrained Output)
 
 import os
 import traceback
 import csv
 import io
 import re
-from .shared_utils import report_token_usage
+from .shared_utils import report_token_usage, OutputGrammar, gbnf_literal, PromptBudget, PromptOverflowError, run_completion_batch, raise_batch_failures, PROMPTS
+from .llm_metrics import metrics_node
+from .akki_logging import get_logger
+
+log = get_logger(__name__)
 
 # --- CONSTANTS ---
-NODE_DIR = os.path.dirname(__file__)
-PROMPTS_ROOT_DIR = os.path.join(NODE_DIR, "_prompts", "Duration")
+# Prompt templates live in _prompts/Duration (see PromptRegistry).
+PROMPT_FOLDER = "Duration"
 
 # --- HELPER FUNCTIONS ---
-def get_prompt_files_from_dir():
-    """Scans the node's prompts directory and returns a list of .txt files."""
-    if not os.path.isdir(PROMPTS_ROOT_DIR):
-        print(f"[AIShotDurationCalculator] Creating prompt directory: {PROMPTS_ROOT_DIR}")
-        os.makedirs(PROMPTS_ROOT_DIR, exist_ok=True)
-        placeholder_path = os.path.join(PROMPTS_ROOT_DIR, "placeholder_prompt.txt")
-        if not os.path.exists(placeholder_path):
-             with open(placeholder_path, 'w', encoding='utf-8') as f:
-                f.write("Add your duration calculation prompt .txt files here.")
-        return ["placeholder_prompt.txt"]
-    try:
-        files = [f for f in os.listdir(PROMPTS_ROOT_DIR) if f.endswith('.txt')]
-        return sorted(files) if files else ["No .txt prompts found"]
-    except Exception as e:
-        print(f"[AIShotDurationCalculator] Error scanning prompt directory {PROMPTS_ROOT_DIR}: {e}")
-        return ["Error loading prompts"]
-
-def read_prompt_file(filename):
-    """Reads the content of a specific prompt file."""
-    filepath = os.path.join(PROMPTS_ROOT_DIR, filename)
-    if not os.path.exists(filepath):
-        raise FileNotFoundError(f"Prompt file not found: {filepath}")
-    with open(filepath, 'r', encoding='utf-8') as f:
-        return f.read()
+def build_duration_grammar(shot_ids):
+    """One `SHOT_ID: seconds` line per shot, in CSV order, nothing else."""
+    lines = " ".join(f'{gbnf_literal(shot_id + ": ")} seconds "\\n"' for shot_id in shot_ids)
+    return OutputGrammar(
+        name="shot_durations",
+        gbnf=f"root ::= {lines}\nseconds ::= [0-9] [0-9]? [0-9]?",
+        json_schema={"type": "object", "additionalProperties": False, "required": list(shot_ids),
+                     "properties": {shot_id: {"type": "integer", "minimum": 0} for shot_id in shot_ids}},
+        render=lambda data: "\n".join(f"{shot_id}: {int(data[shot_id])}" for shot_id in shot_ids),
+    )
 # --- END HELPER FUNCTIONS ---
 
 
@@ -44,6 +34,10 @@ class AIShotDurationCalculator_Akki:
     An AI agent that analyzes a production CSV to estimate shot durations.
     v1.6 refactors the output to provide synchronized lists of shot names and
     durations for downstream automation, replacing the CSV string output.
+    v1.7 constrains generation to exactly one duration line per CSV shot.
+    v1.8 measures the prompt against the model's context window first; a
+    shot list too long for one call (after reserving `max_tokens`) is split
+    into consecutive groups of shots, one call each.
     """
     
     PRIMARY_KEYS = {
@@ -62,12 +56,16 @@ class AIShotDurationCalculator_Akki:
                 "llm_model": ("LLM_MODEL",),
                 "csv_report": ("STRING", {"forceInput": True}),
                 "shot_index": ("INT", {"default": 1, "min": 1, "step": 1}),
-                "prompt_selector": (get_prompt_files_from_dir(),),
+                "prompt_selector": (PROMPTS.list(PROMPT_FOLDER, "AIShotDurationCalculator"),),
                 "temperature": ("FLOAT", {"default": 0.4, "step": 0.01}),
                 "top_p": ("FLOAT", {"default": 0.95, "step": 0.01}),
                 "top_k": ("INT", {"default": 40}),
                 "seed": ("INT", {"default": 1234}),
                 "max_tokens": ("INT", {"default": 2048, "min": 64, "max": 8192}),
+            },
+            "optional": {
+                "constrain_output": ("BOOLEAN", {"default": True}),
+                "use_llm_cache": ("BOOLEAN", {"default": True}),
             }
         }
 
@@ -86,7 +84,26 @@ class AIShotDurationCalculator_Akki:
             return row[actual_key].strip()
         return "N/A"
 
-    def calculate_durations(self, llm_model, csv_report, shot_index, prompt_selector, temperature, top_p, top_k, seed, max_tokens):
+    def _group_shots(self, budget, prompt_template, data_blocks, shot_ids):
+        """Splits the shots into consecutive groups whose prompt fits the budget; one group when there is no limit."""
+        if budget.fits(prompt_template.format(shot_data_blocks="\n\n".join(data_blocks))): return [(data_blocks, shot_ids)]
+        room = budget.limit - prompt_template.static_tokens(budget)
+        groups, blocks, ids, used = [], [], [], 0
+        for block, shot_id in zip(data_blocks, shot_ids):
+            size = budget.count(block) + 2
+            if size > room: raise PromptOverflowError(f"The data for shot {shot_id} alone ({size} tokens) does not fit the prompt budget ({room} tokens).")
+            if blocks and used + size > room:
+                groups.append((blocks, ids))
+                blocks, ids, used = [], [], 0
+            blocks.append(block)
+            ids.append(shot_id)
+            used += size
+        groups.append((blocks, ids))
+        log.info("[AIShotDurationCalculator] %d shots do not fit one %d-token prompt; timing them in %d calls.", len(shot_ids), budget.n_ctx, len(groups))
+        return groups
+
+    @metrics_node("AIShotDurationCalculator")
+    def calculate_durations(self, llm_model, csv_report, shot_index, prompt_selector, temperature, top_p, top_k, seed, max_tokens, use_llm_cache=True, constrain_output=True):
         # Initialize outputs
         durations_text_report = "ERROR: Processing failed."
         shot_names_LIST = []
@@ -101,7 +118,7 @@ class AIShotDurationCalculator_Akki:
             if not hasattr(llm_model, 'create_completion'):
                 raise ValueError("LLM Model not provided or is invalid.")
 
-            prompt_template = read_prompt_file(prompt_selector)
+            prompt_template = PROMPTS.get(PROMPT_FOLDER, prompt_selector, fields=("shot_data_blocks",))
             
             # --- DATA PREPARATION (Unchanged) ---
             csv_file = io.StringIO(csv_report)
@@ -109,10 +126,11 @@ class AIShotDurationCalculator_Akki:
             if not all_rows:
                 raise ValueError("CSV report contains no data.")
 
-            all_shot_data_blocks = []
+            all_shot_data_blocks, shot_ids = [], []
             for row in all_rows:
                 shot_id = self._get_value_from_row(row, self.PRIMARY_KEYS['SHOT'])
                 if shot_id == "N/A": continue
+                shot_ids.append(shot_id)
 
                 data_block = [f"--- DATA FOR SHOT: {shot_id} ---"]
                 data_block.append(f"SHOT_FRAMING: {self._get_value_from_row(row, self.PRIMARY_KEYS['SHOT_FRAMING'])}")
@@ -125,13 +143,22 @@ class AIShotDurationCalculator_Akki:
             if not all_shot_data_blocks:
                 raise ValueError("CSV was parsed, but no valid shots were found to process.")
 
-            # --- LLM CALL (Unchanged) ---
-            full_data_payload = "\n\n".join(all_shot_data_blocks)
-            final_prompt = prompt_template.format(shot_data_blocks=full_data_payload)
-            
-            output = llm_model.create_completion(prompt=final_prompt, max_tokens=max_tokens, temperature=temperature, top_p=top_p, top_k=top_k, seed=seed if seed > 0 else -1)
-            raw_ai_text = output['choices'][0]['text'].strip()
-            full_llm_process_log = f"--- FULL PROMPT SENT TO LLM ---\n{final_prompt}\n\n--- RAW LLM RESPONSE ---\n{raw_ai_text}"
+            # --- LLM CALL(S) ---
+            budget = PromptBudget(llm_model, max_tokens, label="AIShotDurationCalculator")
+            batch = []
+            for blocks, ids in self._group_shots(budget, prompt_template, all_shot_data_blocks, shot_ids):
+                final_prompt = budget.pack(prompt_template, {}, shot_data_blocks="\n\n".join(blocks))
+                grammar = build_duration_grammar(list(dict.fromkeys(ids))) if constrain_output else None
+                batch.append({"prompt": final_prompt, "max_tokens": max_tokens, "temperature": temperature, "top_p": top_p, "top_k": top_k,
+                              "seed": seed if seed > 0 else -1, "use_cache": use_llm_cache, "grammar": grammar, "metrics_item": f"Shots {ids[0]}-{ids[-1]}"})
+            if len(batch) == 1:
+                batch[0].pop("metrics_item")
+                outputs = [llm_model.create_completion(**batch[0])]
+            else:
+                outputs = run_completion_batch(llm_model, batch, max_concurrency=len(batch))
+                raise_batch_failures(outputs, label="Shot group")
+            raw_ai_text = "\n".join(output['choices'][0]['text'].strip() for output in outputs)
+            full_llm_process_log = "".join(f"--- FULL PROMPT SENT TO LLM ---\n{item['prompt']}\n\n" for item in batch) + f"--- RAW LLM RESPONSE ---\n{raw_ai_text}"
 
             # --- PARSING AND OUTPUT GENERATION (Refactored for Lists) ---
             sanitized_lines = [line.strip() for line in raw_ai_text.splitlines() if ':' in line and any(char.isdigit() for char in line)]
@@ -166,7 +193,7 @@ class AIShotDurationCalculator_Akki:
                 sel_duration = "0" # Index out of bounds
 
         except Exception as e:
-            traceback.print_exc()
+            log.exception("[AIShotDurationCalculator] Error:")
             error_message = f"ERROR: {e}"
             durations_text_report = error_message
             full_llm_process_log += f"\n\n--- PROCESSING ERROR ---\n{traceback.format_exc()}"
@@ -4,9 +4,11 @@
 
 import csv
 import io
-import traceback
 import re
 import json
+from .akki_logging import get_logger
+
+log = get_logger(__name__)
 
 class AssetSelector_Akki:
     """
@@ -214,7 +216,7 @@ class AssetSelector_Akki:
 """
             return (master_character_list, master_prop_list, master_set_dressing_list, master_costume_list, master_vfx_list, master_sfx_list,total_shots_count, total_characters_count,selected_char_name, selected_char_costumes, debug_output,master_main_sets_list, total_main_sets_count, selected_main_set_name, set_hierarchy_json)
         except Exception as e:
-            traceback.print_exc()
+            log.exception("[AssetSelector] Error:")
             error_msg = f"ERROR: Could not process CSV. Check console. Details: {e}"
             return (error_msg,) + error_tuple[1:]
 
@@ -1,41 +1,18 @@
 # --- START OF FILE Akki_Character_Lookdev_Bible.py ---
 
-# Node: AI Character Lookdev (Bible) v13.0 (Final LLM Editor Test)
+# Node: AI Character Lookdev (Bible) v13.1 (Final LLM Editor Test)
 
-import traceback
 import re
 import os
 import csv
-from .shared_utils import report_token_usage, extract_tagged_content, get_wildcard_list
-
-# --- HELPER FUNCTIONS for Self-Contained Prompt Loading ---
-NODE_DIR = os.path.dirname(__file__)
-PROMPTS_ROOT_DIR = os.path.join(NODE_DIR, "_prompts", "LookdevCHR")
-
-def get_prompt_files_from_stage_dir(stage_folder):
-    stage_dir = os.path.join(PROMPTS_ROOT_DIR, stage_folder)
-    if not os.path.isdir(stage_dir):
-        print(f"[CharacterLookdev-v13.0] Creating prompt directory: {stage_dir}")
-        os.makedirs(stage_dir, exist_ok=True)
-        placeholder_path = os.path.join(stage_dir, "placeholder.txt")
-        if not os.path.exists(placeholder_path):
-             with open(placeholder_path, 'w', encoding='utf-8') as f:
-                f.write(f"Add your {stage_folder} prompt .txt files here.")
-        return ["placeholder.txt"]
-    try:
-        files = [f for f in os.listdir(stage_dir) if f.endswith('.txt')]
-        return files if files else ["No .txt files found"]
-    except Exception as e:
-        print(f"[CharacterLookdev-v13.0] Error scanning prompt directory {stage_dir}: {e}")
-        return ["Error loading prompts"]
-
-def read_prompt_file(stage_folder, filename):
-    filepath = os.path.join(PROMPTS_ROOT_DIR, stage_folder, filename)
-    if not os.path.exists(filepath):
-        raise FileNotFoundError(f"Prompt file not found: {filepath}")
-    with open(filepath, 'r', encoding='utf-8') as f:
-        return f.read()
-# --- END HELPER FUNCTIONS ---
+from .shared_utils import report_token_usage, extract_tagged_content, get_wildcard_list, llm_request_scope, ProcessLog, PROMPTS
+from .llm_metrics import metrics_node, metrics_scope
+from .akki_logging import get_logger
+
+log = get_logger(__name__)
+
+# Prompt templates live in _prompts/LookdevCHR/stage1-3 (see PromptRegistry).
+PROMPT_FOLDER = "LookdevCHR"
 
 
 class AICharacterLookdevBible_Akki:
@@ -44,18 +21,15 @@ class AICharacterLookdevBible_Akki:
     tests a 3-stage LLM pipeline where Stage 1 is a "Creative Artist",
     Stage 2 is a "Ruthless Editor", and Stage 3 is a "Technical Assembler".
     This is the final test of a purely LLM-based filtering and assembly pipeline.
+    v13.1 writes each stage's output to a process log file in the project
+    folder and returns its path and a summary as `full_llm_process_log`.
     """
 
     @classmethod
     def INPUT_TYPES(cls):
         def create_combo_with_default(wildcard_file):
-            try:
-                wildcard_path = os.path.join(NODE_DIR, "wildcards", wildcard_file)
-                if os.path.exists(wildcard_path):
-                    with open(wildcard_path, 'r', encoding='utf-8') as f:
-                        return ["Default (From Bible)"] + [line.strip() for line in f if line.strip()]
-                else: return ["Default (From Bible)"]
-            except Exception: return ["Default (From Bible)"]
+            options = get_wildcard_list(os.path.join("wildcards", wildcard_file))
+            return ["Default (From Bible)"] + ([] if "Could not load" in options[0] else options)
 
         return {
             "required": {
@@ -65,9 +39,9 @@ class AICharacterLookdevBible_Akki:
                 "story_or_script": ("STRING", {"forceInput": True}),
                 "shot_list_csv": ("STRING", {"forceInput": True}),
                 "selected_character_name": ("STRING", {"forceInput": True}),
-                "prompt_stage_1_artist": (get_prompt_files_from_stage_dir("stage1"),),
-                "prompt_stage_2_editor": (get_prompt_files_from_stage_dir("stage2"),),
-                "prompt_stage_3_assembler": (get_prompt_files_from_stage_dir("stage3"),),
+                "prompt_stage_1_artist": (PROMPTS.list(f"{PROMPT_FOLDER}/stage1", "CharacterLookdev-v13.1"),),
+                "prompt_stage_2_editor": (PROMPTS.list(f"{PROMPT_FOLDER}/stage2", "CharacterLookdev-v13.1"),),
+                "prompt_stage_3_assembler": (PROMPTS.list(f"{PROMPT_FOLDER}/stage3", "CharacterLookdev-v13.1"),),
                 "debug_mode": (["Off", "Stage 1 (Artist) Only", "Stages 1+2 (Artist+Editor)"],),
                 "temperature": ("FLOAT", {"default": 0.70, "step": 0.01}),
                 "top_p": ("FLOAT", {"default": 0.95, "step": 0.01}),
@@ -81,6 +55,7 @@ class AICharacterLookdevBible_Akki:
                 "body_type": (create_combo_with_default("human_body_types.txt"),),
                 "hair_color": (create_combo_with_default("human_hair_colors.txt"),),
                 "hair_style": (create_combo_with_default("human_hair_styles.txt"),),
+                "project_path": ("STRING", {"forceInput": True}),
             }
         }
 
@@ -148,63 +123,68 @@ class AICharacterLookdevBible_Akki:
         paragraphs[1] = f"{age_tag}, {physical_desc}"
         return "\n\n".join(paragraphs)
 
+    @metrics_node("CharacterLookdevBible")
     def generate_lookdev(self, llm_model, world_bible, character_bible, story_or_script, shot_list_csv, selected_character_name,
                          prompt_stage_1_artist, prompt_stage_2_editor, prompt_stage_3_assembler,
                          debug_mode, **kwargs):
-        full_llm_process_log = ""
+        process_log = None
         try:
             if not hasattr(llm_model, 'create_completion'): raise ValueError("LLM Model invalid.")
             if not selected_character_name or "ERROR:" in selected_character_name or "N/A" in selected_character_name:
                  return (f"Invalid character: {selected_character_name}", selected_character_name, "")
+            # Loaded and checked before the first LLM call.
+            stage1_template = PROMPTS.get(f"{PROMPT_FOLDER}/stage1", prompt_stage_1_artist, fields=("character_name", "base_description", "discovered_context"))
+            stage2_template = PROMPTS.get(f"{PROMPT_FOLDER}/stage2", prompt_stage_2_editor, fields=("llm_concept_document",))
+            stage3_template = PROMPTS.get(f"{PROMPT_FOLDER}/stage3", prompt_stage_3_assembler, fields=("augmented_description",))
+            process_log = ProcessLog("CharacterLookdev", kwargs.get('project_path'), label=selected_character_name)
             
             # --- STAGE 0: PYTHON PRE-PROCESSING ---
-            print(f"[CharacterLookdev-v13.0] Stage 0: Parsing & Discovering Context...")
+            log.info("[CharacterLookdev-v13.1] Stage 0: Parsing & Discovering Context...")
             base_description, canonical_age = self._extract_character_data_from_bible(character_bible, selected_character_name)
             discovered_context = self._discover_context(selected_character_name, story_or_script, shot_list_csv)
             
             # --- STAGE 1: THE ARTIST (LLM) ---
-            print(f"[CharacterLookdev-v13.0] Stage 1 (Artist): Generating creative concept...")
-            stage1_template = read_prompt_file("stage1", prompt_stage_1_artist)
+            log.info("[CharacterLookdev-v13.1] Stage 1 (Artist): Generating creative concept...")
             stage1_prompt = stage1_template.format(
                 character_name=selected_character_name, 
                 base_description=base_description, 
                 discovered_context=discovered_context
             )
-            stage1_output = llm_model.create_completion(prompt=stage1_prompt, max_tokens=2048, temperature=0.7)
+            with metrics_scope(stage="Artist", item=selected_character_name): stage1_output = llm_model.create_completion(prompt=stage1_prompt, max_tokens=2048, temperature=0.7)
             creative_concept_doc = stage1_output['choices'][0]['text'].strip()
-            full_llm_process_log += f"--- STAGE 1: ARTIST (Creative Concept) ---\n{creative_concept_doc}\n\n"
-            if debug_mode == "Stage 1 (Artist) Only": return (creative_concept_doc, selected_character_name, full_llm_process_log)
+            process_log.write("STAGE 1: ARTIST (Creative Concept)", creative_concept_doc)
+            if debug_mode == "Stage 1 (Artist) Only": return (creative_concept_doc, selected_character_name, process_log.summary())
 
             # --- STAGE 2: THE EDITOR (LLM) ---
-            print(f"[CharacterLookdev-v13.0] Stage 2 (Editor): Filtering to character-only prose...")
-            stage2_template = read_prompt_file("stage2", prompt_stage_2_editor)
+            log.info("[CharacterLookdev-v13.1] Stage 2 (Editor): Filtering to character-only prose...")
             stage2_prompt = stage2_template.format(llm_concept_document=creative_concept_doc)
-            stage2_output = llm_model.create_completion(prompt=stage2_prompt, max_tokens=2048, temperature=0.4)
+            with metrics_scope(stage="Editor", item=selected_character_name): stage2_output = llm_model.create_completion(prompt=stage2_prompt, max_tokens=2048, temperature=0.4)
             edited_prose = stage2_output['choices'][0]['text'].strip()
-            full_llm_process_log += f"--- STAGE 2: EDITOR (Filtered Prose) ---\n{edited_prose}\n\n"
-            if debug_mode == "Stages 1+2 (Artist+Editor)": return (edited_prose, selected_character_name, full_llm_process_log)
+            process_log.write("STAGE 2: EDITOR (Filtered Prose)", edited_prose)
+            if debug_mode == "Stages 1+2 (Artist+Editor)": return (edited_prose, selected_character_name, process_log.summary())
 
             # --- STAGE 3: THE ASSEMBLER (LLM) ---
-            print(f"[CharacterLookdev-v13.0] Stage 3 (Assembler): Formatting final prompt...")
-            stage3_template = read_prompt_file("stage3", prompt_stage_3_assembler)
+            log.info("[CharacterLookdev-v13.1] Stage 3 (Assembler): Formatting final prompt...")
             stage3_prompt = stage3_template.format(augmented_description=edited_prose) # Re-using `augmented_description` key
-            stage3_output = llm_model.create_completion(prompt=stage3_prompt, max_tokens=2048, temperature=0.2)
+            with metrics_scope(stage="Assembler", item=selected_character_name), llm_request_scope(tier="mechanical"): stage3_output = llm_model.create_completion(prompt=stage3_prompt, max_tokens=2048, temperature=0.2)
             raw_creative_prompt = stage3_output['choices'][0]['text'].strip()
-            full_llm_process_log += f"--- STAGE 3: ASSEMBLER (Raw Prompt) ---\n{raw_creative_prompt}\n\n"
+            process_log.write("STAGE 3: ASSEMBLER (Raw Prompt)", raw_creative_prompt)
 
             # --- STAGE 4: FINAL POLISH (Python) ---
-            print(f"[CharacterLookdev-v13.0] Stage 4 (Python): Enforcing canonical age...")
+            log.info("[CharacterLookdev-v13.1] Stage 4 (Python): Enforcing canonical age...")
             final_character_prompt = self._enforce_canonical_age(raw_creative_prompt, canonical_age)
-            full_llm_process_log += f"--- STAGE 4: FINAL POLISH ---\n{final_character_prompt}\n\n"
+            process_log.write("STAGE 4: FINAL POLISH", final_character_prompt)
 
         except Exception as e:
-            final_character_prompt = f"ERROR: An exception occurred in v13.0. Check console.\n\nDetails: {e}"
-            print(f"[CharacterLookdev-v13.0] Error:"); traceback.print_exc()
+            final_character_prompt = f"ERROR: An exception occurred in v13.1. Check console.\n\nDetails: {e}"
+            log.exception("[CharacterLookdev-v13.1] Error:")
+        finally:
+            if process_log: process_log.close()
 
-        return (final_character_prompt, selected_character_name, full_llm_process_log)
+        return (final_character_prompt, selected_character_name, process_log.summary() if process_log else "")
 
 
 NODE_CLASS_MAPPINGS = {"AICharacterLookdevBible-Akki": AICharacterLookdevBible_Akki}
-NODE_DISPLAY_NAME_MAPPINGS = {"AICharacterLookdevBible-Akki": "AI Character Lookdev (Bible) v13.0 - Akki"}
+NODE_DISPLAY_NAME_MAPPINGS = {"AICharacterLookdevBible-Akki": "AI Character Lookdev (Bible) v13.1 - Akki"}
 
 # --- END OF FILE Akki_Character_Lookdev_Bible.py ---
\ No newline at end of file
@@ -6,6 +6,9 @@ import folder_paths
 from datetime import datetime
 from server import PromptServer
 import aiohttp.web
+from .akki_logging import get_logger
+
+log = get_logger(__name__)
 
 # --- NODE 1: Save Text File ---
 class SaveTextFile_Akki:
@@ -40,7 +43,7 @@ class SaveTextFile_Akki:
             existing_numbers = [int(match.group(1)) for f in os.listdir(full_output_dir) if (match := pattern.match(f))]
             next_number = max(existing_numbers) + 1 if existing_numbers else 1
         except Exception as e:
-            print(f"[Save Text - Akki] Warning: Could not parse existing files. Using fallback. Error: {e}")
+            log.warning("[Save Text - Akki] Warning: Could not parse existing files. Using fallback. Error: %s", e)
             next_number = int(datetime.now().timestamp())
 
         date_str = datetime.now().strftime("%Y-%m-%d")
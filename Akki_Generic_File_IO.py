@@ -2,9 +2,11 @@
 
 import os
 import re
-import traceback
 from datetime import datetime
 import folder_paths
+from .akki_logging import get_logger
+
+log = get_logger(__name__)
 
 class GenericFileSaver_Akki:
     """
@@ -60,12 +62,12 @@ class GenericFileSaver_Akki:
             with open(final_file_path, "w", encoding="utf-8") as f:
                 f.write(text)
             
-            print(f"[Generic File Saver] Successfully saved file to: {final_file_path}")
+            log.info("[Generic File Saver] Successfully saved file to: %s", final_file_path)
             
             return (final_file_path, text)
 
         except Exception as e:
-            traceback.print_exc()
+            log.exception("[Generic File Saver] Error:")
             return (f"ERROR: Could not save file. Check console. Details: {e}", text)
 
 
@@ -115,7 +117,7 @@ class GenericFileLoader_Akki:
             latest_file = sorted(matching_files, reverse=True)[0]
             file_path = os.path.join(full_search_dir, latest_file)
 
-            print(f"[Generic File Loader] Found latest file for Shot '{shot_name}': {latest_file}")
+            log.info("[Generic File Loader] Found latest file for Shot '%s': %s", shot_name, latest_file)
 
             with open(file_path, 'r', encoding='utf-8') as f:
                 content = f.read()
@@ -123,7 +125,7 @@ class GenericFileLoader_Akki:
             return (content,)
 
         except Exception as e:
-            traceback.print_exc()
+            log.exception("[Generic File Loader] Error:")
             return (f"ERROR: Could not load file. Check console. Details: {e}",)
 
 
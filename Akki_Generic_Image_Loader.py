@@ -2,11 +2,16 @@
 
 import os
 import re
-import traceback
 import folder_paths
-import torch
-import numpy as np
-from PIL import Image
+from .akki_imports import lazy_import
+from .akki_logging import get_logger
+
+log = get_logger(__name__)
+
+# Imported when the node first loads an image.
+torch = lazy_import("torch")
+np = lazy_import("numpy")
+Image = lazy_import("PIL.Image")
 
 class GenericImageLoader_Akki:
     """
@@ -32,7 +37,7 @@ class GenericImageLoader_Akki:
     def _load_image(self, filepath):
         """Loads an image file into a torch tensor."""
         if not filepath or not os.path.exists(filepath):
-            print(f"[Generic Image Loader] Warning: Image file not found at path: {filepath}")
+            log.warning("[Generic Image Loader] Warning: Image file not found at path: %s", filepath)
             # Return a blank tensor if the image doesn't exist
             return torch.zeros(1, 64, 64, 3, dtype=torch.float32)
         
@@ -73,15 +78,14 @@ class GenericImageLoader_Akki:
             latest_file = sorted(matching_files, reverse=True)[0]
             file_path = os.path.join(data_dir, latest_file)
             
-            print(f"[Generic Image Loader] Found latest file for Shot '{shot_name}': {latest_file}")
+            log.info("[Generic Image Loader] Found latest file for Shot '%s': %s", shot_name, latest_file)
             
             image = self._load_image(file_path)
 
             return (image,)
 
         except Exception as e:
-            traceback.print_exc()
-            print(f"ERROR: {e}")
+            log.exception("[Generic Image Loader] Error:")
             # Return a blank image on any error to prevent workflow from crashing
             return (torch.zeros(1, 64, 64, 3, dtype=torch.float32),)
 
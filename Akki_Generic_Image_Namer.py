@@ -4,6 +4,9 @@ import os
 import re
 from datetime import datetime
 import folder_paths
+from .akki_logging import get_logger
+
+log = get_logger(__name__)
 
 class GenericImageNamer_Akki:
     """
@@ -52,12 +55,12 @@ class GenericImageNamer_Akki:
             # Example: AKKILLM\Project01\Shots\FinalRender_1A_2025-07-24
             final_output_prefix = os.path.join(full_directory_path, file_prefix_part)
             
-            print(f"[Generic Image Namer] Generated Prefix: {final_output_prefix}")
+            log.info("[Generic Image Namer] Generated Prefix: %s", final_output_prefix)
 
             return (final_output_prefix,)
 
         except Exception as e:
-            print(f"ERROR in Generic Image Namer: {e}")
+            log.error("[Generic Image Namer] Error: %s", e)
             return ("ERROR_CHECK_CONSOLE",)
 
 
@@ -2,8 +2,10 @@
 
 import os
 import re
-import traceback
 import folder_paths
+from .akki_logging import get_logger
+
+log = get_logger(__name__)
 
 class KeywordLoader_Akki:
     """
@@ -53,7 +55,7 @@ class KeywordLoader_Akki:
             latest_file = sorted(matching_files, reverse=True)[0]
             file_path = os.path.join(data_dir, latest_file)
             
-            print(f"[Keyword Loader] Found latest file for Shot '{shot_name}': {latest_file}")
+            log.info("[Keyword Loader] Found latest file for Shot '%s': %s", shot_name, latest_file)
             
             with open(file_path, 'r', encoding='utf-8') as f:
                 keyword_bag = f.read()
@@ -61,7 +63,7 @@ class KeywordLoader_Akki:
             return (keyword_bag,)
 
         except Exception as e:
-            traceback.print_exc()
+            log.exception("[Keyword Loader] Error:")
             return (f"ERROR: Failed to load Keyword Bag file. Check console. Details: {e}",)
 
 NODE_CLASS_MAPPINGS = {"KeywordLoader-Akki": KeywordLoader_Akki}
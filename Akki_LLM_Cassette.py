@@ -0,0 +1,49 @@
+# Node: LLM Cassette v1.0
+
+import os
+import re
+import folder_paths
+from .shared_utils import CassetteProxy, LLMCassette
+from .akki_logging import get_logger
+
+log = get_logger(__name__)
+
+class LLMCassette_Akki:
+    """
+    Records every call made through an LLM_MODEL to a cassette file in the
+    project folder, and replays them on later runs without a model. With a
+    replayed cassette the deterministic stages (Shot List Parser, Asset and
+    Shot Selectors, P3 post-processing, pronoun resolution) run at full
+    speed on real model output, which is how they are profiled and timed in
+    isolation. Leave `llm_model` unconnected in "replay" mode.
+    """
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "project_path": ("STRING", {"forceInput": True}),
+                "cassette_name": ("STRING", {"default": "llm_cassette"}),
+                "mode": (list(CassetteProxy.MODES),),
+                "replay_timing": (list(CassetteProxy.REPLAY_TIMINGS),),
+            },
+            "optional": {
+                "llm_model": ("LLM_MODEL",),
+            }
+        }
+
+    RETURN_TYPES = ("LLM_MODEL", "STRING")
+    RETURN_NAMES = ("llm_model", "cassette_path")
+    FUNCTION = "wrap_model"
+    CATEGORY = "AkkiNodes/LLM"
+
+    def wrap_model(self, project_path, cassette_name, mode, replay_timing, llm_model=None):
+        clean_name = re.sub(r'[<>:"/\\|?*]', '_', cassette_name).strip() or "llm_cassette"
+        cassette_path = os.path.normpath(os.path.join(folder_paths.get_output_directory(), project_path, "DATA", f"{clean_name}.cassette.jsonl"))
+        cassette = LLMCassette.open(cassette_path)
+        proxy_model = CassetteProxy(cassette, llm_model=llm_model, mode=mode, replay_timing=replay_timing)
+        log.info("[LLMCassette-Akki] Mode '%s', replay timing '%s': %s", mode, replay_timing, cassette.format_stats())
+        return (proxy_model, cassette_path)
+
+# --- Mappings for this file ---
+NODE_CLASS_MAPPINGS = {"LLMCassette-Akki": LLMCassette_Akki}
+NODE_DISPLAY_NAME_MAPPINGS = {"LLMCassette-Akki": "LLM Cassette (Record/Replay) v1.0 - Akki"}
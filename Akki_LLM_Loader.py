@@ -1,16 +1,431 @@
-# Node: LLM Loader v2.2
+# Node: LLM Loader v2.9
 
-import torch
+import os
+import threading
+import weakref
+import contextlib
+import time
+import random
 import folder_paths
-from llama_cpp import Llama
-import traceback
+from .shared_utils import LlamaModelCache, LlamaTuningProfiles
+from .gguf_index import GGUFIndex
+from .akki_imports import lazy_import
+from .akki_logging import get_logger
+
+log = get_logger(__name__)
+
+# Imported when the first model is loaded, not when ComfyUI starts.
+np = lazy_import("numpy")
+torch = lazy_import("torch")
+llama_cpp = lazy_import("llama_cpp")
+llama_cache = lazy_import("llama_cpp.llama_cache")
+llama_internals = lazy_import("llama_cpp._internals")
+llama_speculative = lazy_import("llama_cpp.llama_speculative")
+
+PREFIX_CACHE_DIR = os.path.join(os.path.dirname(__file__), "_cache", "prefix_state")
+
+# Llama only calls its draft model, so these are plain callables rather than
+# LlamaDraftModel subclasses, which would import llama_cpp at load time.
+class GGUFDraftModel:
+    """
+    Greedy drafts from a small GGUF that shares the main model's tokenizer.
+    The draft context is rolled back to the longest common prefix on every
+    call, so only new tokens are evaluated.
+    """
+    def __init__(self, llm, num_pred_tokens=10):
+        self.llm = llm
+        self.num_pred_tokens = num_pred_tokens
+        self._lock = threading.Lock()
+
+    def __call__(self, input_ids, /, **kwargs):
+        with self._lock:
+            llm, input_ids = self.llm, input_ids.tolist()
+            prefix = 0
+            for a, b in zip(llm._input_ids.tolist(), input_ids):
+                if a != b: break
+                prefix += 1
+            # Re-evaluate at least the last token so its logits are fresh.
+            llm.n_tokens = min(prefix, len(input_ids) - 1)
+            llm.eval(input_ids[llm.n_tokens:])
+            drafted, eos = [], llm.token_eos()
+            while len(drafted) < self.num_pred_tokens and len(input_ids) + len(drafted) < llm.n_ctx():
+                token = int(np.argmax(llm._scores[-1, :]))
+                if token == eos: break
+                drafted.append(token)
+                llm.eval([token])
+            return np.array(drafted, dtype=np.intc)
+
+class MeteredDraftModel:
+    """Counts drafted tokens so LlamaCppProxy can report the acceptance rate."""
+    def __init__(self, inner):
+        self.inner = inner
+        self.calls = 0
+        self.proposed = 0
+
+    def __call__(self, input_ids, /, **kwargs):
+        draft = self.inner(input_ids, **kwargs)
+        self.calls += 1
+        self.proposed += len(draft)
+        return draft
+
+def derive_context(base, n_ctx, n_batch, draft_model=None, n_threads=None, n_threads_batch=None):
+    """
+    Build a new Llama on the weights of an already loaded one, with its own
+    context sized for `n_ctx`/`n_batch`. The copy keeps a reference to the
+    weight owner, and closing it only frees its own context and batch.
+    Thread counts default to the owner's.
+    """
+    owner = getattr(base, "_base_llm", None) or base
+    # Not copy.copy: Llama's pickle hooks would re-run __init__ and reload.
+    llm = object.__new__(type(owner))
+    llm.__dict__.update(owner.__dict__)
+    params = type(owner.context_params).from_buffer_copy(owner.context_params)
+    n_batch = min(n_ctx, n_batch)
+    params.n_ctx, params.n_batch, params.n_ubatch = n_ctx, n_batch, min(n_batch, params.n_ubatch)
+    if n_threads: params.n_threads = llm.n_threads = n_threads
+    if n_threads_batch: params.n_threads_batch = llm.n_threads_batch = n_threads_batch
+    llm.context_params, llm.n_batch = params, n_batch
+    if "n_ubatch" in llm.__dict__: llm.n_ubatch = params.n_ubatch
+    llm._stack = contextlib.ExitStack()
+    llm._ctx = llm._stack.enter_context(contextlib.closing(llama_internals.LlamaContext(model=owner._model, params=params, verbose=owner.verbose)))
+    llm._batch = llm._stack.enter_context(contextlib.closing(llama_internals.LlamaBatch(n_tokens=n_batch, embd=0, n_seq_max=n_ctx, verbose=owner.verbose)))
+    n_vocab = owner.n_vocab()
+    if "_n_ctx" in llm.__dict__: llm._n_ctx = n_ctx
+    if "_candidates" in llm.__dict__: llm._candidates = llama_internals.LlamaTokenDataArray(n_vocab=n_vocab)
+    # Verifying drafts needs the logits of every position.
+    logits_all = draft_model is not None
+    llm.draft_model = draft_model
+    if "_logits_all" in llm.__dict__: llm._logits_all = logits_all
+    if hasattr(params, "logits_all"): params.logits_all = logits_all
+    llm.input_ids = np.ndarray((n_ctx,), dtype=np.intc)
+    llm.scores = np.ndarray((n_ctx if logits_all else n_batch, n_vocab), dtype=np.single)
+    llm.n_tokens = 0
+    llm.cache = None
+    llm._base_llm = owner
+    return llm
+
+def _llama_api(*names):
+    """The first of `names` this llama-cpp-python build exports (the C API was renamed across releases)."""
+    for name in names:
+        fn = getattr(llama_cpp, name, None)
+        if fn is not None: return fn
+    raise AttributeError(f"llama-cpp-python exports none of {', '.join(names)}.")
+
+class _Sequence:
+    __slots__ = ("index", "spec", "prompt_tokens", "seq_id", "feed", "n_past", "sampler", "pieces", "text", "completion_tokens",
+                 "finish_reason", "started", "ttft_s", "max_tokens")
+
+    def __init__(self, index, spec, prompt_tokens):
+        self.index, self.spec, self.prompt_tokens = index, spec, prompt_tokens
+        self.seq_id, self.feed, self.n_past, self.sampler = None, list(prompt_tokens), 0, None
+        self.pieces, self.text, self.completion_tokens, self.finish_reason = bytearray(), "", 0, None
+        self.started, self.ttft_s = None, None
+        # Like llama.cpp, max_tokens <= 0 means "until the context is full".
+        self.max_tokens = spec.get("max_tokens") or 16
+        if self.max_tokens <= 0: self.max_tokens = float("inf")
+
+class LlamaBatchDecoder:
+    """
+    Decodes several independent prompts at once, as parallel sequences in one
+    shared KV cache. It keeps its own llama.cpp context on the model's
+    resident weights, with `n_seq` sequence slots of `seq_ctx` tokens each,
+    and batches continuously: every llama_decode call carries the next token
+    of each running sequence plus the prompt of any newly admitted one, and
+    a finished sequence frees its slot for the next prompt. Sampling (grammar,
+    top-k, top-p, min-p, temperature, seed) runs through llama.cpp's sampler
+    chain per sequence. LlamaCppProxy.create_completions hands it the
+    eligible items of a batch; see `accepts`.
+    """
+    SUPPORTED_PARAMS = {"prompt", "max_tokens", "temperature", "top_p", "top_k", "min_p", "stop", "seed", "grammar",
+                        "end_tags", "use_cache", "metrics_item", "timeout", "deadline"}
+
+    def __init__(self, n_seq=4, seq_ctx=4096):
+        self.n_seq = max(2, int(n_seq))
+        self.seq_ctx = int(seq_ctx)
+        self._llm = None
+        self._ctx = None
+        self._batch = None
+        self._stack = None
+
+    def accepts(self, item):
+        return set(item) <= self.SUPPORTED_PARAMS and not item.get("stream")
+
+    def close(self):
+        if self._stack is not None: self._stack.close()
+        self._llm = self._ctx = self._batch = self._stack = None
+
+    def _ensure_context(self, llm):
+        if self._llm is llm and self._ctx is not None: return
+        self.close()
+        n_ctx = self.n_seq * self.seq_ctx
+        params = type(llm.context_params).from_buffer_copy(llm.context_params)
+        n_batch = min(n_ctx, llm.n_batch)
+        params.n_ctx, params.n_batch, params.n_ubatch, params.n_seq_max = n_ctx, n_batch, min(n_batch, params.n_ubatch), self.n_seq
+        if hasattr(params, "logits_all"): params.logits_all = False
+        self._stack = contextlib.ExitStack()
+        owner = getattr(llm, "_base_llm", None) or llm
+        self._ctx = self._stack.enter_context(contextlib.closing(llama_internals.LlamaContext(model=owner._model, params=params, verbose=False)))
+        self._batch = self._stack.enter_context(contextlib.closing(llama_internals.LlamaBatch(n_tokens=n_batch, embd=0, n_seq_max=1, verbose=False)))
+        self._llm, self.n_batch = llm, n_batch
+        log.info("[LlamaBatchDecoder] Batch context ready: %s sequences x %s tokens (n_batch %s).", self.n_seq, self.seq_ctx, n_batch)
+
+    def _vocab(self, llm):
+        model = (getattr(llm, "_base_llm", None) or llm)._model.model
+        get_vocab = getattr(llama_cpp, "llama_model_get_vocab", None)
+        return get_vocab(model) if get_vocab else model
+
+    def _make_sampler(self, spec, vocab):
+        chain = llama_cpp.llama_sampler_chain_init(llama_cpp.llama_sampler_chain_default_params())
+        add = lambda sampler: llama_cpp.llama_sampler_chain_add(chain, sampler)
+        grammar = spec.get("grammar")
+        gbnf = getattr(grammar, "gbnf", None) or getattr(grammar, "_grammar", None)
+        if grammar is not None and not isinstance(gbnf, str): raise ValueError("Batched decoding needs the grammar as GBNF text.")
+        if gbnf: add(llama_cpp.llama_sampler_init_grammar(vocab, gbnf.encode("utf-8"), b"root"))
+        temperature = spec.get("temperature", 0.8)
+        if temperature is None or temperature <= 0:
+            add(llama_cpp.llama_sampler_init_greedy())
+            return chain
+        add(llama_cpp.llama_sampler_init_top_k(int(spec.get("top_k", 40))))
+        add(llama_cpp.llama_sampler_init_top_p(float(spec.get("top_p", 0.95)), 1))
+        add(llama_cpp.llama_sampler_init_min_p(float(spec.get("min_p", 0.05)), 1))
+        add(llama_cpp.llama_sampler_init_temp(float(temperature)))
+        seed = spec.get("seed")
+        add(llama_cpp.llama_sampler_init_dist(seed if isinstance(seed, int) and seed >= 0 else random.getrandbits(32)))
+        return chain
+
+    def _finish_text(self, seq, final=False):
+        # Mid-stream a character may still be split across tokens.
+        text = seq.pieces.decode("utf-8", errors="replace" if final else "ignore")
+        # create_completion also takes a single string as `stop`.
+        stop, end_tags = seq.spec.get("stop"), seq.spec.get("end_tags")
+        stops = [stop] if isinstance(stop, str) else (stop or [])
+        end_tags = [end_tags] if isinstance(end_tags, str) else (end_tags or [])
+        cuts = [(text.find(stop), "stop") for stop in stops if stop and stop in text]
+        cuts += [(text.find(tag) + len(tag), "end_tag") for tag in end_tags if tag and tag in text]
+        if cuts:
+            cut_at, reason = min(cuts)
+            seq.text, seq.finish_reason = text[:cut_at], reason
+            return True
+        seq.text = text
+        return False
+
+    def run(self, llm, items, on_result, max_sequences=None):
+        """
+        Decodes `items` (index, create_completion kwargs) and calls
+        `on_result(index, output, ttft_s, started)` as each one finishes. Returns the
+        wall time spent and the number of tokens generated.
+        """
+        self._ensure_context(llm)
+        ctx, batch, vocab = self._ctx.ctx, self._batch.batch, self._vocab(llm)
+        if hasattr(llama_cpp, "llama_memory_seq_rm"): seq_rm, memory = llama_cpp.llama_memory_seq_rm, llama_cpp.llama_get_memory(ctx)
+        else: seq_rm, memory = _llama_api("llama_kv_self_seq_rm", "llama_kv_cache_seq_rm"), ctx
+        is_eog = _llama_api("llama_vocab_is_eog", "llama_token_is_eog")
+        n_slots = max(1, min(self.n_seq, int(max_sequences or self.n_seq)))
+        for seq_id in range(self.n_seq): seq_rm(memory, seq_id, -1, -1)
+        pending = [_Sequence(index, spec, llm.tokenize(spec["prompt"].encode("utf-8"), add_bos=True, special=True)) for index, spec in items]
+        pending.reverse()
+        free, active, generated, started = list(range(n_slots - 1, -1, -1)), {}, 0, time.monotonic()
+
+        def finish(seq):
+            seq_rm(memory, seq.seq_id, -1, -1)
+            llama_cpp.llama_sampler_free(seq.sampler)
+            free.append(seq.seq_id)
+            del active[seq.seq_id]
+            if seq.finish_reason in (None, "eog"): self._finish_text(seq, final=True)
+            reason = "stop" if seq.finish_reason in ("eog", "stop") else seq.finish_reason
+            n_prompt = len(seq.prompt_tokens)
+            output = {"id": f"cmpl-batch-{seq.index}", "object": "text_completion", "created": int(time.time()),
+                      "choices": [{"text": seq.text, "index": 0, "logprobs": None, "finish_reason": reason}],
+                      "usage": {"prompt_tokens": n_prompt, "completion_tokens": seq.completion_tokens, "total_tokens": n_prompt + seq.completion_tokens}}
+            on_result(seq.index, output, seq.ttft_s, seq.started)
+
+        try:
+            while pending or active:
+                while pending and free:
+                    seq = pending.pop()
+                    if len(seq.prompt_tokens) + 1 > self.seq_ctx:
+                        raise ValueError(f"A {len(seq.prompt_tokens)}-token prompt does not fit a {self.seq_ctx}-token batch sequence.")
+                    seq.seq_id, seq.sampler, seq.started = free.pop(), self._make_sampler(seq.spec, vocab), time.monotonic()
+                    active[seq.seq_id] = seq
+                # Decoding sequences go first, so one long new prompt does not hold their next token back.
+                work = [(seq, token, seq.n_past + i, i == len(seq.feed) - 1)
+                        for seq in sorted(active.values(), key=lambda s: len(s.feed)) for i, token in enumerate(seq.feed)]
+                for seq in active.values(): seq.n_past += len(seq.feed)
+                for chunk_start in range(0, len(work), self.n_batch):
+                    chunk = work[chunk_start:chunk_start + self.n_batch]
+                    batch.n_tokens = len(chunk)
+                    for j, (seq, token, pos, wants_logits) in enumerate(chunk):
+                        batch.token[j], batch.pos[j], batch.n_seq_id[j], batch.logits[j] = token, pos, 1, wants_logits
+                        batch.seq_id[j][0] = seq.seq_id
+                    status = llama_cpp.llama_decode(ctx, batch)
+                    if status != 0: raise RuntimeError(f"llama_decode failed with status {status}.")
+                    for j, (seq, _, _, wants_logits) in enumerate(chunk):
+                        if not wants_logits: continue
+                        token = llama_cpp.llama_sampler_sample(seq.sampler, ctx, j)
+                        if seq.ttft_s is None: seq.ttft_s = time.monotonic() - seq.started
+                        if is_eog(vocab, token):
+                            seq.finish_reason = "eog"
+                            finish(seq)
+                            continue
+                        seq.pieces += llm.detokenize([token])
+                        seq.completion_tokens += 1
+                        generated += 1
+                        if self._finish_text(seq): finish(seq)
+                        elif seq.completion_tokens >= seq.max_tokens or seq.n_past + 1 >= self.seq_ctx:
+                            seq.finish_reason = "length"
+                            finish(seq)
+                        else: seq.feed = [token]
+        finally:
+            for seq in list(active.values()):
+                seq_rm(memory, seq.seq_id, -1, -1)
+                llama_cpp.llama_sampler_free(seq.sampler)
+        return time.monotonic() - started, generated
+
+class LlamaHardwareTuner:
+    """
+    Short CPU-only micro-benchmarks of the load settings llama.cpp leaves to
+    the user. Prompt evaluation is timed over n_batch x n_threads_batch and
+    generation over n_threads, on contexts built on one resident copy of the
+    weights; then each mmap/mlock mode is loaded once and timed with the
+    winning numbers. The best setting is the one with the lowest estimated
+    time for a typical call of `workload_prompt` prompt tokens and
+    `workload_generate` generated ones; a memory mode other than plain mmap
+    has to win by `min_gain` to be chosen, since it costs RAM.
+    """
+    MEMORY_MODES = ({"use_mmap": True, "use_mlock": False}, {"use_mmap": True, "use_mlock": True}, {"use_mmap": False, "use_mlock": False})
+    N_BATCH_GRID = (128, 256, 512, 1024)
+
+    def __init__(self, prompt_tokens=512, generate_tokens=32, workload_prompt=2048, workload_generate=512, min_gain=0.03):
+        self.prompt_tokens = prompt_tokens
+        self.generate_tokens = generate_tokens
+        self.workload_prompt = workload_prompt
+        self.workload_generate = workload_generate
+        self.min_gain = min_gain
+        self.n_ctx = max(max(self.N_BATCH_GRID), prompt_tokens) + generate_tokens + 64
+
+    @staticmethod
+    def cpu_count():
+        try: return len(os.sched_getaffinity(0))
+        except AttributeError: return os.cpu_count() or 1
+
+    @classmethod
+    def thread_grid(cls):
+        cpus = cls.cpu_count()
+        return sorted({max(1, cpus * quarter // 4) for quarter in (1, 2, 3, 4)})
+
+    def _estimate_s(self, prompt_tps, generate_tps):
+        return self.workload_prompt / prompt_tps + self.workload_generate / generate_tps
+
+    def _set_threads(self, llm, n_threads, n_threads_batch):
+        _llama_api("llama_set_n_threads")(llm._ctx.ctx, n_threads, n_threads_batch)
+
+    def _prompt_tps(self, llm, tokens):
+        llm.reset()
+        llm.eval(tokens[:8])  # warm-up
+        llm.reset()
+        started = time.perf_counter()
+        llm.eval(tokens)
+        return len(tokens) / (time.perf_counter() - started)
+
+    def _generate_tps(self, llm, tokens):
+        llm.reset()
+        llm.eval(tokens[:16])
+        token = tokens[-1]
+        started = time.perf_counter()
+        for _ in range(self.generate_tokens): llm.eval([token])
+        return self.generate_tokens / (time.perf_counter() - started)
+
+    def _load(self, model_path, memory_mode, n_batch, n_threads, n_threads_batch):
+        started = time.perf_counter()
+        llm = llama_cpp.Llama(model_path=model_path, n_gpu_layers=0, n_ctx=self.n_ctx, n_batch=n_batch, n_threads=n_threads,
+                    n_threads_batch=n_threads_batch, verbose=False, **memory_mode)
+        return llm, time.perf_counter() - started
+
+    def tune(self, model_path):
+        """Returns (settings, results): the best load settings and the measurements behind them."""
+        name, threads = os.path.basename(model_path), self.thread_grid()
+        cpus = self.cpu_count()
+        n_batches = [n for n in self.N_BATCH_GRID if n <= self.n_ctx]
+        base, load_s = self._load(model_path, self.MEMORY_MODES[0], max(n_batches), max(1, cpus // 2), cpus)
+        tokens = base.tokenize(("The quick brown fox jumps over the lazy dog. " * (self.prompt_tokens // 8 + 1)).encode("utf-8"))[:self.prompt_tokens]
+        prompt_grid, generate_grid = [], []
+        try:
+            for n_batch in n_batches:
+                llm = derive_context(base, self.n_ctx, n_batch)
+                try:
+                    for n_threads_batch in threads:
+                        self._set_threads(llm, max(1, cpus // 2), n_threads_batch)
+                        prompt_grid.append({"n_batch": n_batch, "n_threads_batch": n_threads_batch, "tok_s": round(self._prompt_tps(llm, tokens), 1)})
+                        log.debug("[LlamaHardwareTuner] %s: prompt eval n_batch %s, %s threads: %s tok/s", name, n_batch, n_threads_batch, prompt_grid[-1]['tok_s'])
+                finally: llm.close()
+            best_prompt = max(prompt_grid, key=lambda r: r["tok_s"])
+            llm = derive_context(base, self.n_ctx, best_prompt["n_batch"])
+            try:
+                for n_threads in threads:
+                    self._set_threads(llm, n_threads, best_prompt["n_threads_batch"])
+                    generate_grid.append({"n_threads": n_threads, "tok_s": round(self._generate_tps(llm, tokens), 1)})
+                    log.debug("[LlamaHardwareTuner] %s: generation %s threads: %s tok/s", name, n_threads, generate_grid[-1]['tok_s'])
+            finally: llm.close()
+        finally: base.close()
+        best_generate = max(generate_grid, key=lambda r: r["tok_s"])
+        settings = {"n_batch": best_prompt["n_batch"], "n_threads": best_generate["n_threads"], "n_threads_batch": best_prompt["n_threads_batch"]}
+        memory_grid = [{**self.MEMORY_MODES[0], "load_s": round(load_s, 2), "prompt_tok_s": best_prompt["tok_s"], "generate_tok_s": best_generate["tok_s"]}]
+        for memory_mode in self.MEMORY_MODES[1:]:
+            try:
+                llm, load_s = self._load(model_path, memory_mode, settings["n_batch"], settings["n_threads"], settings["n_threads_batch"])
+                try: memory_grid.append({**memory_mode, "load_s": round(load_s, 2), "prompt_tok_s": round(self._prompt_tps(llm, tokens), 1),
+                                         "generate_tok_s": round(self._generate_tps(llm, tokens), 1)})
+                finally: llm.close()
+            except Exception as e: log.warning("[LlamaHardwareTuner] %s: skipping %s (%s).", name, memory_mode, e)
+        for row in memory_grid: row["estimate_s"] = round(self._estimate_s(row["prompt_tok_s"], row["generate_tok_s"]), 2)
+        best_memory = min(memory_grid, key=lambda r: r["estimate_s"])
+        if best_memory["estimate_s"] > memory_grid[0]["estimate_s"] * (1 - self.min_gain): best_memory = memory_grid[0]
+        settings.update({"use_mmap": best_memory["use_mmap"], "use_mlock": best_memory["use_mlock"]})
+        # llama-cpp-python's defaults: n_batch 512, half the cores for generation, all of them for prompts.
+        lookup = lambda rows, **match: next((r["tok_s"] for r in rows if all(r[k] == v for k, v in match.items())), None)
+        default_prompt = lookup(prompt_grid, n_batch=512, n_threads_batch=cpus)
+        default_generate = lookup(generate_grid, n_threads=max(1, cpus // 2))
+        results = {"cpus": cpus, "prompt": prompt_grid, "generate": generate_grid, "memory": memory_grid,
+                   "tuned_estimate_s": best_memory["estimate_s"],
+                   "default_estimate_s": round(self._estimate_s(default_prompt, default_generate), 2) if default_prompt and default_generate else None}
+        gain = f" vs {results['default_estimate_s']}s with the defaults" if results["default_estimate_s"] else ""
+        log.info("[LlamaHardwareTuner] %s: best %s; est. %ss per %s+%s-token call%s.", name, settings, results['tuned_estimate_s'], self.workload_prompt, self.workload_generate, gain)
+        return settings, results
 
 class LLMLoader_Akki:
     """
     Node to load a GGUF format LLM and prepare it for use.
-    v2.2 updates the default context size for modern models.
+    v2.2 updates the default context size for modern models. The model is
+    returned wrapped in a LlamaCppProxy, which adds the batch completion API.
+    v2.3 attaches a llama.cpp prompt-prefix state cache (in RAM or on disk) so
+    calls sharing a long static prompt prefix skip re-evaluating it.
+    v2.4 replaces the unbounded model dict with a RAM/VRAM-budgeted LRU cache,
+    so trying another n_ctx or GPU split evicts old copies instead of OOMing.
+    v2.5 builds a new context on the resident weights when only n_ctx or
+    n_batch change, instead of reading the GGUF from disk again.
+    v2.6 adds optional speculative decoding, drafting with either prompt
+    lookup (n-gram matches in the prompt, ideal for rewrites) or a small GGUF
+    with the same tokenizer. Drafting keeps logits for every position, which
+    costs n_vocab floats of RAM per evaluated token.
+    v2.7 adds batched decoding: with `batch_sequences` above 1, the batch
+    API (per-shot, per-block, per-variation calls) decodes that many prompts
+    at once in a second context of `batch_sequences` x `batch_seq_ctx`
+    tokens on the same weights. Single calls keep using the main context.
+    v2.8 adds hardware profiles: "tune" benchmarks n_batch, thread counts
+    and mmap/mlock for the model on this machine (CPU only, takes a few
+    minutes) and saves the winner; "auto" applies a saved profile, whose
+    n_batch replaces the one set on the node. Profiles are measured on the
+    CPU, so they only apply to CPU-only loads (n_gpu_layers 0).
+    v2.9 reads architecture, quantization and context length from the GGUF
+    header (cached by mtime), so the model list describes every file and
+    the memory budget is sized correctly before a load starts.
     """
-    _loaded_models = {}
+    _model_cache = LlamaModelCache()
+    _tuning_profiles = LlamaTuningProfiles()
+    _gguf_index = GGUFIndex()
+    DESCRIBE_CTX = 32768
+    # Shared by the contexts that use them; a draft is freed with the last of its owners.
+    _draft_llms = weakref.WeakValueDictionary()
     @classmethod
     def INPUT_TYPES(cls):
         models = []
@@ -23,13 +438,27 @@ class LLMLoader_Akki:
         if not models: models = ["No models found"]
             
         return { "required": {
-                "gguf_name": (models,),
+                "gguf_name": (models, {"tooltip": cls._describe_models(models)}),
                 "n_gpu_layers": ("INT", {"default": -1, "min": -1, "max": 1000}),
                 "main_gpu": ("INT", {"default": 0, "min": 0, "max": 10}),
                 # UPDATED: Default context size increased to 32k
                 "n_ctx": ("INT", {"default": 32768, "min": 512, "max": 131072, "step": 1024}),
                 "n_batch": ("INT", {"default": 512, "min": 32, "max": 8192, "step": 32}),
                 "verbose": ("BOOLEAN", {"default": True}),
+            },
+            "optional": {
+                "prefix_cache": (["ram", "disk", "off"], {"default": "ram"}),
+                "prefix_cache_mb": ("INT", {"default": 2048, "min": 64, "max": 65536, "step": 64}),
+                # 0 = auto (75% of system RAM / 90% of the main GPU's memory)
+                "ram_budget_gb": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 4096.0, "step": 0.5}),
+                "vram_budget_gb": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 1024.0, "step": 0.5}),
+                "speculative": (["off", "prompt_lookup", "draft_model"], {"default": "off"}),
+                "draft_gguf_name": (["None"] + [m for m in models if m != "No models found"],),
+                "num_draft_tokens": ("INT", {"default": 10, "min": 1, "max": 64}),
+                # 1 = off; prompts in a batch call are otherwise decoded one at a time.
+                "batch_sequences": ("INT", {"default": 1, "min": 1, "max": 64}),
+                "batch_seq_ctx": ("INT", {"default": 4096, "min": 512, "max": 131072, "step": 512}),
+                "hardware_profile": (["auto", "tune", "off"], {"default": "auto"}),
             }
         }
 
@@ -38,35 +467,163 @@ class LLMLoader_Akki:
     FUNCTION = "load_llm_model"
     CATEGORY = "AkkiNodes/LLM"
 
+    @classmethod
+    def _describe_models(cls, models):
+        paths = {name: cls._resolve_model_path(name) for name in models if name != "No models found"}
+        summaries = iter(cls._gguf_index.get_many([path for path in paths.values() if path]))
+        lines = []
+        for name, path in paths.items():
+            info = next(summaries) if path else None
+            if info is None:
+                lines.append(f"{name}: no readable GGUF header")
+                continue
+            n_ctx = min(info["context_length"] or cls.DESCRIBE_CTX, cls.DESCRIBE_CTX)
+            footprint = cls._model_cache.estimate_footprint(path, n_ctx, 0, info["metadata"])
+            lines.append(f"{name}: {info['architecture']}, {info['quantization']}, ctx {info['context_length'] or 'N/A'}, "
+                         f"{info['file_size'] / 1024**3:.1f} GB, ~{(footprint['weights'] + footprint['kv']) / 1024**3:.1f} GB RAM at {n_ctx // 1024}k ctx")
+        return "\n".join(lines)
+
     @classmethod
     def clear_cache(cls):
-        cls._loaded_models = {}; import gc; gc.collect()
+        cls._model_cache.clear()
+        cls._draft_llms.clear()
         if torch.cuda.is_available(): torch.cuda.empty_cache()
-        print("[LLMLoader-Akki] Model cache cleared.")
+        log.info("[LLMLoader-Akki] Model cache cleared.")
 
-    def load_llm_model(self, gguf_name, n_gpu_layers, main_gpu, n_ctx, n_batch, verbose):
+    @staticmethod
+    def _resolve_budgets(ram_budget_gb, vram_budget_gb, main_gpu):
+        ram_budget = int(ram_budget_gb * 1024**3) if ram_budget_gb > 0 else None
+        if ram_budget is None:
+            try:
+                import psutil
+                ram_budget = int(psutil.virtual_memory().total * 0.75)
+            except Exception:
+                try: ram_budget = int(os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') * 0.75)
+                except (AttributeError, ValueError, OSError): ram_budget = None
+        vram_budget = int(vram_budget_gb * 1024**3) if vram_budget_gb > 0 else None
+        if vram_budget is None and torch.cuda.is_available() and main_gpu < torch.cuda.device_count():
+            vram_budget = int(torch.cuda.get_device_properties(main_gpu).total_memory * 0.9)
+        return ram_budget, vram_budget
+
+    def _configure_prefix_cache(self, llm, model_path, n_ctx, mode, capacity_mb):
+        config = (mode, capacity_mb)
+        if llm.prefix_cache_config == config: return
+        capacity_bytes = capacity_mb * 1024 * 1024
+        if mode == "ram": cache = llama_cache.LlamaRAMCache(capacity_bytes=capacity_bytes)
+        elif mode == "disk":
+            # Cached states are only valid for the model/context they came from.
+            model_stem = os.path.splitext(os.path.basename(model_path))[0]
+            cache = llama_cache.LlamaDiskCache(cache_dir=os.path.join(PREFIX_CACHE_DIR, f"{model_stem}-ctx{n_ctx}"), capacity_bytes=capacity_bytes)
+        else: cache = None
+        llm.set_prefix_cache(cache, config)
+        log.info("[LLMLoader-Akki] Prefix cache: %s%s", mode, f" ({capacity_mb} MB)" if cache is not None else "")
+
+    def _configure_batch_decoder(self, llm, batch_sequences, batch_seq_ctx):
+        decoder = llm.batch_decoder
+        if batch_sequences <= 1:
+            if decoder is not None: log.info("[LLMLoader-Akki] Batched decoding: off")
+            llm.set_batch_decoder(None)
+            return
+        if decoder is not None and (decoder.n_seq, decoder.seq_ctx) == (batch_sequences, batch_seq_ctx): return
+        kv_per_token, _ = LlamaModelCache.kv_bytes_per_token(llm.metadata)
+        llm.set_batch_decoder(LlamaBatchDecoder(batch_sequences, batch_seq_ctx))
+        log.info("[LLMLoader-Akki] Batched decoding: %s sequences x %s tokens (est. %.1f GB extra KV cache).", batch_sequences, batch_seq_ctx, kv_per_token * batch_sequences * batch_seq_ctx / 1024 ** 3)
+
+    def _resolve_hardware_profile(self, model_path, mode, n_batch, n_gpu_layers):
+        if mode == "off": return None
+        if n_gpu_layers != 0:
+            # CPU-measured settings say nothing about an offloaded model; keep the node's.
+            if mode == "tune": log.warning("[LLMLoader-Akki] Hardware tuning is CPU only; set n_gpu_layers to 0 to tune %s.", os.path.basename(model_path))
+            return None
+        if mode == "tune":
+            log.info("[LLMLoader-Akki] Tuning %s for this machine (CPU only)...", os.path.basename(model_path))
+            settings, results = LlamaHardwareTuner().tune(model_path)
+            self._tuning_profiles.put(model_path, settings, results)
+        else:
+            profile = self._tuning_profiles.get(model_path)
+            if profile is None: return None
+            settings = profile["settings"]
+        log.info("[LLMLoader-Akki] Hardware profile: n_batch %s (node: %s), %s/%s threads, mmap %s, mlock %s.", settings['n_batch'], n_batch, settings['n_threads'], settings['n_threads_batch'], 'on' if settings['use_mmap'] else 'off', 'on' if settings['use_mlock'] else 'off')
+        return settings
+
+    @staticmethod
+    def _resolve_model_path(gguf_name):
+        return folder_paths.get_full_path("llms", gguf_name) or folder_paths.get_full_path("LLM", gguf_name)
+
+    def _build_draft_model(self, speculative, draft_gguf_name, num_draft_tokens, n_gpu_layers, main_gpu, n_ctx, n_batch):
+        if speculative == "prompt_lookup":
+            return MeteredDraftModel(llama_speculative.LlamaPromptLookupDecoding(num_pred_tokens=num_draft_tokens))
+        if speculative != "draft_model": return None
+        draft_path = self._resolve_model_path(draft_gguf_name) if draft_gguf_name != "None" else None
+        if not draft_path: raise FileNotFoundError(f"Speculative decoding needs a draft GGUF; could not find '{draft_gguf_name}'.")
+        draft_key = (draft_path, n_gpu_layers, main_gpu, n_ctx)
+        draft_llm = self._draft_llms.get(draft_key)
+        if draft_llm is None:
+            log.info("[LLMLoader-Akki] Loading draft model %s...", draft_gguf_name)
+            draft_llm = self._draft_llms[draft_key] = llama_cpp.Llama(model_path=draft_path, n_gpu_layers=n_gpu_layers, main_gpu=main_gpu, n_ctx=n_ctx, n_batch=n_batch, verbose=False)
+        return MeteredDraftModel(GGUFDraftModel(draft_llm, num_pred_tokens=num_draft_tokens))
+
+    def _draft_footprint(self, speculative, draft_gguf_name, n_gpu_layers, n_ctx):
+        """Estimated memory of the draft model, charged to the context that uses it."""
+        draft_path = self._resolve_model_path(draft_gguf_name) if speculative == "draft_model" and draft_gguf_name != "None" else None
+        if not draft_path: return None
+        info = self._gguf_index.get(draft_path)
+        return self._model_cache.estimate_footprint(draft_path, n_ctx, n_gpu_layers, info["metadata"] if info else None)
+
+    def load_llm_model(self, gguf_name, n_gpu_layers, main_gpu, n_ctx, n_batch, verbose, prefix_cache="ram", prefix_cache_mb=2048,
+                       ram_budget_gb=0.0, vram_budget_gb=0.0, speculative="off", draft_gguf_name="None", num_draft_tokens=10,
+                       batch_sequences=1, batch_seq_ctx=4096, hardware_profile="auto"):
         if gguf_name == "No models found": raise ValueError("No GGUF models found.")
-        model_path = folder_paths.get_full_path("llms", gguf_name) or folder_paths.get_full_path("LLM", gguf_name)
+        model_path = self._resolve_model_path(gguf_name)
         if not model_path: raise FileNotFoundError(f"Could not find model '{gguf_name}'.")
-        cache_key = (model_path, n_gpu_layers, main_gpu, n_ctx, n_batch)
-        if cache_key in self._loaded_models:
-            llm = self._loaded_models[cache_key]
-        else:
-            try:
-                llm = Llama(model_path=model_path, n_gpu_layers=n_gpu_layers, main_gpu=main_gpu, n_ctx=n_ctx, n_batch=n_batch, verbose=verbose)
-                self._loaded_models[cache_key] = llm
-            except Exception as e: traceback.print_exc(); raise e
+        draft_spec = (speculative, draft_gguf_name if speculative == "draft_model" else None, num_draft_tokens if speculative != "off" else None)
+        tuned = self._resolve_hardware_profile(model_path, hardware_profile, n_batch, n_gpu_layers) or {}
+        n_batch = tuned.get("n_batch", n_batch)
+        threads = {key: tuned[key] for key in ("n_threads", "n_threads_batch") if key in tuned}
+        memory_mode = {key: tuned[key] for key in ("use_mmap", "use_mlock") if key in tuned}
+        cache_key = (model_path, n_gpu_layers, main_gpu, n_ctx, n_batch, draft_spec, tuple(sorted(tuned.items())))
+        make_draft = lambda: self._build_draft_model(speculative, draft_gguf_name, num_draft_tokens, n_gpu_layers, main_gpu, n_ctx, n_batch)
+
+        def load():
+            draft = make_draft()
+            return llama_cpp.Llama(model_path=model_path, n_gpu_layers=n_gpu_layers, main_gpu=main_gpu, n_ctx=n_ctx, n_batch=n_batch,
+                         draft_model=draft, logits_all=draft is not None, verbose=verbose, **threads, **memory_mode)
+
+        self._model_cache.set_budgets(*self._resolve_budgets(ram_budget_gb, vram_budget_gb, main_gpu))
+        info = self._gguf_index.get(model_path)
+        if info is not None:
+            footprint = self._model_cache.estimate_footprint(model_path, n_ctx, n_gpu_layers, info["metadata"])
+            log.info("[LLMLoader-Akki] %s: %s, %s, trained ctx %s; est. %.1f GB weights + %.1f GB KV cache at ctx %s.", gguf_name, info['architecture'], info['quantization'], info['context_length'] or 'N/A', footprint['weights'] / 1024 ** 3, footprint['kv'] / 1024 ** 3, n_ctx)
+            if info["context_length"] and n_ctx > info["context_length"]:
+                log.warning("[LLMLoader-Akki] Warning: n_ctx %s is beyond the %s tokens the model was trained on.", n_ctx, info['context_length'])
+        try:
+            llm = self._model_cache.get(cache_key, load, model_path, n_ctx, n_gpu_layers, weights_key=(model_path, n_gpu_layers, main_gpu, tuple(sorted(memory_mode.items()))),
+                                        derive_fn=lambda base: derive_context(base, n_ctx, n_batch, draft_model=make_draft(), **threads),
+                                        metadata=info["metadata"] if info else None,
+                                        extra_footprint=self._draft_footprint(speculative, draft_gguf_name, n_gpu_layers, n_ctx))
+        except Exception:
+            log.exception("[LLMLoader-Akki] Error loading %s:", gguf_name)
+            raise
+        draft_inner = getattr(llm.draft_model, "inner", None)
+        if isinstance(draft_inner, GGUFDraftModel) and draft_inner.llm.n_vocab() != llm.n_vocab():
+            raise ValueError(f"Draft model '{draft_gguf_name}' has a different vocabulary ({draft_inner.llm.n_vocab()} vs {llm.n_vocab()} tokens); pick a draft from the same model family.")
+        if draft_inner is not None: log.info("[LLMLoader-Akki] Speculative decoding: %s (%s draft tokens).", speculative, num_draft_tokens)
+        self._configure_prefix_cache(llm, model_path, n_ctx, prefix_cache, prefix_cache_mb)
+        self._configure_batch_decoder(llm, batch_sequences, batch_seq_ctx)
         
         offloaded_layers_count = 0
         if hasattr(llm, 'model') and hasattr(llm.model, 'n_gpu_layers'): offloaded_layers_count = llm.model.n_gpu_layers
-        print(f"[LLMLoader-Akki] >>> Offloaded {offloaded_layers_count} layers to GPU. <<<")
+        log.info("[LLMLoader-Akki] >>> Offloaded %s layers to GPU. <<<", offloaded_layers_count)
         
-        metadata = llm.metadata or {}
-        architecture = metadata.get('general.architecture', 'N/A')
-        quantization = metadata.get('general.file_type_name', 'N/A').upper()
-        model_ctx_size = str(metadata.get(f'{architecture}.context_length', 'N/A'))
+        if info is not None:
+            architecture, quantization, model_ctx_size = info["architecture"], info["quantization"], str(info["context_length"] or "N/A")
+        else:
+            metadata = llm.metadata or {}
+            architecture = metadata.get('general.architecture', 'N/A')
+            quantization = metadata.get('general.file_type_name', 'N/A').upper()
+            model_ctx_size = str(metadata.get(f'{architecture}.context_length', 'N/A'))
         return (llm, gguf_name, architecture, quantization, model_ctx_size, str(offloaded_layers_count))
 
 # --- Mappings for this file ---
 NODE_CLASS_MAPPINGS = {"LLMLoader-Akki": LLMLoader_Akki}
-NODE_DISPLAY_NAME_MAPPINGS = {"LLMLoader-Akki": "LLM Loader v2.2 - Akki"}
\ No newline at end of file
+NODE_DISPLAY_NAME_MAPPINGS = {"LLMLoader-Akki": "LLM Loader v2.9 - Akki"}
\ No newline at end of file
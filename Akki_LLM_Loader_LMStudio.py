@@ -1,17 +1,33 @@
-# Node: LLM Loader (LM Studio) v1.0
+# Node: LLM Loader (LM Studio) v1.2
 
-from .shared_utils import LMStudioLlamaProxy
+from .shared_utils import LMStudioLlamaProxy, OpenAIClientRegistry
+from .akki_logging import get_logger
+
+log = get_logger(__name__)
 
 class LLMLoaderLMStudio_Akki:
     """
     This node connects to a running LM Studio server and creates a proxy object
     that can be used by other AkkiNodes executor nodes.
+    v1.1 bounds every request: `request_timeout` per attempt, an optional
+    overall `deadline_seconds` (0 = none), up to `max_retries` jittered
+    retries, and optional hedging of requests slower than the p95 latency.
+    v1.2 adds `parallel_requests`: how many requests are sent to the server
+    at once (0 = up to the connection limit); the rest wait in a priority
+    queue, see the LLM Priority node.
     """
     @classmethod
     def INPUT_TYPES(cls):
         return {
             "required": {
                 "server_address": ("STRING", {"default": "http://localhost:1234/v1"}),
+            },
+            "optional": {
+                "request_timeout": ("INT", {"default": 600, "min": 5, "max": 3600}),
+                "deadline_seconds": ("INT", {"default": 0, "min": 0, "max": 86400}),
+                "max_retries": ("INT", {"default": 2, "min": 0, "max": 10}),
+                "hedge": ("BOOLEAN", {"default": False}),
+                "parallel_requests": ("INT", {"default": 0, "min": 0, "max": 64}),
             }
         }
 
@@ -20,13 +36,15 @@ class LLMLoaderLMStudio_Akki:
     FUNCTION = "load_from_lm_studio"
     CATEGORY = "AkkiNodes/LLM"
 
-    def load_from_lm_studio(self, server_address):
-        print(f"[LMStudioLoader-Akki] Creating API proxy for server at: {server_address}")
+    def load_from_lm_studio(self, server_address, request_timeout=600, deadline_seconds=0, max_retries=2, hedge=False, parallel_requests=0):
+        log.info("[LMStudioLoader-Akki] Creating API proxy for server at: %s", server_address)
         # The node's only job is to create and return our special proxy object.
-        proxy_model = LMStudioLlamaProxy(base_url=server_address)
+        proxy_model = LMStudioLlamaProxy(base_url=server_address, request_timeout=request_timeout, deadline=deadline_seconds or None,
+                                         max_retries=max_retries, hedge=hedge, parallel_requests=parallel_requests or None)
+        log.info("[LMStudioLoader-Akki] Pool stats: %s", OpenAIClientRegistry.format_pool_stats(server_address))
         return (proxy_model,)
 
 # --- Mappings for this file ---
 NODE_CLASS_MAPPINGS = {"LLMLoaderLMStudio-Akki": LLMLoaderLMStudio_Akki}
 # **CRITICAL FIX**: Removed the extraneous single quote at the end of the line.
-NODE_DISPLAY_NAME_MAPPINGS = {"LLMLoaderLMStudio-Akki": "LLM Loader (LM Studio) v1.0 - Akki"}
\ No newline at end of file
+NODE_DISPLAY_NAME_MAPPINGS = {"LLMLoaderLMStudio-Akki": "LLM Loader (LM Studio) v1.2 - Akki"}
\ No newline at end of file
@@ -0,0 +1,53 @@
+# Node: LLM Loader (LM Studio Pool) v1.2
+
+from .shared_utils import LMStudioPoolProxy
+from .akki_logging import get_logger
+
+log = get_logger(__name__)
+
+class LLMLoaderLMStudioPool_Akki:
+    """
+    Connects to several LM Studio (or other OpenAI-compatible) servers that
+    serve the same model and returns one proxy that load-balances across
+    them. Batched nodes (per-scene, per-shot loops) then scale with the
+    number of boxes. List one server address per line.
+    v1.1 adds an optional overall deadline (0 = none), a retry budget
+    (-1 = one attempt per server) and hedging of requests slower than p95.
+    v1.2 adds `parallel_requests` per server (0 = up to the connection
+    limit); no server runs more than that at once, and requests beyond the
+    pool's total wait in a priority queue.
+    """
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "server_addresses": ("STRING", {"multiline": True, "default": "http://localhost:1234/v1\nhttp://localhost:1235/v1"}),
+                "request_timeout": ("INT", {"default": 600, "min": 5, "max": 3600}),
+                "eject_seconds": ("INT", {"default": 30, "min": 1, "max": 3600}),
+            },
+            "optional": {
+                "deadline_seconds": ("INT", {"default": 0, "min": 0, "max": 86400}),
+                "max_retries": ("INT", {"default": -1, "min": -1, "max": 10}),
+                "hedge": ("BOOLEAN", {"default": False}),
+                "parallel_requests": ("INT", {"default": 0, "min": 0, "max": 64}),
+            }
+        }
+
+    RETURN_TYPES = ("LLM_MODEL",)
+    RETURN_NAMES = ("llm_model",)
+    FUNCTION = "load_pool"
+    CATEGORY = "AkkiNodes/LLM"
+
+    def load_pool(self, server_addresses, request_timeout, eject_seconds, deadline_seconds=0, max_retries=-1, hedge=False, parallel_requests=0):
+        urls = [line.strip() for line in server_addresses.replace(",", "\n").splitlines() if line.strip() and not line.strip().startswith("#")]
+        if not urls: raise ValueError("No server addresses provided.")
+        log.info("[LMStudioPoolLoader-Akki] Creating load-balanced proxy for %s server(s).", len(urls))
+        proxy_model = LMStudioPoolProxy(urls, request_timeout=request_timeout, eject_seconds=eject_seconds, deadline=deadline_seconds or None,
+                                        max_retries=None if max_retries < 0 else max_retries, hedge=hedge,
+                                        parallel_requests=parallel_requests or None)
+        log.info("[LMStudioPoolLoader-Akki] Endpoints:\n%s", proxy_model.format_endpoint_stats())
+        return (proxy_model,)
+
+# --- Mappings for this file ---
+NODE_CLASS_MAPPINGS = {"LLMLoaderLMStudioPool-Akki": LLMLoaderLMStudioPool_Akki}
+NODE_DISPLAY_NAME_MAPPINGS = {"LLMLoaderLMStudioPool-Akki": "LLM Loader (LM Studio Pool) v1.2 - Akki"}
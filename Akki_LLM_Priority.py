@@ -0,0 +1,42 @@
+# Node: LLM Priority v1.0
+
+from .shared_utils import PrioritizedLLMProxy, PRIORITY_CLASSES
+from .akki_logging import get_logger
+
+log = get_logger(__name__)
+
+class LLMPriority_Akki:
+    """
+    Tags every request made through this LLM_MODEL with a scheduling class
+    and a workflow name. A loaded model serves one request at a time
+    (llama.cpp) or a fixed number (LM Studio), and waiting requests are
+    served "interactive" first, then "normal", then "batch", taking turns
+    between workflows within a class. Per-scene and per-shot fan-outs
+    default to "batch", everything else to "normal", so put an
+    "interactive" tag on single-shot preview branches.
+    """
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "llm_model": ("LLM_MODEL",),
+                "priority": (list(PRIORITY_CLASSES), {"default": "interactive"}),
+            },
+            "optional": {
+                # Empty = the calling node's name.
+                "workflow": ("STRING", {"default": ""}),
+            }
+        }
+
+    RETURN_TYPES = ("LLM_MODEL",)
+    RETURN_NAMES = ("llm_model",)
+    FUNCTION = "tag_model"
+    CATEGORY = "AkkiNodes/LLM"
+
+    def tag_model(self, llm_model, priority, workflow=""):
+        log.info("[LLMPriority-Akki] Requests scheduled as '%s'%s", priority, f" for workflow '{workflow.strip()}'." if workflow.strip() else ".")
+        return (PrioritizedLLMProxy(llm_model, priority=priority, workflow=workflow.strip()),)
+
+# --- Mappings for this file ---
+NODE_CLASS_MAPPINGS = {"LLMPriority-Akki": LLMPriority_Akki}
+NODE_DISPLAY_NAME_MAPPINGS = {"LLMPriority-Akki": "LLM Priority v1.0 - Akki"}
@@ -0,0 +1,43 @@
+# Node: LLM Router v1.0
+
+from .shared_utils import LLMRouter, LLM_TIERS
+from .akki_logging import get_logger
+
+log = get_logger(__name__)
+
+class LLMRouter_Akki:
+    """
+    Builds one LLM_MODEL from up to three loaded models, one per tier.
+    Stages that declare themselves "mechanical" (QC asset sanitizing, the
+    Video Prompt Engineer's action extraction, the Lookdev assembler) run on
+    the smallest model connected at or above that tier; everything else
+    runs on `default_tier`. Connect a small GGUF as `mechanical_model` and
+    keep the large one as `creative_model`.
+    """
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "creative_model": ("LLM_MODEL",),
+                "default_tier": (list(LLM_TIERS), {"default": "creative"}),
+            },
+            "optional": {
+                "standard_model": ("LLM_MODEL",),
+                "mechanical_model": ("LLM_MODEL",),
+            }
+        }
+
+    RETURN_TYPES = ("LLM_MODEL",)
+    RETURN_NAMES = ("llm_router",)
+    FUNCTION = "build_router"
+    CATEGORY = "AkkiNodes/LLM"
+
+    def build_router(self, creative_model, default_tier, standard_model=None, mechanical_model=None):
+        router = LLMRouter({"mechanical": mechanical_model, "standard": standard_model, "creative": creative_model}, default_tier=default_tier)
+        routes = ", ".join(f"{tier} -> {LLMRouter.describe(llm_model)}" for tier, llm_model in router.routes)
+        log.info("[LLMRouter-Akki] Routes: %s; undeclared stages run as '%s'.", routes, default_tier)
+        return (router,)
+
+# --- Mappings for this file ---
+NODE_CLASS_MAPPINGS = {"LLMRouter-Akki": LLMRouter_Akki}
+NODE_DISPLAY_NAME_MAPPINGS = {"LLMRouter-Akki": "LLM Router v1.0 - Akki"}
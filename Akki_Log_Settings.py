@@ -0,0 +1,49 @@
+# Node: Log Settings v1.0
+
+import os
+import folder_paths
+from .akki_logging import configure_logging, get_logger, LOG_LEVELS
+
+log = get_logger(__name__)
+
+class LogSettings_Akki:
+    """
+    Sets the suite's console log level (overall and per module), how much
+    of each request payload or full prompt is logged, and optionally adds a
+    rotating JSONL log in the project's DATA/logs folder. Settings last
+    until ComfyUI restarts or another Log Settings node runs. Passes the
+    project path through so it can sit in front of the pipeline.
+    """
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "project_path": ("STRING", {"forceInput": True}),
+                "console_level": (list(LOG_LEVELS), {"default": "INFO"}),
+                "jsonl_file_log": ("BOOLEAN", {"default": False}),
+            },
+            "optional": {
+                # e.g. "shared_utils=DEBUG, Akki_AI_QC_Supervisor=WARNING"
+                "module_levels": ("STRING", {"default": ""}),
+                # 0 = log payloads in full
+                "payload_chars": ("INT", {"default": 2000, "min": 0, "max": 1000000, "step": 100}),
+                # Log 1 in N payloads
+                "payload_sample": ("INT", {"default": 1, "min": 1, "max": 10000}),
+            }
+        }
+
+    RETURN_TYPES = ("STRING", "STRING")
+    RETURN_NAMES = ("project_path", "log_file_path")
+    FUNCTION = "apply_settings"
+    CATEGORY = "AkkiNodes/LLM"
+
+    def apply_settings(self, project_path, console_level, jsonl_file_log, module_levels="", payload_chars=2000, payload_sample=1):
+        log_dir = os.path.join(folder_paths.get_output_directory(), project_path, "DATA", "logs") if jsonl_file_log else ""
+        log_file_path = configure_logging(level=console_level, module_levels=module_levels, payload_chars=payload_chars,
+                                          payload_sample=payload_sample, file_dir=log_dir)
+        log.info("[LogSettings-Akki] Console level %s%s", console_level, f", JSONL log at {log_file_path}." if log_file_path else ".")
+        return (project_path, log_file_path or "")
+
+# --- Mappings for this file ---
+NODE_CLASS_MAPPINGS = {"LogSettings-Akki": LogSettings_Akki}
+NODE_DISPLAY_NAME_MAPPINGS = {"LogSettings-Akki": "Log Settings v1.0 - Akki"}
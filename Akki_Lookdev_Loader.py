@@ -4,9 +4,11 @@
 
 import os
 import re
-import traceback
 import folder_paths
 from collections import defaultdict
+from .akki_logging import get_logger
+
+log = get_logger(__name__)
 
 class LookdevBibleLoader_Akki:
     """
@@ -39,7 +41,7 @@ class LookdevBibleLoader_Akki:
 
     def _find_and_load_latest_bible(self, directory_path):
         if not os.path.isdir(directory_path):
-            print(f"[Lookdev Loader] Warning: Directory not found: {directory_path}")
+            log.warning("[Lookdev Loader] Warning: Directory not found: %s", directory_path)
             return [], []
         names_list, prompts_list = [], []
         try:
@@ -60,7 +62,7 @@ class LookdevBibleLoader_Akki:
                 names_list.append(original_name)
                 prompts_list.append(content)
         except Exception as e:
-            traceback.print_exc()
+            log.exception("[Lookdev Loader] Error reading %s:", directory_path)
             return [f"ERROR: Failed to load files from {directory_path}"], [str(e)]
         return names_list, prompts_list
 
@@ -112,7 +114,7 @@ class LookdevBibleLoader_Akki:
                 content = f.read()
             return best_match['name'], content
         except Exception as e:
-            traceback.print_exc()
+            log.exception("[Lookdev Loader] Error reading %s:", best_match['path'])
             return best_match['name'], f"ERROR: Could not read file. Details: {e}"
 
     def load_lookdev_bible(self, project_path, character_subfolder, set_subfolder, selected_name=None):
@@ -5,6 +5,9 @@ import traceback
 import csv
 import io
 import json
+from .akki_logging import get_logger
+
+log = get_logger(__name__)
 
 class ProShotListParser_Akki:
     """
@@ -277,7 +280,7 @@ class ProShotListParser_Akki:
             master_prop_list = ", ".join(sorted(list(master_assets["PROPS"])))
             final_debug_log = "Debug mode off. Set shot_index > 0 to enable."
         except Exception as e:
-            traceback.print_exc()
+            log.exception("[ProShotListParser] Error:")
             error_msg = f"Failed to parse pro report. Check console. Details: {e}"
             return (f"ERROR: {error_msg}",) * 7 + (f"ERROR: {e}\n{traceback.format_exc()}",)
 
@@ -1,48 +1,29 @@
 # --- START OF FILE Akki_Scene_Choreographer_Bible.py ---
 
-# Node: AI Scene Choreographer (Bible) v4.3 (Case-Insensitive)
+# Node: AI Scene Choreographer (Bible) v4.4 (Case-Insensitive)
 
-import traceback
 import csv
 import io
 import os
 import re
 import json
-from .shared_utils import report_token_usage
-
-# --- HELPER FUNCTIONS for Self-Contained Prompt Loading ---
-NODE_DIR = os.path.dirname(__file__)
-PROMPTS_ROOT_DIR = os.path.join(NODE_DIR, "_prompts", "Choreographer")
-
-# ... (Helper functions are unchanged) ...
-def get_prompt_files_from_stage_dir(stage_folder):
-    stage_dir = os.path.join(PROMPTS_ROOT_DIR, stage_folder)
-    if not os.path.isdir(stage_dir):
-        print(f"[SceneChoreographer-v4.3] Creating prompt directory: {stage_dir}")
-        os.makedirs(stage_dir, exist_ok=True)
-        placeholder_path = os.path.join(stage_dir, "placeholder.txt")
-        if not os.path.exists(placeholder_path):
-             with open(placeholder_path, 'w', encoding='utf-8') as f: f.write(f"Add your {stage_folder} prompt .txt files here.")
-        return ["placeholder.txt"]
-    try:
-        files = [f for f in os.listdir(stage_dir) if f.endswith('.txt')]
-        return files if files else ["No .txt files found"]
-    except Exception as e:
-        print(f"[SceneChoreographer-v4.3] Error scanning prompt directory {stage_dir}: {e}")
-        return ["Error loading prompts"]
-
-def read_prompt_file(stage_folder, filename):
-    filepath = os.path.join(PROMPTS_ROOT_DIR, stage_folder, filename)
-    if not os.path.exists(filepath):
-        raise FileNotFoundError(f"Prompt file not found: {filepath}")
-    with open(filepath, 'r', encoding='utf-8') as f:
-        return f.read()
+from .shared_utils import report_token_usage, run_completion_batch, raise_batch_failures, ProcessLog, PROMPTS
+from .llm_metrics import metrics_node, metrics_scope
+from .akki_logging import get_logger
+
+log = get_logger(__name__)
+
+# Prompt templates live in _prompts/Choreographer/stage1-2 (see PromptRegistry).
+PROMPT_FOLDER = "Choreographer"
 
 
 class AISceneChoreographerBible_Akki:
     """
     v4.3 adds case-insensitive lookups for all assets, ensuring robust
     matching between lookdev files and CSV data, fixing the context bleed bug.
+    v4.4 writes the Director's choreography and every Promptsmith prompt to
+    a process log file in the project folder; `choreography_text_DEBUG` is
+    now that file's path and a summary.
     """
 
     @classmethod
@@ -57,13 +38,18 @@ class AISceneChoreographerBible_Akki:
                 "set_prompts_STRING": ("STRING", {"forceInput": True}),
                 "character_names_STRING": ("STRING", {"forceInput": True}),
                 "character_prompts_STRING": ("STRING", {"forceInput": True}),
-                "prompt_director": (get_prompt_files_from_stage_dir("stage1"),),
-                "prompt_promptsmith": (get_prompt_files_from_stage_dir("stage2"),),
+                "prompt_director": (PROMPTS.list(f"{PROMPT_FOLDER}/stage1", "SceneChoreographer-v4.4"),),
+                "prompt_promptsmith": (PROMPTS.list(f"{PROMPT_FOLDER}/stage2", "SceneChoreographer-v4.4"),),
                 "temperature": ("FLOAT", {"default": 0.5, "step": 0.01}),
                 "top_p": ("FLOAT", {"default": 0.95, "step": 0.01}),
                 "top_k": ("INT", {"default": 40}),
                 "seed": ("INT", {"default": 1234}),
                 "max_tokens": ("INT", {"default": 4096, "min": 256, "max": 16384}),
+            },
+            "optional": {
+                "max_concurrency": ("INT", {"default": 4, "min": 1, "max": 32}),
+                "use_llm_cache": ("BOOLEAN", {"default": True}),
+                "project_path": ("STRING", {"forceInput": True}),
             }
         }
 
@@ -75,12 +61,13 @@ class AISceneChoreographerBible_Akki:
     
     OUTPUT_IS_LIST = (True, True, False, False, False)
 
+    @metrics_node("SceneChoreographerBible")
     def choreograph_scene(self, llm_model, csv_report, scene_number, 
                           set_names_STRING, set_prompts_STRING, 
                           character_names_STRING, character_prompts_STRING,
                           prompt_director, prompt_promptsmith, **kwargs):
         
-        full_llm_process_log = ""
+        process_log = None
         scene_location = "ERROR"
         error_tuple = ([], [], "ERROR", "Check console.", 0)
         
@@ -102,7 +89,7 @@ class AISceneChoreographerBible_Akki:
             if not scene_shots:
                 return ([], [], f"ERROR: No shots for Scene {scene_number}", "", 0)
 
-            print(f"[SceneChoreographer-v4.3] Stage 1 (Director): Generating choreography for Scene {scene_number}...")
+            log.info("[SceneChoreographer-v4.4] Stage 1 (Director): Generating choreography for Scene %s...", scene_number)
 
             scene_location = scene_shots[0].get('LOCATION', 'Unknown Location').strip()
             
@@ -134,13 +121,20 @@ class AISceneChoreographerBible_Akki:
                 shot_details = [f"  - {key}: {value}" for key, value in s.items() if value and value.lower() != 'none']
                 shot_list_chunk += f"- Shot: {s['SHOT']}\n" + "\n".join(shot_details) + "\n"
 
-            director_template = read_prompt_file("stage1", prompt_director)
+            # Both templates are loaded and checked before the Director call.
+            director_template = PROMPTS.get(f"{PROMPT_FOLDER}/stage1", prompt_director, fields=("lookdev_bible_context", "shot_list_chunk"))
+            promptsmith_template = PROMPTS.get(f"{PROMPT_FOLDER}/stage2", prompt_promptsmith,
+                                               fields=("lookdev_bible_context", "narrative_choreography", "structured_shot_data"))
             director_prompt = director_template.format(lookdev_bible_context=lookdev_bible_context, shot_list_chunk=shot_list_chunk)
             
-            director_output = llm_model.create_completion(prompt=director_prompt, max_tokens=kwargs.get('max_tokens', 4096), temperature=kwargs.get('temperature', 0.5),
-                                                        top_p=kwargs.get('top_p', 0.95), top_k=kwargs.get('top_k', 40),
-                                                        seed=kwargs.get('seed', 1234) if kwargs.get('seed', 1234) > 0 else -1, stop=["</response>"])
+            with metrics_scope(stage="Director", item=f"Scene {scene_number}"):
+                director_output = llm_model.create_completion(prompt=director_prompt, max_tokens=kwargs.get('max_tokens', 4096), temperature=kwargs.get('temperature', 0.5),
+                                                            top_p=kwargs.get('top_p', 0.95), top_k=kwargs.get('top_k', 40),
+                                                            seed=kwargs.get('seed', 1234) if kwargs.get('seed', 1234) > 0 else -1, stop=["</response>"],
+                                                            use_cache=kwargs.get('use_llm_cache', True))
             choreography_text = director_output['choices'][0]['text'].strip()
+            process_log = ProcessLog("SceneChoreographer", kwargs.get('project_path'), label=f"Scene {scene_number}")
+            process_log.write(f"DIRECTOR CHOREOGRAPHY (SCENE {scene_number})", choreography_text)
 
             choreography_dict = {}
             shot_blocks = choreography_text.split('//---SHOT_START---//')
@@ -151,9 +145,8 @@ class AISceneChoreographerBible_Akki:
                     shot_id = shot_id_match.group(1).strip()
                     choreography_dict[shot_id] = block.replace('//---SHOT_END---//', '').strip()
 
-            print(f"[SceneChoreographer-v4.3] Stage 2 (Promptsmith): Generating final prompts...")
-            shot_names_LIST, final_shot_prompts_LIST = [], []
-            promptsmith_template = read_prompt_file("stage2", prompt_promptsmith)
+            log.info("[SceneChoreographer-v4.4] Stage 2 (Promptsmith): Generating final prompts...")
+            shot_names_LIST, promptsmith_batch = [], []
 
             for shot_data in scene_shots:
                 shot_id = shot_data.get("SHOT", "").strip()
@@ -163,19 +156,27 @@ class AISceneChoreographerBible_Akki:
                 promptsmith_prompt = promptsmith_template.format(lookdev_bible_context=lookdev_bible_context,
                                                                narrative_choreography=narrative_choreography,
                                                                structured_shot_data=json.dumps(shot_data, indent=2))
-                promptsmith_output = llm_model.create_completion(prompt=promptsmith_prompt, max_tokens=1024, temperature=0.4,
-                                                               top_p=kwargs.get('top_p', 0.95), top_k=kwargs.get('top_k', 40),
-                                                               seed=kwargs.get('seed', 1234) if kwargs.get('seed', 1234) > 0 else -1, stop=["</response>"])
-                final_prompt = promptsmith_output['choices'][0]['text'].strip()
-                final_shot_prompts_LIST.append(final_prompt)
+                promptsmith_batch.append(dict(prompt=promptsmith_prompt, max_tokens=1024, temperature=0.4,
+                                              top_p=kwargs.get('top_p', 0.95), top_k=kwargs.get('top_k', 40),
+                                              seed=kwargs.get('seed', 1234) if kwargs.get('seed', 1234) > 0 else -1, stop=["</response>"],
+                                              use_cache=kwargs.get('use_llm_cache', True), metrics_item=f"Shot {shot_id}"))
+
+            with metrics_scope(stage="Promptsmith"):
+                promptsmith_outputs = run_completion_batch(llm_model, promptsmith_batch, max_concurrency=kwargs.get('max_concurrency', 4))
+            raise_batch_failures(promptsmith_outputs, "Shot")
+            final_shot_prompts_LIST = [output['choices'][0]['text'].strip() for output in promptsmith_outputs]
+            for shot_id, shot_prompt in zip(shot_names_LIST, final_shot_prompts_LIST):
+                process_log.write(f"PROMPTSMITH: SHOT {shot_id}", shot_prompt)
             
-            return (shot_names_LIST, final_shot_prompts_LIST, scene_location, choreography_text, len(shot_names_LIST))
+            return (shot_names_LIST, final_shot_prompts_LIST, scene_location, process_log.summary(), len(shot_names_LIST))
 
         except Exception as e:
-            traceback.print_exc()
+            log.exception("[SceneChoreographer-v4.4] Error:")
             return error_tuple
+        finally:
+            if process_log: process_log.close()
 
 NODE_CLASS_MAPPINGS = {"AISceneChoreographerBible-Akki": AISceneChoreographerBible_Akki}
-NODE_DISPLAY_NAME_MAPPINGS = {"AISceneChoreographerBible-Akki": "AI Scene Choreographer (Bible) v4.3 - Akki"}
+NODE_DISPLAY_NAME_MAPPINGS = {"AISceneChoreographerBible-Akki": "AI Scene Choreographer (Bible) v4.4 - Akki"}
 
 # --- END OF FILE Akki_Scene_Choreographer_Bible.py ---
\ No newline at end of file
@@ -2,8 +2,10 @@
 
 import os
 import re
-import traceback
 import folder_paths
+from .akki_logging import get_logger
+
+log = get_logger(__name__)
 
 class SceneChoreographyLoader_Akki:
     """
@@ -48,7 +50,7 @@ class SceneChoreographyLoader_Akki:
             latest_file = sorted(matching_files, reverse=True)[0]
             file_path = os.path.join(data_dir, latest_file)
             
-            print(f"[SceneChoreographyLoader] Found latest file for Scene {scene_number}: {latest_file}")
+            log.info("[SceneChoreographyLoader] Found latest file for Scene %s: %s", scene_number, latest_file)
             
             with open(file_path, 'r', encoding='utf-8') as f:
                 choreography_text = f.read()
@@ -56,7 +58,7 @@ class SceneChoreographyLoader_Akki:
             return (choreography_text,)
 
         except Exception as e:
-            traceback.print_exc()
+            log.exception("[SceneChoreographyLoader] Error:")
             return (f"ERROR: Failed to load choreography file. Check console. Details: {e}",)
 
 NODE_CLASS_MAPPINGS = {"SceneChoreographyLoader-Akki": SceneChoreographyLoader_Akki}
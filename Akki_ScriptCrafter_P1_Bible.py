@@ -3,6 +3,10 @@
 import re
 import traceback
 from .shared_utils import report_token_usage
+from .llm_metrics import metrics_node
+from .akki_logging import get_logger
+
+log = get_logger(__name__)
 
 class AIScriptCrafter01FoundationBible_Akki:
     """
@@ -107,6 +111,9 @@ NAME: [Next Supporting Character Name]
                 "top_p": ("FLOAT", {"default": 0.95, "step": 0.01}),
                 "top_k": ("INT", {"default": 40}),
                 "seed": ("INT", {"default": 1235}),
+            },
+            "optional": {
+                "use_llm_cache": ("BOOLEAN", {"default": True}),
             }
         }
     
@@ -133,11 +140,11 @@ NAME: [Next Supporting Character Name]
         return "\n".join([f"{field}: {profile_dict.get(field, '').strip()}" for field in self.CHARACTER_FIELDS])
 
     def _deterministic_refinement(self, ai_generated_text, known_facts):
-        print("[ScriptCraft-P1-Bible v7.2] Stage 2: Performing deterministic refinement...")
+        log.info("[ScriptCraft-P1-Bible v7.2] Stage 2: Performing deterministic refinement...")
         
         char_bible_match = re.search(r"(//---CHARACTER_BIBLE---//)([\s\S]*)", ai_generated_text, re.DOTALL | re.IGNORECASE)
         if not char_bible_match:
-            print("  - WARNING: Character Bible section not found for refinement.")
+            log.warning("  - WARNING: Character Bible section not found for refinement.")
             return ai_generated_text # Nothing to refine
 
         header = char_bible_match.group(1)
@@ -193,10 +200,11 @@ NAME: [Next Supporting Character Name]
         # Replace the old character bible with the refined one
         sanitized_full_text = ai_generated_text.replace(char_bible_match.group(0), f"{header}\n{reconstructed_body.strip()}")
         
-        print(f"  - Refinement complete. Processed {len(profiles_dicts)} profiles, finalized {len(final_profiles)} unique profiles.")
+        log.debug("  - Refinement complete. Processed %s profiles, finalized %s unique profiles.", len(profiles_dicts), len(final_profiles))
         return sanitized_full_text.strip()
 
-    def generate_foundations(self, llm_model, story_text, protagonist_name, protagonist_type, protagonist_age, antagonist_name, antagonist_type, antagonist_age, genre, period, max_tokens, temperature, top_p, top_k, seed):
+    @metrics_node("ScriptCrafter-P1-Bible")
+    def generate_foundations(self, llm_model, story_text, protagonist_name, protagonist_type, protagonist_age, antagonist_name, antagonist_type, antagonist_age, genre, period, max_tokens, temperature, top_p, top_k, seed, use_llm_cache=True):
         if not hasattr(llm_model, 'create_completion'):
             raise ValueError("LLM Model not provided or is invalid.")
         
@@ -216,7 +224,7 @@ NAME: [Next Supporting Character Name]
 
         try:
             # --- STAGE 1: Intelligent Analysis (Single AI Call) ---
-            print("[ScriptCraft-P1-Bible v7.2] Stage 1: Performing comprehensive analysis...")
+            log.info("[ScriptCraft-P1-Bible v7.2] Stage 1: Performing comprehensive analysis...")
             prompt = self.COMPREHENSIVE_BIBLE_PROMPT.format(story_text=story_text, **known_facts_map)
             full_process_log += f"--- STAGE 1: COMPREHENSIVE PROMPT ---\n{prompt}\n\n"
             
@@ -227,7 +235,8 @@ NAME: [Next Supporting Character Name]
                 top_p=top_p,
                 top_k=top_k,
                 seed=seed if seed > 0 else -1,
-                stop=["</response>"]
+                stop=["</response>"],
+                use_cache=use_llm_cache
             )
             report_token_usage("ScriptCrafter-P1-Bible (Comprehensive Analysis)", ai_output)
             raw_ai_text = ai_output['choices'][0]['text'].strip()
@@ -255,11 +264,10 @@ NAME: [Next Supporting Character Name]
             else:
                 character_bible = "ERROR: Character Bible section not found in AI output."
 
-            print("[ScriptCraft-P1-Bible v7.2] All stages complete.")
+            log.info("[ScriptCraft-P1-Bible v7.2] All stages complete.")
 
         except Exception as e:
-            print(f"[ScriptCraft-P1-Bible] Error during generation: {e}")
-            traceback.print_exc()
+            log.exception("[ScriptCraft-P1-Bible] Error during generation:")
             character_bible = f"ERROR: An exception occurred during bible generation. Check console. Details: {e}"
             full_process_log += f"--- CRITICAL ERROR ---\n{traceback.format_exc()}\n"
 
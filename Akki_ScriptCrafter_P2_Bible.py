@@ -1,7 +1,10 @@
 # Node: AI ScriptCrafter 02 (Beat Sheet & Bible Passthrough) v4.0
 
-import traceback
 from .shared_utils import report_token_usage, extract_tagged_content
+from .llm_metrics import metrics_node
+from .akki_logging import get_logger
+
+log = get_logger(__name__)
 
 class AIScriptCrafter02BeatSheetBible_Akki:
     """
@@ -64,6 +67,9 @@ Your output MUST be a list of the following 15 beats, in order. For each beat, p
                 "top_p": ("FLOAT", {"default": 0.95, "step": 0.01}),
                 "top_k": ("INT", {"default": 40}),
                 "seed": ("INT", {"default": 1234}),
+            },
+            "optional": {
+                "use_llm_cache": ("BOOLEAN", {"default": True}),
             }
         }
     
@@ -73,7 +79,8 @@ Your output MUST be a list of the following 15 beats, in order. For each beat, p
     FUNCTION = "generate_beats"
     CATEGORY = "AkkiNodes/ScriptCraft"
 
-    def generate_beats(self, llm_model, story_text, world_bible, character_bible, max_tokens, temperature, top_p, top_k, seed):
+    @metrics_node("ScriptCrafter-P2-Bible")
+    def generate_beats(self, llm_model, story_text, world_bible, character_bible, max_tokens, temperature, top_p, top_k, seed, use_llm_cache=True):
         beat_sheet = ""
         try:
             if not hasattr(llm_model, 'create_completion'): raise ValueError("LLM Model not provided.")
@@ -84,17 +91,18 @@ Your output MUST be a list of the following 15 beats, in order. For each beat, p
                 character_bible=character_bible
             )
             
-            print("[ScriptCraft-P2-Bible] Generating beat sheet from story and bible...")
+            log.info("[ScriptCraft-P2-Bible] Generating beat sheet from story and bible...")
             output = llm_model.create_completion(
                 prompt=prompt, max_tokens=max_tokens, temperature=temperature,
-                top_p=top_p, top_k=top_k, seed=seed if seed > 0 else -1, stop=["</response>", "//---END_MAIN_OUTPUT--//"]
+                top_p=top_p, top_k=top_k, seed=seed if seed > 0 else -1, stop=["</response>", "//---END_MAIN_OUTPUT--//"],
+                use_cache=use_llm_cache
             )
             report_token_usage("ScriptCrafter-P2-Bible", output)
             raw_text = output['choices'][0]['text'].strip()
             beat_sheet = extract_tagged_content(raw_text, "main_output")
         except Exception as e:
             beat_sheet = f"ERROR: An exception occurred in ScriptCrafter P2. Check console for details.\n\nDetails: {e}"
-            traceback.print_exc()
+            log.exception("[ScriptCraft-P2-Bible] Error:")
 
         # Pass the bibles through unchanged
         return (beat_sheet, world_bible, character_bible)
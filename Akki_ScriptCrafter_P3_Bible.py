@@ -1,50 +1,34 @@
 # --- START OF FILE Akki_ScriptCrafter_P3_Bible.py ---
 
-# Node: AI ScriptCrafter 03 (Bible) v16.8 (Definitive)
+# Node: AI ScriptCrafter 03 (Bible) v16.9 (Definitive)
 
-import traceback
 import re
 import os
-from .shared_utils import report_token_usage, extract_tagged_content
-
-# --- HELPER FUNCTIONS for Self-Contained Prompt Loading ---
-NODE_DIR = os.path.dirname(__file__)
-PROMPTS_ROOT_DIR = os.path.join(NODE_DIR, "_prompts")
-
-def get_prompt_files_from_stage_dir(stage_folder):
-    stage_dir = os.path.join(PROMPTS_ROOT_DIR, stage_folder)
-    if not os.path.isdir(stage_dir):
-        print(f"[ScriptCraft-P3-v16.8] Creating prompt directory: {stage_dir}")
-        os.makedirs(stage_dir, exist_ok=True)
-        placeholder_path = os.path.join(stage_dir, "placeholder.txt")
-        if not os.path.exists(placeholder_path):
-             with open(placeholder_path, 'w', encoding='utf-8') as f:
-                f.write(f"Add your {stage_folder} prompt .txt files here.")
-        return ["placeholder.txt"]
-    try:
-        files = [f for f in os.listdir(stage_dir) if f.endswith('.txt')]
-        return files if files else ["No .txt files found"]
-    except Exception as e:
-        print(f"[ScriptCraft-P3-v16.8] Error scanning prompt directory {stage_dir}: {e}")
-        return ["Error loading prompts"]
-
-def read_prompt_file(stage_folder, filename):
-    filepath = os.path.join(PROMPTS_ROOT_DIR, stage_folder, filename)
-    if not os.path.exists(filepath):
-        raise FileNotFoundError(f"Prompt file not found: {filepath}")
-    with open(filepath, 'r', encoding='utf-8') as f:
-        return f.read()
-# --- END HELPER FUNCTIONS ---
+from .shared_utils import report_token_usage, extract_tagged_content, create_completion_streaming, PromptBudget, PromptSection, PROMPTS
+from .llm_metrics import metrics_node, metrics_scope
+from .akki_logging import get_logger
+
+log = get_logger(__name__)
+
+
+# Each stage's draft ends with this marker; anything generated after it is discarded anyway.
+MAIN_OUTPUT_END_TAGS = ["//---END_MAIN_OUTPUT--//"]
 
 
 class AIScriptCrafter03ScreenplayBible_Akki:
     """
-    AI ScriptCrafter v16.8 (Definitive). This is the final, production-ready
+    AI ScriptCrafter v16.9 (Definitive). This is the final, production-ready
     version. It combines a hardened 3-stage LLM pipeline with a definitive
     Master Post-Processor. This processor uses a "Hybrid Heuristic Parser" to
     robustly handle LLM typos and formatting errors, ensuring 100% data and
     structural integrity in the final, Fountain-compliant screenplay.
+    v16.9 sizes every stage prompt against the model's context window before
+    the call: when the sources do not fit next to `max_tokens`, the lowest
+    priority ones (world bible first, character bible last) are trimmed or
+    summarized, or the node stops with an error, per `context_overflow`.
     """
+    # Sources give way in this order (lowest first) when a stage prompt overflows n_ctx.
+    SOURCE_PRIORITIES = {"world_bible": 1, "story_text": 2, "beat_sheet": 3, "character_bible": 4}
 
     @classmethod
     def INPUT_TYPES(cls):
@@ -54,15 +38,19 @@ class AIScriptCrafter03ScreenplayBible_Akki:
                 "world_bible": ("STRING", {"forceInput": True}),
                 "character_bible": ("STRING", {"forceInput": True}),
                 "beat_sheet": ("STRING", {"forceInput": True}),
-                "prompt_stage_1": (get_prompt_files_from_stage_dir("stage1"),),
-                "prompt_stage_2": (get_prompt_files_from_stage_dir("stage2"),),
-                "prompt_stage_3": (get_prompt_files_from_stage_dir("stage3"),),
+                "prompt_stage_1": (PROMPTS.list("stage1", "ScriptCraft-P3-v16.9"),),
+                "prompt_stage_2": (PROMPTS.list("stage2", "ScriptCraft-P3-v16.9"),),
+                "prompt_stage_3": (PROMPTS.list("stage3", "ScriptCraft-P3-v16.9"),),
                 "cinematic_style": ("STRING", {"multiline": False, "default": "Gritty and realistic with handheld camera work"}),
                 "max_tokens": ("INT", {"default": 8192, "min": 1024, "max": 16384}),
                 "temperature": ("FLOAT", {"default": 0.7, "step": 0.01}),
                 "top_p": ("FLOAT", {"default": 0.95, "step": 0.01}),
                 "top_k": ("INT", {"default": 40}),
                 "seed": ("INT", {"default": 1234}),
+            },
+            "optional": {
+                "use_llm_cache": ("BOOLEAN", {"default": True}),
+                "context_overflow": (["trim", "summarize", "error"], {"default": "trim"}),
             }
         }
 
@@ -71,28 +59,34 @@ class AIScriptCrafter03ScreenplayBible_Akki:
     FUNCTION = "generate_script"
     CATEGORY = "AkkiNodes/ScriptCraft"
 
+    def _pack_stage_prompt(self, budget, stage_name, template, source_context, context_overflow, **fixed):
+        strategy = "summarize" if context_overflow == "summarize" else "trim"
+        sections = {name: PromptSection(source_context[name], priority, strategy) for name, priority in self.SOURCE_PRIORITIES.items()}
+        budget.label = f"ScriptCraft-P3 {stage_name}"
+        return budget.pack(template, sections, overflow=context_overflow, cinematic_style=source_context["cinematic_style"], **fixed)
+
     def _master_post_processor(self, raw_text, character_bible):
-        print("[ScriptCraft-P3-v16.8] Stage 4: Master Post-Processor starting...")
+        log.info("[ScriptCraft-P3-v16.9] Stage 4: Master Post-Processor starting...")
 
         # STAGE 1: Sanitize using the "Content Isolation" principle
-        print("    - Step A: Isolating screenplay content...")
+        log.debug("    - Step A: Isolating screenplay content...")
         try:
             start_index = raw_text.upper().index("FADE IN:")
         except ValueError:
-            print("    - Warning: 'FADE IN:' not found. Processing from start of text.")
+            log.warning("    - Warning: 'FADE IN:' not found. Processing from start of text.")
             start_index = 0
         try:
             end_marker_start = raw_text.upper().rindex("FADE OUT.")
             end_index = end_marker_start + len("FADE OUT.")
         except ValueError:
-            print("    - Warning: 'FADE OUT.' not found. Processing to end of text.")
+            log.warning("    - Warning: 'FADE OUT.' not found. Processing to end of text.")
             end_index = len(raw_text)
         text = raw_text[start_index:end_index]
         text = re.sub(r'<\?.*?\?>|<.*?>', '', text, flags=re.DOTALL)
         text = text.strip()
 
         # STAGE 2: Contextual Parser & Fountain Formatter
-        print("    - Step B: Parsing, Normalizing, and Formatting with Hardened Parser...")
+        log.debug("    - Step B: Parsing, Normalizing, and Formatting with Hardened Parser...")
         final_lines = []
         scene_counter = 1
         last_line_type = 'START'
@@ -165,12 +159,13 @@ class AIScriptCrafter03ScreenplayBible_Akki:
                 last_line_type = 'ACTION'
         
         # STAGE 3: Final Assembly
-        print("    - Step C: Final assembly complete.")
+        log.debug("    - Step C: Final assembly complete.")
         final_script = "\n".join(final_lines)
         
         return final_script.strip()
 
-    def generate_script(self, llm_model, story_text, world_bible, character_bible, beat_sheet, prompt_stage_1, prompt_stage_2, prompt_stage_3, cinematic_style, max_tokens, temperature, top_p, top_k, seed):
+    @metrics_node("ScriptCrafter-P3-Bible")
+    def generate_script(self, llm_model, story_text, world_bible, character_bible, beat_sheet, prompt_stage_1, prompt_stage_2, prompt_stage_3, cinematic_style, max_tokens, temperature, top_p, top_k, seed, use_llm_cache=True, context_overflow="trim"):
         screenplay, full_llm_process_log, scene_breakdown = "", "", ""
         try:
             if not hasattr(llm_model, 'create_completion'): raise ValueError("LLM Model not provided.")
@@ -181,22 +176,25 @@ class AIScriptCrafter03ScreenplayBible_Akki:
                 "cinematic_style": cinematic_style
             }
 
-            print("[ScriptCraft-P3-v16.8] Starting 3-Stage LLM creative process...")
-            stage1_prompt_template = read_prompt_file("stage1", prompt_stage_1)
-            stage1_prompt = stage1_prompt_template.format(**source_context)
-            stage1_output = llm_model.create_completion(prompt=stage1_prompt, max_tokens=max_tokens, temperature=temperature, top_p=top_p, top_k=top_k, seed=seed if seed > 0 else -1, stop=["</response>"])
+            log.info("[ScriptCraft-P3-v16.9] Starting 3-Stage LLM creative process...")
+            # One budget for all three stages, so a source summarized for Stage 1 is reused by Stages 2 and 3.
+            budget = PromptBudget(llm_model, max_tokens)
+            stage_fields = (*self.SOURCE_PRIORITIES, "cinematic_style")
+            stage1_prompt_template = PROMPTS.get("stage1", prompt_stage_1, fields=stage_fields)
+            stage2_prompt_template = PROMPTS.get("stage2", prompt_stage_2, fields=(*stage_fields, "previous_draft"))
+            stage3_prompt_template = PROMPTS.get("stage3", prompt_stage_3, fields=(*stage_fields, "previous_draft"))
+            stage1_prompt = self._pack_stage_prompt(budget, "Stage 1", stage1_prompt_template, source_context, context_overflow)
+            with metrics_scope(stage="Stage 1"): stage1_output = create_completion_streaming(llm_model, prompt=stage1_prompt, end_tags=MAIN_OUTPUT_END_TAGS, max_tokens=max_tokens, temperature=temperature, top_p=top_p, top_k=top_k, seed=seed if seed > 0 else -1, stop=["</response>"], use_cache=use_llm_cache)
             report_token_usage("ScriptCraft-P3 Stage 1", stage1_output)
             stage1_draft = extract_tagged_content(stage1_output['choices'][0]['text'].strip(), "main_output")
             
-            stage2_prompt_template = read_prompt_file("stage2", prompt_stage_2)
-            stage2_prompt = stage2_prompt_template.format(previous_draft=stage1_draft, **source_context)
-            stage2_output = llm_model.create_completion(prompt=stage2_prompt, max_tokens=max_tokens, temperature=temperature, top_p=top_p, top_k=top_k, seed=seed if seed > 0 else -1, stop=["</response>"])
+            stage2_prompt = self._pack_stage_prompt(budget, "Stage 2", stage2_prompt_template, source_context, context_overflow, previous_draft=stage1_draft)
+            with metrics_scope(stage="Stage 2"): stage2_output = create_completion_streaming(llm_model, prompt=stage2_prompt, end_tags=MAIN_OUTPUT_END_TAGS, max_tokens=max_tokens, temperature=temperature, top_p=top_p, top_k=top_k, seed=seed if seed > 0 else -1, stop=["</response>"], use_cache=use_llm_cache)
             report_token_usage("ScriptCraft-P3 Stage 2", stage2_output)
             stage2_draft = extract_tagged_content(stage2_output['choices'][0]['text'].strip(), "main_output")
             
-            stage3_prompt_template = read_prompt_file("stage3", prompt_stage_3)
-            stage3_prompt = stage3_prompt_template.format(previous_draft=stage2_draft, **source_context)
-            stage3_output = llm_model.create_completion(prompt=stage3_prompt, max_tokens=max_tokens, temperature=temperature, top_p=top_p, top_k=top_k, seed=seed if seed > 0 else -1, stop=["</response>"])
+            stage3_prompt = self._pack_stage_prompt(budget, "Stage 3", stage3_prompt_template, source_context, context_overflow, previous_draft=stage2_draft)
+            with metrics_scope(stage="Stage 3"): stage3_output = create_completion_streaming(llm_model, prompt=stage3_prompt, end_tags=MAIN_OUTPUT_END_TAGS, max_tokens=max_tokens, temperature=temperature, top_p=top_p, top_k=top_k, seed=seed if seed > 0 else -1, stop=["</response>"], use_cache=use_llm_cache)
             report_token_usage("ScriptCraft-P3 Stage 3", stage3_output)
             final_draft_from_llm = extract_tagged_content(stage3_output['choices'][0]['text'].strip(), "main_output")
             
@@ -205,7 +203,7 @@ class AIScriptCrafter03ScreenplayBible_Akki:
             screenplay = self._master_post_processor(final_draft_from_llm, character_bible)
             full_llm_process_log += f"--- FINAL PROCESSED SCRIPT (Fountain Compliant) ---\n{screenplay}\n\n"
 
-            print("[ScriptCraft-P3-v16.8] Stage 5: Generating scene breakdown...")
+            log.info("[ScriptCraft-P3-v16.9] Stage 5: Generating scene breakdown...")
             breakdown_list = []
             scene_heading_pattern = re.compile(r"^(\d+)\.\s*(INT|EXT)\.\s(.*?)(?:\s-\s(.*))?$", re.MULTILINE)
             for match in scene_heading_pattern.finditer(screenplay):
@@ -214,16 +212,16 @@ class AIScriptCrafter03ScreenplayBible_Akki:
                 time_of_day = time_of_day.strip() if time_of_day else "DAY"
                 breakdown_list.append(f"<Scene Number ({scene_num})> <Scene Type ({scene_type})> <{scene_name}> <Time of Day ({time_of_day})>")
             scene_breakdown = "\n".join(breakdown_list)
-            print("    - Scene breakdown generated successfully.")
+            log.debug("    - Scene breakdown generated successfully.")
 
         except Exception as e:
-            screenplay = f"ERROR: An exception occurred in ScriptCraft P3 v16.8. Check console.\n\nDetails: {e}"
+            screenplay = f"ERROR: An exception occurred in ScriptCraft P3 v16.9. Check console.\n\nDetails: {e}"
             scene_breakdown = "ERROR: Could not generate scene breakdown."
-            print(f"[ScriptCraft-P3-v16.8] Error:"); traceback.print_exc()
+            log.exception("[ScriptCraft-P3-v16.9] Error:")
 
         return (screenplay, scene_breakdown, full_llm_process_log)
 
 
 NODE_CLASS_MAPPINGS = {"AIScriptCrafter03ScreenplayBible-Akki": AIScriptCrafter03ScreenplayBible_Akki}
-NODE_DISPLAY_NAME_MAPPINGS = {"AIScriptCrafter03ScreenplayBible-Akki": "AI ScriptCrafter 03 (Bible) v16.8 - Akki"}
+NODE_DISPLAY_NAME_MAPPINGS = {"AIScriptCrafter03ScreenplayBible-Akki": "AI ScriptCrafter 03 (Bible) v16.9 - Akki"}
 # --- END OF FILE Akki_ScriptCrafter_P3_Bible.py ---
\ No newline at end of file
@@ -1,40 +1,19 @@
 # --- START OF FILE Akki_Set_Lookdev_Bible.py ---
 
-# Node: AI Set Lookdev (Bible) v6.0 (Time-Only Variation)
+# Node: AI Set Lookdev (Bible) v6.1 (Time-Only Variation)
 
-import traceback
 import re
 import random
 import json
 import os
-from .shared_utils import report_token_usage, extract_tagged_content, get_wildcard_list
-
-# --- HELPER FUNCTIONS for Self-Contained Prompt Loading ---
-NODE_DIR = os.path.dirname(__file__)
-PROMPTS_ROOT_DIR = os.path.join(NODE_DIR, "_prompts", "LookdevSET")
-
-def get_prompt_files_from_stage_dir(stage_folder):
-    stage_dir = os.path.join(PROMPTS_ROOT_DIR, stage_folder)
-    if not os.path.isdir(stage_dir):
-        print(f"[SetLookdev-v6.0] Creating prompt directory: {stage_dir}")
-        os.makedirs(stage_dir, exist_ok=True)
-        placeholder_path = os.path.join(stage_dir, "placeholder.txt")
-        if not os.path.exists(placeholder_path):
-             with open(placeholder_path, 'w', encoding='utf-8') as f: f.write(f"Add your {stage_folder} prompt .txt files here.")
-        return ["placeholder.txt"]
-    try:
-        files = [f for f in os.listdir(stage_dir) if f.endswith('.txt')]
-        return files if files else ["No .txt files found"]
-    except Exception as e:
-        print(f"[SetLookdev-v6.0] Error scanning prompt directory {stage_dir}: {e}")
-        return ["Error loading prompts"]
-
-def read_prompt_file(stage_folder, filename):
-    filepath = os.path.join(PROMPTS_ROOT_DIR, stage_folder, filename)
-    if not os.path.exists(filepath):
-        raise FileNotFoundError(f"Prompt file not found: {filepath}")
-    with open(filepath, 'r', encoding='utf-8') as f:
-        return f.read()
+from .shared_utils import report_token_usage, extract_tagged_content, get_wildcard_list, run_completion_batch, raise_batch_failures, ProcessLog, PROMPTS
+from .llm_metrics import metrics_node, metrics_scope
+from .akki_logging import get_logger
+
+log = get_logger(__name__)
+
+# Prompt templates live in _prompts/LookdevSET/stage1-2 (see PromptRegistry).
+PROMPT_FOLDER = "LookdevSET"
 
 def sanitize_filename(name):
     sanitized = re.sub(r'[<>:"/\\|?*]', '', name)
@@ -46,7 +25,9 @@ class AISetLookdevBible_Akki:
     AI Set Lookdev (Bible) v6.0. The definitive "Time-Only Variation" engine.
     This node generates a master lookdev, then generates complete, rewritten
     prompts for all time-of-day variations provided by the Asset Selector's
-    clean JSON output.
+    clean JSON output. v6.1 writes the master prose and every variation to
+    a process log file in the project folder and returns its path and a
+    summary as `full_llm_process_log`.
     """
 
     @classmethod
@@ -58,8 +39,8 @@ class AISetLookdevBible_Akki:
                 "screenplay": ("STRING", {"forceInput": True}),
                 "set_hierarchy_json": ("STRING", {"forceInput": True}),
                 "selected_main_set_name": ("STRING", {"forceInput": True}),
-                "prompt_master_generator": (get_prompt_files_from_stage_dir("stage1"),),
-                "prompt_variation_generator": (get_prompt_files_from_stage_dir("stage2"),),
+                "prompt_master_generator": (PROMPTS.list(f"{PROMPT_FOLDER}/stage1", "SetLookdev-v6.1"),),
+                "prompt_variation_generator": (PROMPTS.list(f"{PROMPT_FOLDER}/stage2", "SetLookdev-v6.1"),),
                 "debug_mode": (["Off", "Master Prose Only"],),
                 "temperature": ("FLOAT", {"default": 0.70, "step": 0.01}),
                 "top_p": ("FLOAT", {"default": 0.95, "step": 0.01}),
@@ -70,6 +51,8 @@ class AISetLookdevBible_Akki:
             "optional": {
                 "architectural_style": (["Default", "Random"] + get_wildcard_list("set_architectural_styles.txt"),),
                 "primary_material": (["Default", "Random"] + get_wildcard_list("set_materials_man_made.txt"),),
+                "max_concurrency": ("INT", {"default": 4, "min": 1, "max": 32}),
+                "project_path": ("STRING", {"forceInput": True}),
             }
         }
 
@@ -115,19 +98,26 @@ class AISetLookdevBible_Akki:
 
         return "\n\n".join(relevant_scenes_text) if relevant_scenes_text else f"No specific scene description found for time: {time_of_day}."
 
+    @metrics_node("SetLookdevBible")
     def generate_lookdev(self, llm_model, world_bible, screenplay, set_hierarchy_json, selected_main_set_name,
                          prompt_master_generator, prompt_variation_generator, debug_mode, **kwargs):
         
-        full_llm_process_log = ""
+        process_log = None
         variation_set_names_list, variation_set_prompts_list = [], []
         error_tuple = ("ERROR", "Error", [], [], "Check console for errors.", 0)
         
         try:
             if not hasattr(llm_model, 'create_completion'): raise ValueError("LLM Model invalid.")
             if not selected_main_set_name or "ERROR:" in selected_main_set_name: return error_tuple
+            # Both templates are loaded and checked before the first LLM call.
+            master_template = PROMPTS.get(f"{PROMPT_FOLDER}/stage1", prompt_master_generator,
+                                          fields=("set_name", "deterministic_set_dressing", "story_context", "world_bible", "creative_attributes"))
+            variation_template = PROMPTS.get(f"{PROMPT_FOLDER}/stage2", prompt_variation_generator,
+                                             fields=("master_prose_reference", "variation_target_name", "time_of_day", "specific_story_context", "world_bible"))
+            process_log = ProcessLog("SetLookdev", kwargs.get('project_path'), label=selected_main_set_name)
 
             # --- PART 1: MASTER LOOKDEV GENERATION ---
-            print(f"[SetLookdev-v6.0] Part 1: Generating Master Prose for '{selected_main_set_name}'...")
+            log.info("[SetLookdev-v6.1] Part 1: Generating Master Prose for '%s'...", selected_main_set_name)
             
             json_data = json.loads(set_hierarchy_json)
             master_set_name = json_data.get("main_set", selected_main_set_name)
@@ -140,30 +130,29 @@ class AISetLookdevBible_Akki:
                       "Primary Material": self._resolve_attribute(kwargs.get('primary_material'), "set_materials_man_made.txt")}
             creative_attributes_str = "\n".join([f"- {key}: {value}" for key, value in attrs.items() if value]) or "None specified."
             
-            master_template = read_prompt_file("stage1", prompt_master_generator)
             master_prompt_str = master_template.format(set_name=master_set_name, deterministic_set_dressing=all_dressing_items,
                                                    story_context=master_story_context, world_bible=world_bible,
                                                    creative_attributes=creative_attributes_str)
             
-            master_output = llm_model.create_completion(prompt=master_prompt_str, max_tokens=2048, temperature=0.6)
+            with metrics_scope(stage="Master", item=master_set_name): master_output = llm_model.create_completion(prompt=master_prompt_str, max_tokens=2048, temperature=0.6)
             raw_master_prose = master_output['choices'][0]['text'].strip()
-            full_llm_process_log += f"--- MASTER PROSE (RAW) ---\n{raw_master_prose}\n\n"
+            process_log.write("MASTER PROSE (RAW)", raw_master_prose)
 
             filtered_master_prose = self._extract_first_and_last_paragraphs(raw_master_prose)
             sanitized_master_name = sanitize_filename(master_set_name)
             if debug_mode == "Master Prose Only":
-                return (filtered_master_prose, sanitized_master_name, [], [], full_llm_process_log, 0)
+                return (filtered_master_prose, sanitized_master_name, [], [], process_log.summary(), 0)
 
             # --- PART 2: TIME-OF-DAY VARIATION LOOP ---
-            print(f"[SetLookdev-v6.0] Part 2: Generating Time-of-Day Variations...")
-            variation_template = read_prompt_file("stage2", prompt_variation_generator)
+            log.info("[SetLookdev-v6.1] Part 2: Generating Time-of-Day Variations...")
             
             times_of_day = json_data.get("times_of_day", ["UNKNOWN"])
             
+            variation_batch = []
             for time_of_day in times_of_day:
                 
                 variation_target_name = f"{master_set_name} - {time_of_day}"
-                print(f"  - Generating: {variation_target_name}")
+                log.debug("  - Preparing: %s", variation_target_name)
                 
                 # Get the story context specific to this time of day
                 specific_context = self._get_scene_context_by_time(screenplay, master_set_name, time_of_day)
@@ -176,22 +165,27 @@ class AISetLookdevBible_Akki:
                     world_bible=world_bible
                 )
                 
-                variation_output = llm_model.create_completion(prompt=variation_prompt_str, max_tokens=2048, temperature=0.7)
-                final_variation_prompt = variation_output['choices'][0]['text'].strip()
-                
                 variation_set_names_list.append(variation_target_name)
+                variation_batch.append(dict(prompt=variation_prompt_str, max_tokens=2048, temperature=0.7, metrics_item=variation_target_name))
+
+            with metrics_scope(stage="Variation"): variation_outputs = run_completion_batch(llm_model, variation_batch, max_concurrency=kwargs.get('max_concurrency', 4))
+            raise_batch_failures(variation_outputs, "Variation")
+            for variation_target_name, variation_output in zip(variation_set_names_list, variation_outputs):
+                final_variation_prompt = variation_output['choices'][0]['text'].strip()
                 variation_set_prompts_list.append(final_variation_prompt)
-                full_llm_process_log += f"--- VARIATION: {variation_target_name} ---\n{final_variation_prompt}\n\n"
+                process_log.write(f"VARIATION: {variation_target_name}", final_variation_prompt)
 
-            return (filtered_master_prose, sanitized_master_name, variation_set_names_list, variation_set_prompts_list, full_llm_process_log, len(variation_set_names_list))
+            return (filtered_master_prose, sanitized_master_name, variation_set_names_list, variation_set_prompts_list, process_log.summary(), len(variation_set_names_list))
 
         except Exception as e:
-            print(f"[SetLookdev-v6.0] Error:"); traceback.print_exc()
+            log.exception("[SetLookdev-v6.1] Error:")
             error_msg = f"ERROR: {e}"
             return (error_msg, "Error", [], [], str(e), 0)
+        finally:
+            if process_log: process_log.close()
 
 # Using original names to ensure the node loads
 NODE_CLASS_MAPPINGS = {"AISetLookdevBible-Akki": AISetLookdevBible_Akki}
-NODE_DISPLAY_NAME_MAPPINGS = {"AISetLookdevBible-Akki": "AI Set Lookdev (Bible) v6.0 - Akki"}
+NODE_DISPLAY_NAME_MAPPINGS = {"AISetLookdevBible-Akki": "AI Set Lookdev (Bible) v6.1 - Akki"}
 
 # --- END OF FILE Akki_Set_Lookdev_Bible.py ---
\ No newline at end of file
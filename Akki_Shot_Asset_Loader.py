@@ -2,13 +2,18 @@
 
 import os
 import re
-import traceback
 import folder_paths
 import csv
 import io
-import torch
-import numpy as np
-from PIL import Image
+from .akki_imports import lazy_import
+from .akki_logging import get_logger
+
+log = get_logger(__name__)
+
+# Imported when the node first loads an image.
+torch = lazy_import("torch")
+np = lazy_import("numpy")
+Image = lazy_import("PIL.Image")
 
 def sanitize_for_filename(name):
     """
@@ -129,7 +134,7 @@ class ShotAssetLoader_Akki:
             set_prompt = self._load_text(set_txt_path)
             
             if not characters_in_shot:
-                print(f"[Shot Asset Loader] No characters in shot {shot_index}.")
+                log.debug("[Shot Asset Loader] No characters in shot %s.", shot_index)
             else:
                 for char_name in characters_in_shot:
                     char_names_list.append(char_name)
@@ -144,12 +149,12 @@ class ShotAssetLoader_Akki:
                     char_prompts_list.append(self._load_text(char_txt_path))
 
             if error_log:
-                print(f"[Shot Asset Loader] Notice: Encountered the following issues:\n" + "\n".join(f"- {e}" for e in error_log))
+                log.warning("[Shot Asset Loader] Notice: Encountered the following issues:\n%s", "\n".join(f"- {e}" for e in error_log))
 
             final_char_images = char_images_list if char_images_list else [torch.zeros(1, 64, 64, 3, dtype=torch.float32)]
             
         except Exception as e:
-            traceback.print_exc()
+            log.exception("[Shot Asset Loader] Error:")
             error_text = f"ERROR: A critical exception occurred. Check console. Details: {e}"
             dummy_img = torch.zeros(1, 64, 64, 3, dtype=torch.float32)
             return ([dummy_img], dummy_img, [error_text], error_text, ["Error"])
@@ -4,10 +4,12 @@
 
 import csv
 import io
-import traceback
 import re
 import json
 from collections import defaultdict
+from .akki_logging import get_logger
+
+log = get_logger(__name__)
 
 class ShotSelector_Akki:
     """
@@ -149,7 +151,7 @@ class ShotSelector_Akki:
                         scene_start_indices, scene_shot_counts, unique_set_indices, total_shot_count_list)
 
         except Exception as e:
-            traceback.print_exc()
+            log.exception("[ShotSelector] Error:")
             return error_tuple
 
 # --- Mappings for this file ---
@@ -1,10 +1,13 @@
 # Node: AI Story Writer v5.2 (Prompt Pathing Hotfix)
 
 import re
-import traceback
 import os
-from llama_cpp import Llama
-from .shared_utils import get_wildcard_list, report_token_usage, extract_tagged_content
+import logging
+from .shared_utils import get_wildcard_list, report_token_usage, extract_tagged_content, PROMPTS
+from .llm_metrics import metrics_node
+from .akki_logging import get_logger, log_payload
+
+log = get_logger(__name__)
 
 class StoryWriter_Akki:
     """
@@ -13,37 +16,13 @@ class StoryWriter_Akki:
     It retains the v5.1 architecture for robust pathing and orthogonal inputs.
     """
     
-    # --- v5.2: Simplified Prompt Directory Logic ---
-    PROMPTS_DIR = os.path.join(os.path.dirname(__file__), "_prompts", "story")
+    # Prompt templates live in _prompts/story (see PromptRegistry).
+    PROMPT_FOLDER = "story"
 
     @classmethod
     def _get_prompt_files(cls):
-        """Dynamically lists .txt files from the node's designated prompt directory."""
-        if not os.path.isdir(cls.PROMPTS_DIR):
-            try:
-                os.makedirs(cls.PROMPTS_DIR, exist_ok=True)
-                placeholder_path = os.path.join(cls.PROMPTS_DIR, "placeholder.txt")
-                if not os.path.exists(placeholder_path):
-                     with open(placeholder_path, 'w', encoding='utf-8') as f:
-                         f.write("Add your story prompt .txt files here.")
-                return ["placeholder.txt"]
-            except Exception as e:
-                print(f"[StoryWriter-Akki v5.2] Error creating prompt directory {cls.PROMPTS_DIR}: {e}")
-                return ["Error creating directory"]
-        try:
-            files = [f for f in os.listdir(cls.PROMPTS_DIR) if f.endswith('.txt')]
-            return files if files else ["No .txt files found"]
-        except Exception as e:
-            print(f"[StoryWriter-Akki v5.2] Error scanning prompt directory {cls.PROMPTS_DIR}: {e}")
-            return ["Error loading prompts"]
-
-    def _read_prompt_file(self, filename):
-        """Reads the content of a specific prompt file from the node's prompt directory."""
-        filepath = os.path.join(self.PROMPTS_DIR, filename)
-        if not os.path.exists(filepath):
-            raise FileNotFoundError(f"Prompt file not found: {filepath}")
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return f.read()
+        """Lists the .txt templates in the node's prompt folder."""
+        return PROMPTS.list(cls.PROMPT_FOLDER, "StoryWriter-Akki v5.2")
 
     # --- v5.1: Platform-agnostic wildcard path helper ---
     WILDCARD_DIR = os.path.join(os.path.dirname(__file__), "wildcards")
@@ -89,6 +68,9 @@ class StoryWriter_Akki:
                 "seed": ("INT", {"default": 1234}),
                 "keep_model_loaded": ("BOOLEAN", {"default": True}),
                 "verbose": ("BOOLEAN", {"default": True}),
+            },
+            "optional": {
+                "use_llm_cache": ("BOOLEAN", {"default": True}),
             }
         }
 
@@ -97,12 +79,13 @@ class StoryWriter_Akki:
     FUNCTION = "generate_story"
     CATEGORY = "AkkiNodes/LLM"
 
+    @metrics_node("StoryWriter")
     def generate_story(self, llm_model, story_prompt_file, story_idea,
                          protagonist_name, protagonist_gender, protagonist_identity, protagonist_role, protagonist_age,
                          antagonist_name, antagonist_gender, antagonist_identity, antagonist_role, antagonist_age,
                          period, location, core_conflict, story_arc, genre, tone, format,
                          word_count_limit, max_tokens, temperature, top_p, top_k, seed,
-                         keep_model_loaded, verbose):
+                         keep_model_loaded, verbose, use_llm_cache=True):
         story_text = ""
         final_llm_prompt = ""
         
@@ -145,20 +128,21 @@ class StoryWriter_Akki:
             if word_count_limit > 0:
                 narrative_parameters_for_ai += f"\n- **Length:** The target length is approximately {word_count_limit} words."
             
-            storytelling_meta_prompt = self._read_prompt_file(story_prompt_file) # v5.2: Simplified call
+            storytelling_meta_prompt = PROMPTS.get(self.PROMPT_FOLDER, story_prompt_file, fields=("story_idea", "narrative_parameters"))
 
             final_llm_prompt = storytelling_meta_prompt.format(
                 story_idea=story_idea.strip(),
                 narrative_parameters=narrative_parameters_for_ai
             ).strip()
 
-            if verbose:
-                print(f"[StoryWriter-Akki v5.2] Full LLM prompt:\n{final_llm_prompt}")
+            # Truncated and sampled per AKKI_LOG_PAYLOAD_* / the Log Settings node.
+            log_payload(log, "[StoryWriter-Akki v5.2] Full LLM prompt", final_llm_prompt, level=logging.INFO if verbose else logging.DEBUG)
 
             output = llm_model.create_completion(
                 prompt=final_llm_prompt, max_tokens=max_tokens, temperature=temperature,
                 top_p=top_p, top_k=top_k, seed=seed if seed > 0 else -1,
-                stop=["</response>", "//---END_MAIN_OUTPUT--//"]
+                stop=["</response>", "//---END_MAIN_OUTPUT--//"],
+                use_cache=use_llm_cache
             )
             report_token_usage("StoryWriter-Akki", output)
             
@@ -170,7 +154,7 @@ class StoryWriter_Akki:
                 LLMLoader_Akki.clear_cache()
         
         except Exception as e:
-            traceback.print_exc()
+            log.exception("[StoryWriter-Akki v5.2] Error:")
             story_text = f"ERROR: An exception occurred. Check console for details.\n\nDetails: {e}"
 
         protagonist_type_out = " ".join(filter(None, [protagonist_gender, protagonist_identity, protagonist_role]))
@@ -1,8 +1,11 @@
 # Node: AI Video Prompt Engineer (Pro) v2.4
 
-import traceback
 import re
-from .shared_utils import report_token_usage, get_wildcard_list
+from .shared_utils import report_token_usage, get_wildcard_list, llm_request_scope
+from .llm_metrics import metrics_node, metrics_scope
+from .akki_logging import get_logger
+
+log = get_logger(__name__)
 
 class AIVideoPromptEngineerPro_Akki:
     """
@@ -113,6 +116,9 @@ The camera performs a slow dolly-in, focusing on the girl's determined expressio
                 "temperature": ("FLOAT", {"default": 0.8, "step": 0.01}),
                 "seed": ("INT", {"default": 1234}),
                 "max_tokens": ("INT", {"default": 1024, "min": 256, "max": 4096}),
+            },
+            "optional": {
+                "use_llm_cache": ("BOOLEAN", {"default": True}),
             }
         }
 
@@ -125,6 +131,7 @@ The camera performs a slow dolly-in, focusing on the girl's determined expressio
         match = re.search(r"--- ACTION/CAMERA ---\n([\s\S]*?)(\n--- SET LOOKDEV ---|\n--- CHARACTERS ---|$)", dossier_text)
         return match.group(1).strip() if match else dossier_text
 
+    @metrics_node("VideoPromptEngineer-Pro")
     def generate_prompt(self, llm_model, master_dossier, shot_details, camera_movement, motion_speed, **kwargs):
         video_prompt, full_llm_process_log = "", ""
         try:
@@ -136,7 +143,7 @@ The camera performs a slow dolly-in, focusing on the girl's determined expressio
 
             # --- STAGE 1: Action Analyst ---
             stage1_prompt = self.STAGE_1_PROMPT.format(action_camera_data=action_camera_data)
-            stage1_output = llm_model.create_completion(prompt=stage1_prompt, max_tokens=256, temperature=0.2)
+            with metrics_scope(stage="Analyst"), llm_request_scope(tier="mechanical"): stage1_output = llm_model.create_completion(prompt=stage1_prompt, max_tokens=256, temperature=0.2, use_cache=kwargs.get('use_llm_cache', True))
             core_action = stage1_output['choices'][0]['text'].strip()
             full_llm_process_log += f"--- STAGE 1: ANALYST RESPONSE ---\n{core_action}\n\n"
 
@@ -145,26 +152,28 @@ The camera performs a slow dolly-in, focusing on the girl's determined expressio
                 core_action=core_action, master_dossier=master_dossier, shot_details=shot_details,
                 camera_movement=camera_movement, motion_speed=motion_speed
             )
-            stage2_output = llm_model.create_completion(prompt=stage2_prompt, max_tokens=kwargs.get('max_tokens', 1024),
-                                                        temperature=kwargs.get('temperature', 0.8),
-                                                        seed=kwargs.get('seed', 1234) if kwargs.get('seed', 1234) > 0 else -1,
-                                                        stop=["</response>"])
+            with metrics_scope(stage="V-DOP"):
+                stage2_output = llm_model.create_completion(prompt=stage2_prompt, max_tokens=kwargs.get('max_tokens', 1024),
+                                                            temperature=kwargs.get('temperature', 0.8),
+                                                            seed=kwargs.get('seed', 1234) if kwargs.get('seed', 1234) > 0 else -1,
+                                                            stop=["</response>"], use_cache=kwargs.get('use_llm_cache', True))
             verbose_prompt = stage2_output['choices'][0]['text'].strip()
             full_llm_process_log += f"--- STAGE 2: V-DOP RESPONSE (VERBOSE) ---\n{verbose_prompt}\n\n"
 
             # --- STAGE 3: AI Editor ---
-            print("[VideoPromptEngineer-Pro v2.4] Stage 3: Condensing verbose prompt...")
+            log.info("[VideoPromptEngineer-Pro v2.4] Stage 3: Condensing verbose prompt...")
             stage3_prompt = self.STAGE_3_PROMPT.format(verbose_prompt=verbose_prompt)
-            stage3_output = llm_model.create_completion(prompt=stage3_prompt, max_tokens=kwargs.get('max_tokens', 1024),
-                                                        temperature=0.4, # Lower temp for precise editing
-                                                        seed=kwargs.get('seed', 1234) if kwargs.get('seed', 1234) > 0 else -1,
-                                                        stop=["</response>"])
+            with metrics_scope(stage="Editor"):
+                stage3_output = llm_model.create_completion(prompt=stage3_prompt, max_tokens=kwargs.get('max_tokens', 1024),
+                                                            temperature=0.4, # Lower temp for precise editing
+                                                            seed=kwargs.get('seed', 1234) if kwargs.get('seed', 1234) > 0 else -1,
+                                                            stop=["</response>"], use_cache=kwargs.get('use_llm_cache', True))
             report_token_usage("VideoPromptEngineer-Pro (Editor)", stage3_output)
             video_prompt = stage3_output['choices'][0]['text'].strip()
             full_llm_process_log += f"--- STAGE 3: EDITOR RESPONSE (FINAL) ---\n{video_prompt}"
 
         except Exception as e:
-            traceback.print_exc()
+            log.exception("[VideoPromptEngineer-Pro v2.4] Error:")
             video_prompt = f"ERROR: An exception occurred. Check console. Details: {e}"
 
         return (video_prompt, full_llm_process_log)
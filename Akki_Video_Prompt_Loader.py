@@ -2,8 +2,10 @@
 
 import os
 import re
-import traceback
 import folder_paths
+from .akki_logging import get_logger
+
+log = get_logger(__name__)
 
 class VideoPromptLoader_Akki:
     """
@@ -52,7 +54,7 @@ class VideoPromptLoader_Akki:
             latest_file = sorted(matching_files, reverse=True)[0]
             file_path = os.path.join(data_dir, latest_file)
             
-            print(f"[Video Prompt Loader] Found latest file for Shot '{shot_name}': {latest_file}")
+            log.info("[Video Prompt Loader] Found latest file for Shot '%s': %s", shot_name, latest_file)
             
             with open(file_path, 'r', encoding='utf-8') as f:
                 video_prompt = f.read()
@@ -60,7 +62,7 @@ class VideoPromptLoader_Akki:
             return (video_prompt,)
 
         except Exception as e:
-            traceback.print_exc()
+            log.exception("[Video Prompt Loader] Error:")
             return (f"ERROR: Failed to load Video Prompt file. Check console. Details: {e}",)
 
 NODE_CLASS_MAPPINGS = {"VideoPromptLoader-Akki": VideoPromptLoader_Akki}
@@ -3,6 +3,7 @@
 import importlib
 import os
 import traceback
+from .akki_imports import ImportProfiler
 
 # --- ANSI Color Codes for Console Output ---
 C_RED = '\033[91m'
@@ -11,11 +12,20 @@ C_YELLOW = '\033[93m'
 C_END = '\033[0m'
 
 print(f"{C_GREEN}--- Loading AkkiNodes Suite ---{C_END}")
+import_profiler = ImportProfiler()
+
+# Shared by most nodes; loaded first so their import time is not charged to whichever node comes first.
+shared_files = ["akki_logging", "llm_metrics", "gguf_index", "shared_utils"]
 
 node_files = [
     # LLM Core
     "Akki_LLM_Loader",
     "Akki_LLM_Loader_LMStudio",
+    "Akki_LLM_Loader_LMStudio_Pool",
+    "Akki_LLM_Cassette",
+    "Akki_LLM_Priority",
+    "Akki_LLM_Router",
+    "Akki_Log_Settings",
     
     # Narrative Pipeline ("Narrative Bible" Architecture)
     "Akki_Story_Composer",
@@ -66,11 +76,18 @@ node_files = [
 NODE_CLASS_MAPPINGS = {}
 NODE_DISPLAY_NAME_MAPPINGS = {}
 
+for module_name in shared_files:
+    try:
+        with import_profiler.measure(module_name): importlib.import_module(f".{module_name}", __name__)
+    except Exception as e:
+        print(f"  {C_RED}[!] FAILED to load {module_name}.py{C_END}")
+        print(f"  {C_YELLOW}[!] Error: {e}{C_END}")
+
 # --- Dynamic Import and Merging ---
 for module_name in node_files:
     if module_name.startswith("#"): continue
     try:
-        module = importlib.import_module(f".{module_name}", __name__)
+        with import_profiler.measure(module_name): module = importlib.import_module(f".{module_name}", __name__)
         if hasattr(module, "NODE_CLASS_MAPPINGS"):
             NODE_CLASS_MAPPINGS.update(module.NODE_CLASS_MAPPINGS)
         if hasattr(module, "NODE_DISPLAY_NAME_MAPPINGS"):
@@ -88,6 +105,21 @@ for module_name in node_files:
         print(f"  {C_YELLOW}[!] Error: {e}{C_END}")
         traceback.print_exc()
 
+# --- Metrics Route (/akkinodes/metrics) ---
+try:
+    from .llm_metrics import register_routes
+    if register_routes():
+        print(f"  {C_GREEN}[+] LLM metrics available at /akkinodes/metrics (JSON, or ?format=prometheus){C_END}")
+except Exception as e:
+    print(f"  {C_YELLOW}[!] Could not register the LLM metrics route: {e}{C_END}")
+
+# --- Startup Import Profile (AKKI_PROFILE_IMPORTS=1 lists every module) ---
+for line in import_profiler.format_report(full=os.environ.get("AKKI_PROFILE_IMPORTS", "0") not in ("", "0")):
+    print(f"  {line}")
+for record in import_profiler.over_budget():
+    reason = f"imports {', '.join(record['pulled_in'])} at load time" if record["pulled_in"] else f"over the {import_profiler.budget_ms:.0f}ms import budget"
+    print(f"  {C_YELLOW}[!] {record['module']}.py took {record['ms']:.0f}ms ({reason}){C_END}")
+
 WEB_DIRECTORY = "js"
 print(f"{C_GREEN}--- AkkiNodes Suite loading complete. Found {len(NODE_CLASS_MAPPINGS)} nodes. ---{C_END}")
 __all__ = ['NODE_CLASS_MAPPINGS', 'NODE_DISPLAY_NAME_MAPPINGS', 'WEB_DIRECTORY']
\ No newline at end of file
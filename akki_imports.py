@@ -0,0 +1,89 @@
+# Deferred imports and the startup import profiler.
+#
+# ComfyUI imports every custom node package at start, so anything a node
+# module imports at the top is paid for on every launch, whether or not
+# the node is ever used. Heavy third-party modules (llama_cpp, openai,
+# httpx, torch, numpy, PIL) are bound with `lazy_import` instead and only
+# imported on their first attribute access, which is when a node first
+# executes. The package __init__ times every module it loads with
+# `ImportProfiler` and reports the slowest ones, and any that pull a heavy
+# package in at import time:
+#   AKKI_PROFILE_IMPORTS=1          print the time of every module
+#   AKKI_IMPORT_BUDGET_MS=150       warn about modules slower than this
+
+import os
+import sys
+import time
+import importlib
+import threading
+from contextlib import contextmanager
+
+# Top-level packages that a node module should never need just to register its nodes.
+HEAVY_PACKAGES = ("llama_cpp", "openai", "httpx", "torch", "numpy", "PIL", "aiohttp")
+
+class LazyModule:
+    """Stands in for a module and imports it on first attribute access."""
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+        self.__dict__["_lock"] = threading.Lock()
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            with self.__dict__["_lock"]:
+                module = self.__dict__["_module"]
+                if module is None: module = self.__dict__["_module"] = importlib.import_module(self._name)
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_module"] is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+def lazy_import(name):
+    """`name` if it is already imported, else a LazyModule that imports it when first used."""
+    module = sys.modules.get(name)
+    return module if module is not None else LazyModule(name)
+
+class ImportProfiler:
+    """
+    Wall time of each module import, and the heavy packages that were
+    imported for the first time while it ran. Times are inclusive, so a
+    module shared by several nodes is charged to the first one that
+    imports it; the package __init__ loads the shared modules first.
+    """
+    def __init__(self, budget_ms=None):
+        self.budget_ms = float(os.environ.get("AKKI_IMPORT_BUDGET_MS", 150) if budget_ms is None else budget_ms)
+        self.records = []
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def measure(self, module_name):
+        already_loaded = {name for name in HEAVY_PACKAGES if name in sys.modules}
+        start = time.perf_counter()
+        try: yield
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            pulled_in = [name for name in HEAVY_PACKAGES if name in sys.modules and name not in already_loaded]
+            self.records.append({"module": module_name, "ms": elapsed_ms, "pulled_in": pulled_in})
+
+    @property
+    def total_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def over_budget(self):
+        return [r for r in self.records if r["ms"] > self.budget_ms or r["pulled_in"]]
+
+    def format_report(self, top=3, full=False):
+        records = sorted(self.records, key=lambda r: r["ms"], reverse=True)
+        lines = [f"Import time {self.total_ms:.0f}ms for {len(self.records)} modules; slowest: "
+                 + ", ".join(f"{r['module']} {r['ms']:.0f}ms" for r in records[:top])]
+        if full: lines += [f"  {r['ms']:8.1f}ms  {r['module']}" + (f"  (imports {', '.join(r['pulled_in'])})" if r["pulled_in"] else "")
+                           for r in records]
+        return lines
@@ -0,0 +1,145 @@
+# Leveled logging for the suite.
+#
+# Every module logs through `get_logger(__name__)`, a child of the
+# "akkinodes" logger, so levels can be set for the whole suite or per
+# module without touching ComfyUI's own logging:
+#   AKKI_LOG_LEVEL=INFO                                 suite default
+#   AKKI_LOG_LEVELS=shared_utils=DEBUG,Akki_Story_Writer=WARNING
+#   AKKI_LOG_PAYLOAD_CHARS=2000                         payload truncation (0 = no limit)
+#   AKKI_LOG_PAYLOAD_SAMPLE=1                           log 1 in N payloads
+# Messages use logging's lazy %-formatting, and request payloads and full
+# prompts go through `log_payload`, which is skipped unless its level is
+# enabled, logs only a sample of them, and truncates what it does log. The
+# `Log Settings` node changes all of this at runtime and can add a
+# rotating JSONL file sink in the project folder.
+
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import itertools
+from logging.handlers import RotatingFileHandler
+
+ROOT_LOGGER = "akkinodes"
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+JSONL_FILE_NAME = "akkinodes.log.jsonl"
+
+_state = {"payload_chars": 2000, "payload_sample": 1, "file_handler": None}
+_configure_lock = threading.Lock()
+_payload_counter = itertools.count()
+
+_startup_warnings = []
+
+def _valid_level(level, source, default=None):
+    """`level` upper-cased if it is one of LOG_LEVELS, else `default` (noted as a warning for the root logger to report)."""
+    name = str(level or "").strip().upper()
+    if name in LOG_LEVELS: return name
+    _startup_warnings.append(f"[AkkiNodes] Ignoring invalid log level {level!r} in {source}; "
+                             f"expected one of {', '.join(LOG_LEVELS)}" + (f", using {default}." if default else "."))
+    return default
+
+def _parse_module_levels(spec, source="AKKI_LOG_LEVELS"):
+    levels = {}
+    for part in (spec or "").replace(";", ",").split(","):
+        if not part.strip(): continue
+        if "=" not in part:
+            _startup_warnings.append(f"[AkkiNodes] Ignoring {part.strip()!r} in {source}; expected module=LEVEL.")
+            continue
+        module, level = (piece.strip() for piece in part.split("=", 1))
+        level = _valid_level(level, f"{source} ({module})")
+        if module and level: levels[module] = level
+    return levels
+
+def _env_int(name, default, minimum):
+    try: return max(minimum, int(os.environ.get(name, default)))
+    except ValueError:
+        _startup_warnings.append(f"[AkkiNodes] Ignoring invalid {name}={os.environ[name]!r}; using {default}.")
+        return default
+
+def _root():
+    root = logging.getLogger(ROOT_LOGGER)
+    if not getattr(root, "_akki_configured", False):
+        with _configure_lock:
+            if not getattr(root, "_akki_configured", False):
+                handler = logging.StreamHandler(sys.stdout)
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                root.addHandler(handler)
+                # ComfyUI configures the root logger; keep the suite's output single and in its own format.
+                root.propagate = False
+                # A bad value in the environment must not keep the suite from loading.
+                root.setLevel(_valid_level(os.environ.get("AKKI_LOG_LEVEL", "INFO"), "AKKI_LOG_LEVEL", default="INFO"))
+                for module, level in _parse_module_levels(os.environ.get("AKKI_LOG_LEVELS")).items():
+                    logging.getLogger(f"{ROOT_LOGGER}.{module}").setLevel(level)
+                _state["payload_chars"] = _env_int("AKKI_LOG_PAYLOAD_CHARS", _state["payload_chars"], 0)
+                _state["payload_sample"] = _env_int("AKKI_LOG_PAYLOAD_SAMPLE", _state["payload_sample"], 1)
+                root._akki_configured = True
+                for warning in _startup_warnings: root.warning(warning)
+                _startup_warnings.clear()
+    return root
+
+def get_logger(module_name):
+    """The suite logger for a module; pass `__name__` (the package prefix is dropped)."""
+    _root()
+    return logging.getLogger(f"{ROOT_LOGGER}.{module_name.rsplit('.', 1)[-1]}")
+
+class LazyPayload:
+    """Renders a payload (JSON-dumped unless it is a string) and truncates it, only when the record is emitted."""
+    __slots__ = ("payload", "max_chars")
+
+    def __init__(self, payload, max_chars=None):
+        self.payload = payload
+        self.max_chars = max_chars
+
+    def __str__(self):
+        text = self.payload if isinstance(self.payload, str) else json.dumps(self.payload, indent=2, ensure_ascii=False, default=str)
+        limit = _state["payload_chars"] if self.max_chars is None else self.max_chars
+        if limit and len(text) > limit: return f"{text[:limit]}... [{len(text) - limit} more chars]"
+        return text
+
+def log_payload(logger, label, payload, level=logging.DEBUG, max_chars=None):
+    """Logs a sampled, truncated payload under `label` if `level` is enabled for `logger`."""
+    if not logger.isEnabledFor(level): return
+    if next(_payload_counter) % _state["payload_sample"]: return
+    logger.log(level, "%s:\n%s", label, LazyPayload(payload, max_chars))
+
+class JsonlFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {"time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+                 "level": record.levelname, "logger": record.name, "message": record.getMessage(), "thread": record.threadName}
+        if record.exc_info: entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def configure_logging(level=None, module_levels=None, payload_chars=None, payload_sample=None, file_dir=None,
+                      file_max_mb=10, file_backups=5):
+    """
+    Applies suite-wide settings. `module_levels` is a {module: level} dict
+    or a "module=LEVEL,..." string; `file_dir` adds (or moves) the rotating
+    JSONL sink, and an empty string removes it. Returns the sink's path.
+    """
+    root = _root()
+    with _configure_lock:
+        if level: root.setLevel(_valid_level(level, "level", default=logging.getLevelName(root.level)))
+        if isinstance(module_levels, str): levels = _parse_module_levels(module_levels, "module_levels")
+        else: levels = {module: _valid_level(lvl, f"module_levels ({module})") for module, lvl in (module_levels or {}).items()}
+        for module, module_level in levels.items():
+            if module_level: logging.getLogger(f"{ROOT_LOGGER}.{module}").setLevel(module_level)
+        for warning in _startup_warnings: root.warning(warning)
+        _startup_warnings.clear()
+        if payload_chars is not None: _state["payload_chars"] = max(0, int(payload_chars))
+        if payload_sample is not None: _state["payload_sample"] = max(1, int(payload_sample))
+        if file_dir is None: return getattr(_state["file_handler"], "baseFilename", None)
+        path = os.path.abspath(os.path.join(file_dir, JSONL_FILE_NAME)) if file_dir else None
+        handler = _state["file_handler"]
+        if handler is not None and handler.baseFilename != path:
+            root.removeHandler(handler)
+            handler.close()
+            handler = _state["file_handler"] = None
+        if path and handler is None:
+            os.makedirs(file_dir, exist_ok=True)
+            handler = RotatingFileHandler(path, maxBytes=int(file_max_mb * 1024 * 1024), backupCount=file_backups, encoding="utf-8", delay=True)
+            handler.setFormatter(JsonlFormatter())
+            root.addHandler(handler)
+            _state["file_handler"] = handler
+        return path
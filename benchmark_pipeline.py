@@ -0,0 +1,124 @@
+# Pipeline throughput benchmark against the mock LLM server.
+#
+# Runs the pre-production chain (AI Cinematographer -> AI QC Supervisor ->
+# Pro Shot List Parser -> AI Shot Duration Calculator) over a synthetic
+# screenplay, with every LLM call answered by mock_llm_server.MockLLMServer.
+# Because the fixtures and the failure pattern are deterministic, two runs
+# with the same flags do the same work, which makes this a reproducible
+# throughput check for the proxies, batching and concurrency settings on a
+# plain Linux box (no GPU, no ComfyUI). Needs the suite's own requirements
+# (openai, httpx). Example:
+#   python benchmark_pipeline.py --scenes 60 --servers 2 --slots 4 --tps 60 --concurrency 8
+
+import os
+import sys
+import io
+import json
+import time
+import argparse
+import contextlib
+import importlib
+import importlib.util
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+PACKAGE_NAME = "akkinodes_benchmark"
+
+def import_suite_module(name):
+    """Imports one suite module without running the package __init__ (which loads every node)."""
+    if PACKAGE_NAME not in sys.modules:
+        spec = importlib.util.spec_from_file_location(PACKAGE_NAME, os.path.join(PACKAGE_DIR, "__init__.py"),
+                                                      submodule_search_locations=[PACKAGE_DIR])
+        sys.modules[PACKAGE_NAME] = importlib.util.module_from_spec(spec)
+    return importlib.import_module(f"{PACKAGE_NAME}.{name}")
+
+def synthetic_screenplay(scenes):
+    locations = ("KITCHEN", "ROOFTOP", "TRAIN STATION", "LIBRARY", "FOREST ROAD", "HARBOUR")
+    parts = []
+    for number in range(1, scenes + 1):
+        prefix = "INT." if number % 2 else "EXT."
+        parts.append(f"{prefix} {locations[number % len(locations)]} - {'DAY' if number % 3 else 'NIGHT'}\n\n"
+                     f"Mira crosses the room and stops at the window. Rain streaks the glass.\n\n"
+                     f"MIRA\nWe should have left an hour ago.\n\nShe pockets the notebook and turns to go.")
+    return "\n\n".join(parts)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reproducible AkkiNodes pipeline benchmark against the mock LLM server.")
+    parser.add_argument("--scenes", type=int, default=24)
+    parser.add_argument("--servers", type=int, default=1, help="Mock servers; more than one uses the LM Studio pool proxy.")
+    parser.add_argument("--slots", type=int, default=4, help="Parallel generation slots per mock server.")
+    parser.add_argument("--tps", type=float, default=60.0, help="Mock tokens/sec per request.")
+    parser.add_argument("--latency", type=float, default=0.2, help="Mock time to first token (s).")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--concurrency", type=int, default=8, help="max_concurrency passed to the batched nodes.")
+    parser.add_argument("--unconstrained", action="store_true", help="Run the nodes with constrain_output off.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this file.")
+    parser.add_argument("--verbose", action="store_true", help="Show the nodes' console output.")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("AKKI_LLM_CACHE", "0")  # measure the backend, not the completion cache
+    from mock_llm_server import MockLLMServer
+    shared_utils = import_suite_module("shared_utils")
+    llm_metrics = import_suite_module("llm_metrics")
+    cinematographer = import_suite_module("Akki_AI_Cinematographer").AICinematographer_Akki()
+    qc_supervisor = import_suite_module("Akki_AI_QC_Supervisor").AIQCSupervisor_Akki()
+    shot_list_parser = import_suite_module("Akki_Pro_Shot_List_Parser").ProShotListParser_Akki()
+    duration_calculator = import_suite_module("Akki_AI_Shot_Duration_Calculator").AIShotDurationCalculator_Akki()
+
+    servers = [MockLLMServer(latency=args.latency, tokens_per_second=args.tps, slots=args.slots, error_rate=args.error_rate,
+                             seed=args.seed + index).start() for index in range(args.servers)]
+    urls = [server.base_url for server in servers]
+    llm_model = (shared_utils.LMStudioPoolProxy(urls, request_timeout=120) if len(urls) > 1
+                 else shared_utils.LMStudioLlamaProxy(base_url=urls[0], request_timeout=120))
+    llm_metrics.METRICS.reset()
+    constrain = not args.unconstrained
+    screenplay = synthetic_screenplay(args.scenes)
+    stages, results = [], {}
+
+    def run_stage(name, call):
+        output = io.StringIO()
+        started = time.perf_counter()
+        with (contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(output)):
+            value = call()
+        stages.append({"stage": name, "seconds": round(time.perf_counter() - started, 3)})
+        print(f"  {name:<26} {stages[-1]['seconds']:>8.2f}s")
+        return value
+
+    print(f"Benchmark: {args.scenes} scenes, {args.servers} mock server(s) x {args.slots} slots, {args.tps:g} tok/s, "
+          f"{args.latency:g}s to first token, concurrency {args.concurrency}.")
+    try:
+        started = time.perf_counter()
+        report, _ = run_stage("AI Cinematographer", lambda: cinematographer.generate_shot_list(
+            llm_model, screenplay, 0.5, 0.95, 40, 1234, 4096, max_concurrency=args.concurrency, use_llm_cache=False, constrain_output=constrain))
+        clean_report, _ = run_stage("AI QC Supervisor", lambda: qc_supervisor.supervise_and_correct(
+            llm_model, report, max_concurrency=args.concurrency, constrain_output=constrain))
+        csv_report = run_stage("Pro Shot List Parser", lambda: shot_list_parser.parse_pro_report(clean_report, "Mira", 0))[0]
+        durations = run_stage("AI Shot Duration Calculator", lambda: duration_calculator.calculate_durations(
+            llm_model, csv_report, 1, "duration_v1.txt", 0.4, 0.95, 40, 1234, 2048, use_llm_cache=False, constrain_output=constrain))
+        total_seconds = time.perf_counter() - started
+    finally:
+        for server in servers: server.stop()
+
+    snapshot = llm_metrics.METRICS.snapshot(recent=0)
+    requests = sum(series["requests"] for series in snapshot["series"])
+    errors = sum(series["errors"] for series in snapshot["series"])
+    completion_tokens = sum(series["completion_tokens"] for series in snapshot["series"])
+    shots = len(durations[1])
+    results = {"config": vars(args), "stages": stages, "total_seconds": round(total_seconds, 3), "requests": requests, "errors": errors,
+               "shots": shots, "completion_tokens": completion_tokens,
+               "requests_per_second": round(requests / total_seconds, 2) if total_seconds else None,
+               "completion_tokens_per_second": round(completion_tokens / total_seconds, 1) if total_seconds else None,
+               "mock_servers": [server.stats() for server in servers], "metrics": snapshot["series"]}
+    if clean_report.startswith("ERROR") or csv_report.startswith("ERROR") or durations[0].startswith("ERROR"):
+        results["pipeline_error"] = True
+        print("  ! A stage reported an error; rerun with --verbose for details.")
+    print(f"  {'Total':<26} {total_seconds:>8.2f}s  ({requests} requests, {errors} failed, {shots} shots timed, "
+          f"{results['requests_per_second']} req/s, {results['completion_tokens_per_second']} completion tok/s)")
+    print(llm_metrics.METRICS.format_summary())
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f: json.dump(results, f, indent=2)
+        print(f"Results written to {args.json_path}")
+    return results
+
+if __name__ == "__main__":
+    main()
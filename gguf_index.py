@@ -0,0 +1,147 @@
+# Header-only GGUF metadata reader, and an mtime-keyed index of it.
+#
+# A GGUF file starts with its key/value metadata (architecture, context
+# length, layer and head counts, quantization type) ahead of the tensor
+# data, so everything the loader needs to describe a model or size its
+# memory can be read from the first few MB without loading it. The index
+# remembers each file's summary by size and mtime in
+# _cache/gguf_index.json, so the model list is described on every refresh
+# at the cost of one stat() per file.
+
+import os
+import json
+import struct
+import threading
+from .akki_logging import get_logger
+
+log = get_logger(__name__)
+
+GGUF_MAGIC = b"GGUF"
+
+# llama_ftype values stored in `general.file_type`.
+GGUF_FILE_TYPES = {
+    0: "F32", 1: "F16", 2: "Q4_0", 3: "Q4_1", 7: "Q8_0", 8: "Q5_0", 9: "Q5_1", 10: "Q2_K", 11: "Q3_K_S", 12: "Q3_K_M",
+    13: "Q3_K_L", 14: "Q4_K_S", 15: "Q4_K_M", 16: "Q5_K_S", 17: "Q5_K_M", 18: "Q6_K", 19: "IQ2_XXS", 20: "IQ2_XS",
+    21: "Q2_K_S", 22: "IQ3_XS", 23: "IQ3_XXS", 24: "IQ1_S", 25: "IQ4_NL", 26: "IQ3_S", 27: "IQ3_M", 28: "IQ2_S",
+    29: "IQ2_M", 30: "IQ4_XS", 31: "IQ1_M", 32: "BF16", 36: "TQ1_0", 37: "TQ2_0",
+}
+
+# Value type id -> struct format of the scalar types.
+_SCALARS = {0: "<B", 1: "<b", 2: "<H", 3: "<h", 4: "<I", 5: "<i", 6: "<f", 7: "<?", 10: "<Q", 11: "<q", 12: "<d"}
+_STRING, _ARRAY = 8, 9
+
+class GGUFFormatError(ValueError):
+    pass
+
+class _HeaderReader:
+    def __init__(self, f, version):
+        self.f = f
+        # GGUF v1 used 32-bit lengths and counts.
+        self.count_format = "<I" if version == 1 else "<Q"
+
+    def unpack(self, fmt):
+        size = struct.calcsize(fmt)
+        data = self.f.read(size)
+        if len(data) != size: raise GGUFFormatError("Unexpected end of file in the GGUF header.")
+        return struct.unpack(fmt, data)[0]
+
+    def count(self):
+        return self.unpack(self.count_format)
+
+    def string(self):
+        data = self.f.read(self.count())
+        return data.decode("utf-8", errors="replace")
+
+    def value(self, value_type):
+        if value_type in _SCALARS: return self.unpack(_SCALARS[value_type])
+        if value_type == _STRING: return self.string()
+        if value_type == _ARRAY:
+            item_type, length = self.unpack("<I"), self.count()
+            # Arrays are the tokenizer's vocabulary and merges: skip them, keep the length.
+            if item_type in _SCALARS: self.f.seek(struct.calcsize(_SCALARS[item_type]) * length, os.SEEK_CUR)
+            elif item_type == _STRING:
+                for _ in range(length): self.f.seek(self.count(), os.SEEK_CUR)
+            else:
+                for _ in range(length): self.value(item_type)
+            return {"array_length": length}
+        raise GGUFFormatError(f"Unknown GGUF value type {value_type}.")
+
+def read_gguf_metadata(path):
+    """Reads the key/value metadata of a GGUF file (arrays are reduced to their length) without touching the tensors."""
+    with open(path, "rb", buffering=1024 * 1024) as f:
+        if f.read(4) != GGUF_MAGIC: raise GGUFFormatError(f"{os.path.basename(path)} is not a GGUF file.")
+        version = struct.unpack("<I", f.read(4))[0]
+        reader = _HeaderReader(f, version)
+        tensor_count, kv_count = reader.count(), reader.count()
+        metadata = {"gguf.version": version, "gguf.tensor_count": tensor_count}
+        for _ in range(kv_count):
+            key = reader.string()
+            metadata[key] = reader.value(reader.unpack("<I"))
+    return metadata
+
+def summarize_gguf(path, metadata, size):
+    arch = metadata.get("general.architecture")
+    file_type = metadata.get("general.file_type")
+    # Only the scalars describing the model; the full header can run to megabytes.
+    compact = {key: value for key, value in metadata.items()
+               if not isinstance(value, dict) and (key.startswith("general.") or (arch and key.startswith(f"{arch}.")))}
+    return {"architecture": arch or "N/A", "quantization": GGUF_FILE_TYPES.get(file_type, str(file_type) if file_type is not None else "N/A"),
+            "context_length": metadata.get(f"{arch}.context_length"), "name": metadata.get("general.name") or os.path.basename(path),
+            "file_size": size, "metadata": compact}
+
+class GGUFIndex:
+    """
+    Summaries (architecture, quantization, context length, file size and
+    the architecture's metadata) of the GGUF files in the model folders,
+    read from their headers and cached by path, size and mtime.
+    """
+    DEFAULT_PATH = os.path.join(os.path.dirname(__file__), "_cache", "gguf_index.json")
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._entries is not None: return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f: self._entries = json.load(f)
+        except FileNotFoundError: self._entries = {}
+        except (OSError, ValueError) as e:
+            log.warning("[GGUFIndex] Warning: Could not read %s; rebuilding it. Error: %s", self.path, e)
+            self._entries = {}
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f: json.dump(self._entries, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            log.warning("[GGUFIndex] Warning: Could not save the index. Error: %s", e)
+
+    def get(self, model_path):
+        """Returns the summary of one file (None if it is not a readable GGUF), reading its header only if it changed."""
+        return self.get_many([model_path])[0]
+
+    def get_many(self, model_paths):
+        with self._lock:
+            self._load()
+            results, changed = [], False
+            for model_path in model_paths:
+                model_path = os.path.abspath(model_path)
+                try: st = os.stat(model_path)
+                except OSError:
+                    results.append(None)
+                    continue
+                entry = self._entries.get(model_path)
+                if entry is None or entry["size"] != st.st_size or entry["mtime_ns"] != st.st_mtime_ns:
+                    try: summary = summarize_gguf(model_path, read_gguf_metadata(model_path), st.st_size)
+                    except (OSError, GGUFFormatError, struct.error) as e:
+                        log.warning("[GGUFIndex] Could not read the header of %s: %s", os.path.basename(model_path), e)
+                        summary = None
+                    entry = self._entries[model_path] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "summary": summary}
+                    changed = True
+                results.append(entry["summary"])
+            if changed: self._save()
+            return results
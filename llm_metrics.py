@@ -0,0 +1,273 @@
+# LLM metrics registry for AkkiNodes.
+#
+# Every completion that goes through an AkkiNodes LLM_MODEL is recorded here
+# with the node/stage/item that asked for it (see `metrics_scope`), its token
+# counts, time to first token, latency, tokens/sec and whether a cache served
+# it. Aggregates are kept per (node, stage) as counters and histograms; the
+# last few hundred raw records are kept for drill-down. Request schedulers
+# add per-queue wait times and queue depth / in-flight gauges. Inside ComfyUI the
+# data is served at /akkinodes/metrics (JSON, or Prometheus text with
+# ?format=prometheus).
+
+import time
+import weakref
+import threading
+import contextvars
+import functools
+from contextlib import contextmanager
+from collections import deque
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+TOKENS_PER_SECOND_BUCKETS = (1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0, 160.0, 320.0)
+SUMMARY_PERCENTILES = (0.5, 0.9, 0.95, 0.99)
+
+class Histogram:
+    """
+    Fixed-bucket histogram (for Prometheus) plus a bounded reservoir of the
+    most recent samples, from which percentiles are read.
+    """
+    def __init__(self, buckets, reservoir=2048):
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = None
+        self._samples = deque(maxlen=reservoir)
+
+    def observe(self, value):
+        if value is None: return
+        self.count += 1
+        self.sum += value
+        self.max = value if self.max is None else max(self.max, value)
+        self._samples.append(value)
+        for index, bound in enumerate(self.buckets):
+            if value <= bound: self.bucket_counts[index] += 1
+
+    def percentile(self, q):
+        if not self._samples: return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def snapshot(self):
+        summary = {"count": self.count, "sum": round(self.sum, 4), "mean": round(self.sum / self.count, 4) if self.count else None,
+                   "max": round(self.max, 4) if self.max is not None else None}
+        for q in SUMMARY_PERCENTILES:
+            value = self.percentile(q)
+            summary[f"p{int(q * 100)}"] = round(value, 4) if value is not None else None
+        return summary
+
+_SCOPE = contextvars.ContextVar("akki_metrics_scope", default={})
+
+@contextmanager
+def metrics_scope(node=None, stage=None, item=None):
+    """Attributes the completions made inside the block; inner scopes override outer fields."""
+    fields = {key: value for key, value in (("node", node), ("stage", stage), ("item", item)) if value is not None}
+    token = _SCOPE.set(dict(_SCOPE.get(), **fields))
+    try: yield
+    finally: _SCOPE.reset(token)
+
+def metrics_node(node):
+    """Decorator for a node's FUNCTION: every completion it makes is attributed to `node`."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with metrics_scope(node=node): return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def current_scope():
+    return dict(_SCOPE.get())
+
+class _Series:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_prompt_tokens = 0
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.ttft = Histogram(LATENCY_BUCKETS)
+        self.prompt_eval = Histogram(LATENCY_BUCKETS)
+        self.tokens_per_second = Histogram(TOKENS_PER_SECOND_BUCKETS)
+
+class _QueueSeries:
+    def __init__(self):
+        self.requests = 0
+        self.wait = Histogram(LATENCY_BUCKETS)
+
+class MetricsRegistry:
+    """Process-wide, thread-safe store of completion metrics."""
+    RECENT_LIMIT = 500
+    COUNTERS = ("requests", "errors", "cache_hits", "prompt_tokens", "completion_tokens", "cached_prompt_tokens")
+    HISTOGRAMS = (("latency", "latency_seconds"), ("ttft", "time_to_first_token_seconds"),
+                  ("prompt_eval", "prompt_eval_seconds"), ("tokens_per_second", "tokens_per_second"))
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue_gauges = {}
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._series = {}
+            self._queues = {}
+            self._recent = deque(maxlen=self.RECENT_LIMIT)
+            self.started = time.time()
+
+    def record_completion(self, prompt_tokens=0, completion_tokens=0, latency_s=None, ttft_s=None, prompt_eval_s=None, eval_s=None,
+                          cache_hit=False, cached_prompt_tokens=0, error=None, backend=None, generation_s=None, **scope):
+        """
+        Records one completion and returns the record (a plain dict).
+        Tokens/sec is taken over `eval_s` (backend timing) when known, else
+        over `generation_s`, else over the time after the first token.
+        """
+        scope = dict(current_scope(), **{key: value for key, value in scope.items() if value is not None})
+        if eval_s: generation_s = eval_s
+        elif generation_s is None and latency_s is not None: generation_s = latency_s - (ttft_s or 0.0)
+        tokens_per_second = completion_tokens / generation_s if (completion_tokens and generation_s and generation_s > 0 and not cache_hit) else None
+        record = {"time": time.time(), "node": scope.get("node", "unattributed"), "stage": scope.get("stage"), "item": scope.get("item"),
+                  "backend": backend, "prompt_tokens": prompt_tokens or 0, "completion_tokens": completion_tokens or 0,
+                  "cached_prompt_tokens": cached_prompt_tokens or 0, "cache_hit": bool(cache_hit), "error": error,
+                  "latency_s": latency_s, "ttft_s": ttft_s, "prompt_eval_s": prompt_eval_s, "eval_s": eval_s,
+                  "tokens_per_second": round(tokens_per_second, 2) if tokens_per_second else None}
+        with self._lock:
+            series = self._series.get((record["node"], record["stage"]))
+            if series is None: series = self._series[(record["node"], record["stage"])] = _Series()
+            series.requests += 1
+            series.errors += 1 if error else 0
+            series.cache_hits += 1 if cache_hit else 0
+            series.prompt_tokens += record["prompt_tokens"]
+            series.completion_tokens += record["completion_tokens"]
+            series.cached_prompt_tokens += record["cached_prompt_tokens"]
+            if not error and not cache_hit:
+                series.latency.observe(latency_s)
+                series.ttft.observe(ttft_s)
+                series.prompt_eval.observe(prompt_eval_s)
+                series.tokens_per_second.observe(tokens_per_second)
+            self._recent.append(record)
+        return record
+
+    def register_queue(self, queue, gauges):
+        """
+        `gauges` is a bound method returning the queue's live {"depth":
+        {priority: n}, "in_flight": n, "slots": n}; it is held weakly, so a
+        dropped scheduler disappears from the report.
+        """
+        with self._lock: self._queue_gauges[queue] = weakref.WeakMethod(gauges)
+
+    def record_queue_wait(self, queue, priority, wait_s):
+        with self._lock:
+            series = self._queues.get((queue, priority))
+            if series is None: series = self._queues[(queue, priority)] = _QueueSeries()
+            series.requests += 1
+            series.wait.observe(wait_s)
+
+    def _queue_snapshot(self):
+        with self._lock: refs = list(self._queue_gauges.items())
+        gauges = {queue: fn() for queue, fn in ((queue, ref()) for queue, ref in refs) if fn is not None}
+        with self._lock:
+            waits = {key: {"requests": s.requests, "wait": s.wait.snapshot()} for key, s in self._queues.items()}
+        queues = []
+        for queue in sorted(set(gauges) | {queue for queue, _ in waits}):
+            live = gauges.get(queue) or {}
+            queues.append({"queue": queue, "slots": live.get("slots"), "in_flight": live.get("in_flight", 0), "depth": live.get("depth", {}),
+                           "priorities": {priority: data for (q, priority), data in sorted(waits.items()) if q == queue}})
+        return queues
+
+    def snapshot(self, recent=50):
+        queues = self._queue_snapshot()
+        with self._lock:
+            series = [dict({"node": node, "stage": stage}, **{name: getattr(s, name) for name in self.COUNTERS},
+                           **{name: getattr(s, name).snapshot() for name, _ in self.HISTOGRAMS})
+                      for (node, stage), s in sorted(self._series.items(), key=lambda kv: (kv[0][0], kv[0][1] or ""))]
+            records = list(self._recent)[-recent:] if recent else []
+        return {"uptime_s": round(time.time() - self.started, 1), "series": series, "queues": queues, "recent": records}
+
+    def to_prometheus(self):
+        lines = []
+        with self._lock:
+            items = sorted(self._series.items(), key=lambda kv: (kv[0][0], kv[0][1] or ""))
+            for name in self.COUNTERS:
+                metric = f"akkinodes_llm_{name}_total"
+                lines += [f"# TYPE {metric} counter"]
+                lines += [f"{metric}{{{_labels(node, stage)}}} {getattr(s, name)}" for (node, stage), s in items]
+            for attr, suffix in self.HISTOGRAMS:
+                metric = f"akkinodes_llm_{suffix}"
+                lines.append(f"# TYPE {metric} histogram")
+                for (node, stage), s in items:
+                    histogram, labels = getattr(s, attr), _labels(node, stage)
+                    for bound, count in zip(histogram.buckets, histogram.bucket_counts):
+                        lines.append(f'{metric}_bucket{{{labels},le="{bound:g}"}} {count}')
+                    lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                    lines.append(f"{metric}_sum{{{labels}}} {histogram.sum:.6f}")
+                    lines.append(f"{metric}_count{{{labels}}} {histogram.count}")
+        queues = self._queue_snapshot()
+        lines.append("# TYPE akkinodes_llm_queue_depth gauge")
+        for q in queues:
+            for priority, depth in sorted(q["depth"].items()):
+                lines.append(f'akkinodes_llm_queue_depth{{queue="{_escape(q["queue"])}",priority="{_escape(priority)}"}} {depth}')
+        lines.append("# TYPE akkinodes_llm_queue_in_flight gauge")
+        lines += [f'akkinodes_llm_queue_in_flight{{queue="{_escape(q["queue"])}"}} {q["in_flight"]}' for q in queues]
+        lines.append("# TYPE akkinodes_llm_queue_wait_seconds histogram")
+        with self._lock:
+            for (queue, priority), series in sorted(self._queues.items()):
+                histogram, labels = series.wait, f'queue="{_escape(queue)}",priority="{_escape(priority)}"'
+                for bound, count in zip(histogram.buckets, histogram.bucket_counts):
+                    lines.append(f'akkinodes_llm_queue_wait_seconds_bucket{{{labels},le="{bound:g}"}} {count}')
+                lines.append(f'akkinodes_llm_queue_wait_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f"akkinodes_llm_queue_wait_seconds_sum{{{labels}}} {histogram.sum:.6f}")
+                lines.append(f"akkinodes_llm_queue_wait_seconds_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def format_summary(self):
+        lines = []
+        for s in self.snapshot(recent=0)["series"]:
+            latency, tps = s["latency"], s["tokens_per_second"]
+            name = s["node"] + (f" / {s['stage']}" if s["stage"] else "")
+            p50 = f"{latency['p50']:.2f}s" if latency["p50"] is not None else "n/a"
+            p95 = f"{latency['p95']:.2f}s" if latency["p95"] is not None else "n/a"
+            rate = f"{tps['mean']:.1f} tok/s" if tps["mean"] is not None else "n/a"
+            lines.append(f"{name}: {s['requests']} requests ({s['cache_hits']} cached, {s['errors']} failed), "
+                         f"latency p50 {p50} / p95 {p95}, {rate}, {s['prompt_tokens']} + {s['completion_tokens']} tokens")
+        for q in self._queue_snapshot():
+            for priority, data in q["priorities"].items():
+                wait = data["wait"]
+                if not wait["count"]: continue
+                lines.append(f"Queue {q['queue']} [{priority}]: {data['requests']} requests, wait p50 {wait['p50']:.2f}s / p95 {wait['p95']:.2f}s / max {wait['max']:.2f}s")
+        return "\n".join(lines) or "No completions recorded."
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(node, stage):
+    return f'node="{_escape(node)}",stage="{_escape(stage or "")}"'
+
+METRICS = MetricsRegistry()
+
+def get_metrics_registry():
+    return METRICS
+
+def register_routes():
+    """Adds the /akkinodes/metrics routes to the ComfyUI server; False outside ComfyUI."""
+    try:
+        from server import PromptServer
+        from aiohttp import web
+    except ImportError:
+        return False
+    routes = PromptServer.instance.routes
+
+    @routes.get("/akkinodes/metrics")
+    async def akkinodes_metrics(request):
+        if request.query.get("format") == "prometheus":
+            return web.Response(body=METRICS.to_prometheus().encode("utf-8"), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+        try: recent = max(0, int(request.query.get("recent", 50)))
+        except ValueError: recent = 50
+        return web.json_response(METRICS.snapshot(recent=recent))
+
+    @routes.post("/akkinodes/metrics/reset")
+    async def akkinodes_metrics_reset(request):
+        METRICS.reset()
+        return web.json_response({"status": "ok"})
+
+    return True
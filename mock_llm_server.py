@@ -0,0 +1,324 @@
+# Mock OpenAI-compatible LLM server for load and latency testing.
+#
+# Stands in for LM Studio so LMStudioLlamaProxy, the pool loader and the
+# per-scene/per-shot node loops can be exercised without a GPU box. It speaks
+# /v1/models, /v1/chat/completions and /v1/completions (plain and streamed),
+# with configurable time to first token, tokens/sec, parallel slots (extra
+# requests queue, like LM Studio) and failure injection (HTTP 500s, hangs,
+# dropped connections). Answers are deterministic fixtures keyed on the
+# prompt, in the formats the AkkiNodes parsers expect: shot blocks, QC
+# reports, `SHOT: seconds` duration lines, MAIN_OUTPUT-tagged text, or JSON
+# matching a `response_format` schema.
+#
+# Stdlib only and free of package imports, so it runs on its own:
+#   In-process:  with MockLLMServer(tokens_per_second=80, slots=4) as server:
+#                    proxy = LMStudioLlamaProxy(base_url=server.base_url)
+#   Subprocess:  python mock_llm_server.py --port 1234 --tps 80 --slots 4 --error-rate 0.05
+
+import re
+import json
+import time
+import socket
+import random
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+MODEL_ID = "akki-mock-llm"
+SHOT_TYPES = ("WIDE SHOT", "LONG SHOT", "MEDIUM SHOT", "MEDIUM CLOSE UP", "CLOSE UP", "EXTREME CLOSE UP", "LOW ANGLE SHOT")
+LOREM = ("the camera lingers on a quiet frame while light shifts across the set and the characters weigh what comes next "
+         "before the moment breaks and the story moves forward with renewed purpose").split()
+TOKEN_PATTERN = re.compile(r"\s*\S+|\s+")
+
+# --- Deterministic fixtures ---
+
+def _rng(*parts):
+    digest = hashlib.sha256("\x00".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return random.Random(int(digest[:16], 16))
+
+def _lorem(rng, words):
+    start = rng.randrange(len(LOREM))
+    return " ".join(LOREM[(start + i) % len(LOREM)] for i in range(words))
+
+def _scene_heading(prompt):
+    # The last heading is the scene under work; the few-shot examples come first.
+    headings = re.findall(r"^\W*((?:\d+\.\s*)?(?:INT|EXT)\.[^\n]*)$", prompt, re.MULTILINE | re.IGNORECASE)
+    return headings[-1].strip() if headings else "INT. MOCK STAGE - DAY"
+
+def _shot_blocks(prompt, rng):
+    location = _scene_heading(prompt)
+    blocks = []
+    for index in range(rng.randint(2, 4)):
+        lines = [f"SHOT: {chr(65 + index)}", f"LOCATION: {location}", "SET_DRESSING: Table, Lamp, Window",
+                 f"SHOT_TYPE: {rng.choice(SHOT_TYPES)}", f"SHOT_FRAMING: {_lorem(rng, 10).capitalize()}.",
+                 "Camera & Lens: ARRI Alexa Mini with a 35mm prime lens.", f"DESCRIPTION: {_lorem(rng, 14).capitalize()}.",
+                 "Movement & Angle: Slow dolly-in at eye level.", "CHARACTERS: Mira",
+                 "PROPS (Mira): Notebook, Pen", "COSTUMES (Mira): Grey coat, Scarf",
+                 "VFX: None", f"Sound Design Cue: {_lorem(rng, 8).capitalize()}.", "SFX: Rain on glass",
+                 f"PERFORMANCE: {_lorem(rng, 8).capitalize()}.", "DIALOGUE: None",
+                 f"Director's Rationale: {_lorem(rng, 16).capitalize()}."]
+        blocks.append("//---SHOT_START---//\n" + "\n".join(lines) + "\n//---SHOT_END---//")
+    return "\n".join(blocks)
+
+def _qc_report(prompt):
+    section = re.search(r"<asset_lists_to_sanitize>([\s\S]*?)</asset_lists_to_sanitize>", prompt)
+    found = {"PROPS": [], "COSTUMES": [], "SET_DRESSING": []}
+    for line in (section.group(1) if section else "").splitlines():
+        match = re.match(r"\s*(PROPS|COSTUMES|SET_DRESSING)\b[^:]*:\s*(.*)", line, re.IGNORECASE)
+        if match: found[match.group(1).upper()] += [item.strip() for item in match.group(2).split(",") if item.strip()]
+    lines = [f"CLEANED_{key}: {', '.join(dict.fromkeys(items)) or 'None'}" for key, items in found.items()]
+    return "//---START_QC_REPORT--//\n" + "\n".join(lines) + "\n//---END_QC_REPORT--//"
+
+def _durations(prompt, rng):
+    shot_ids = list(dict.fromkeys(re.findall(r"--- DATA FOR SHOT: (\S+) ---", prompt)))
+    return "\n".join(f"{shot_id}: {rng.randint(2, 9)}" for shot_id in shot_ids)
+
+def _from_schema(schema, rng, key="value", index=0):
+    kind = schema.get("type")
+    if "enum" in schema: return rng.choice(schema["enum"])
+    if kind == "object":
+        properties = schema.get("properties", {})
+        required = schema.get("required", list(properties))
+        return {name: _from_schema(properties.get(name, {}), rng, name, index) for name in required}
+    if kind == "array":
+        count = max(schema.get("minItems", 0), min(schema.get("maxItems", 3), rng.randint(2, 3)))
+        return [_from_schema(schema.get("items", {}), rng, key, i) for i in range(count)]
+    if kind in ("integer", "number"):
+        low = max(2, int(schema.get("minimum", 2)))
+        return rng.randint(low, max(low, int(schema.get("maximum", 9))))
+    if kind == "boolean": return rng.random() < 0.5
+    if schema.get("pattern") == "^[A-Z]$": return chr(65 + index % 26)
+    return f"Mock {key.lower().replace('_', ' ')} {index + 1}"
+
+def fixture_for(prompt, response_format=None, max_words=64):
+    """The deterministic answer to `prompt` (and the requested response_format)."""
+    rng = _rng(prompt, json.dumps(response_format, sort_keys=True) if response_format else "")
+    if response_format and response_format.get("type") == "json_schema":
+        return json.dumps(_from_schema(response_format["json_schema"].get("schema", {}), rng))
+    if "//---START_QC_REPORT--//" in prompt: return _qc_report(prompt)
+    if "--- DATA FOR SHOT:" in prompt: return _durations(prompt, rng)
+    if "//---SHOT_START---//" in prompt and "SHOT_TYPE" in prompt: return _shot_blocks(prompt, rng)
+    if "//---START_MAIN_OUTPUT--//" in prompt:
+        return f"//---START_MAIN_OUTPUT--//\n{_lorem(rng, max_words).capitalize()}.\n//---END_MAIN_OUTPUT--//"
+    return _lorem(rng, max_words).capitalize() + "."
+
+def _apply_stop(text, stop):
+    if isinstance(stop, str): stop = [stop]
+    cuts = [text.find(s) for s in (stop or []) if s and s in text]
+    return text[:min(cuts)] if cuts else text
+
+# --- HTTP server ---
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "AkkiMockLLM/1.0"
+
+    def handle(self):
+        try: super().handle()
+        except (ConnectionResetError, BrokenPipeError): pass  # Client timed out or hung up mid keep-alive.
+
+    def log_message(self, format, *args):
+        if self.server.mock.verbose: super().log_message(format, *args)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = self.path.split("?")[0].rstrip("/")
+        if path.endswith("/models"):
+            return self._send_json(200, {"object": "list", "data": [{"id": MODEL_ID, "object": "model", "created": 0, "owned_by": "akkinodes"}]})
+        if path == "/mock/stats": return self._send_json(200, self.server.mock.stats())
+        self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        path = self.path.split("?")[0].rstrip("/")
+        try: body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        except ValueError: return self._send_json(400, {"error": {"message": "Request body is not valid JSON."}})
+        if path.endswith("/chat/completions"):
+            prompt = "\n".join(str(message.get("content") or "") for message in body.get("messages", []))
+            self.server.mock.serve(self, body, prompt, chat=True)
+        elif path.endswith("/completions"):
+            self.server.mock.serve(self, body, str(body.get("prompt") or ""), chat=False)
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class MockLLMServer:
+    """
+    In-process mock server; use as a context manager or call start()/stop().
+    `latency` is the time to first token (plus up to `jitter` seconds), then
+    tokens arrive at `tokens_per_second`. At most `slots` requests generate
+    at once. Each request independently fails with `error_rate` (HTTP 500),
+    `hang_rate` (stalls `hang_seconds` before answering) or `disconnect_rate`
+    (connection dropped); `seed` makes the failure pattern reproducible.
+    """
+    def __init__(self, host="127.0.0.1", port=0, latency=0.2, jitter=0.0, tokens_per_second=50.0, slots=4,
+                 error_rate=0.0, hang_rate=0.0, hang_seconds=30.0, disconnect_rate=0.0, max_words=64, seed=0, verbose=False):
+        self.host, self.port = host, port
+        self.latency, self.jitter = latency, jitter
+        self.tokens_per_second = tokens_per_second
+        self.slots = max(1, int(slots))
+        self.error_rate, self.hang_rate, self.hang_seconds, self.disconnect_rate = error_rate, hang_rate, hang_seconds, disconnect_rate
+        self.max_words = max_words
+        self.verbose = verbose
+        self._random = random.Random(seed)
+        self._slots = threading.BoundedSemaphore(self.slots)
+        self._lock = threading.Lock()
+        self._counters = {"requests": 0, "completed": 0, "errors_injected": 0, "hangs_injected": 0, "disconnects_injected": 0,
+                          "completion_tokens": 0, "in_flight": 0, "max_in_flight": 0, "generating": 0, "max_generating": 0}
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}/v1"
+
+    def _bind(self):
+        self._httpd = _Server((self.host, self.port), _Handler)
+        self._httpd.mock = self
+        self.port = self._httpd.server_address[1]
+
+    def start(self):
+        self._bind()
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name=f"akki-mock-llm-{self.port}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd is None: return
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._httpd = None
+
+    def serve_forever(self):
+        self._bind()
+        print(f"[MockLLMServer] Serving {MODEL_ID} at {self.base_url} ({self.slots} slots, {self.tokens_per_second:g} tok/s).", flush=True)
+        try: self._httpd.serve_forever()
+        except KeyboardInterrupt: pass
+        finally: self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def stats(self):
+        with self._lock: return dict(self._counters)
+
+    def _count(self, name, delta=1, peak=None):
+        with self._lock:
+            self._counters[name] += delta
+            if peak: self._counters[peak] = max(self._counters[peak], self._counters[name])
+
+    def _draw_failure(self):
+        with self._lock: roll = self._random.random()
+        for kind, rate in (("error", self.error_rate), ("hang", self.hang_rate), ("disconnect", self.disconnect_rate)):
+            if roll < rate: return kind
+            roll -= rate
+        return None
+
+    def serve(self, handler, body, prompt, chat):
+        self._count("requests")
+        self._count("in_flight", peak="max_in_flight")
+        try:
+            failure = self._draw_failure()
+            if failure == "disconnect":
+                self._count("disconnects_injected")
+                handler.close_connection = True
+                try: handler.connection.shutdown(socket.SHUT_RDWR)
+                except OSError: pass
+                return
+            if failure == "error":
+                self._count("errors_injected")
+                return handler._send_json(500, {"error": {"message": "Injected failure from the mock server.", "type": "server_error"}})
+            if failure == "hang":
+                self._count("hangs_injected")
+                time.sleep(self.hang_seconds)
+            with self._slots:
+                self._count("generating", peak="max_generating")
+                try: self._generate(handler, body, prompt, chat)
+                finally: self._count("generating", -1)
+            self._count("completed")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client gave up (timeout or closed stream); nothing to answer.
+        finally:
+            self._count("in_flight", -1)
+
+    def _generate(self, handler, body, prompt, chat):
+        text = _apply_stop(fixture_for(prompt, body.get("response_format"), self.max_words), body.get("stop"))
+        pieces = TOKEN_PATTERN.findall(text)
+        finish_reason = "stop"
+        max_tokens = body.get("max_tokens")
+        if max_tokens and len(pieces) > int(max_tokens):
+            pieces, finish_reason = pieces[:int(max_tokens)], "length"
+        usage = {"prompt_tokens": max(1, len(prompt) // 4), "completion_tokens": len(pieces)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        time.sleep(self.latency + (_rng(prompt).random() * self.jitter if self.jitter else 0.0))
+        per_token = 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+        created, object_prefix = int(time.time()), "chat.completion" if chat else "text_completion"
+        if not body.get("stream"):
+            time.sleep(per_token * len(pieces))
+            choice = ({"index": 0, "message": {"role": "assistant", "content": "".join(pieces)}, "finish_reason": finish_reason} if chat
+                      else {"index": 0, "text": "".join(pieces), "finish_reason": finish_reason})
+            handler._send_json(200, {"id": "mock-cmpl", "object": object_prefix, "created": created, "model": MODEL_ID,
+                                     "choices": [choice], "usage": usage})
+            self._count("completion_tokens", len(pieces))
+            return
+
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Cache-Control", "no-cache")
+        handler.send_header("Transfer-Encoding", "chunked")
+        handler.end_headers()
+
+        def send_event(payload):
+            data = f"data: {payload}\n\n".encode("utf-8")
+            handler.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            handler.wfile.flush()
+
+        chunk_object = "chat.completion.chunk" if chat else "text_completion"
+        for index, piece in enumerate(pieces + [None]):
+            if piece is not None and per_token: time.sleep(per_token)
+            done = piece is None
+            if chat: choice = {"index": 0, "delta": {} if done else {"content": piece}, "finish_reason": finish_reason if done else None}
+            else: choice = {"index": 0, "text": "" if done else piece, "finish_reason": finish_reason if done else None}
+            send_event(json.dumps({"id": "mock-cmpl", "object": chunk_object, "created": created, "model": MODEL_ID, "choices": [choice]}))
+            if not done: self._count("completion_tokens")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            send_event(json.dumps({"id": "mock-cmpl", "object": chunk_object, "created": created, "model": MODEL_ID, "choices": [], "usage": usage}))
+        send_event("[DONE]")
+        handler.wfile.write(b"0\r\n\r\n")
+        handler.wfile.flush()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible LLM server for AkkiNodes load and latency testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1234)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds to first token.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random (per-prompt deterministic) seconds to first token.")
+    parser.add_argument("--tps", type=float, default=50.0, help="Generated tokens per second per request.")
+    parser.add_argument("--slots", type=int, default=4, help="Requests generated in parallel; the rest queue.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500.")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="Fraction of requests that stall before answering.")
+    parser.add_argument("--hang-seconds", type=float, default=30.0)
+    parser.add_argument("--disconnect-rate", type=float, default=0.0, help="Fraction of requests whose connection is dropped.")
+    parser.add_argument("--max-words", type=int, default=64, help="Length of free-text fixtures.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+    MockLLMServer(host=args.host, port=args.port, latency=args.latency, jitter=args.jitter, tokens_per_second=args.tps, slots=args.slots,
+                  error_rate=args.error_rate, hang_rate=args.hang_rate, hang_seconds=args.hang_seconds, disconnect_rate=args.disconnect_rate,
+                  max_words=args.max_words, seed=args.seed, verbose=args.verbose).serve_forever()
+
+if __name__ == "__main__":
+    main()
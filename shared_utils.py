@@ -3,32 +3,118 @@
 import os
 import re
 import json
-from openai import OpenAI
+import string
+import time
+import gc
+import itertools
+import tempfile
+import hashlib
+import platform
+import random
+import threading
+import weakref
+import contextvars
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, TimeoutError as FutureTimeoutError
+from .llm_metrics import METRICS, metrics_scope, current_scope
+from .akki_logging import get_logger, log_payload
+from .akki_imports import lazy_import
+try: import folder_paths
+except ImportError: folder_paths = None  # outside ComfyUI (benchmarks, scripts)
+
+# Only the LM Studio loaders need these; imported on their first request.
+httpx = lazy_import("httpx")
+openai = lazy_import("openai")
+
+log = get_logger(__name__)
+
+class MtimeCache:
+    """
+    Values computed from a file or directory, kept until its mtime or size
+    changes. ComfyUI calls INPUT_TYPES on every /object_info request, so
+    the wildcard files and prompt directories behind the node combos are
+    read through one of these; a hit costs a single stat(). A path that
+    does not exist is cached as such until it appears, and a `load` that
+    raises caches nothing.
+    """
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, path, load):
+        try:
+            st = os.stat(path)
+            stamp = (st.st_mtime_ns, st.st_size)
+        except OSError: stamp = None
+        with self._lock: entry = self._entries.get(path)
+        if entry is not None and entry[0] == stamp: return entry[1]
+        value = load(path)
+        with self._lock: self._entries[path] = (stamp, value)
+        return value
+
+    def clear(self):
+        with self._lock: self._entries.clear()
+
+_scan_cache = MtimeCache()
+
+def _read_wildcard_lines(file_path):
+    if not os.path.exists(file_path): return None
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()] or None
 
 def get_wildcard_list(filename):
     try:
-        file_path = os.path.join(os.path.dirname(__file__), filename)
-        if os.path.exists(file_path):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                lines = [line.strip() for line in f if line.strip()]
-                if lines: return lines
+        lines = _scan_cache.get(os.path.join(os.path.dirname(__file__), filename), _read_wildcard_lines)
+        if lines: return list(lines)
     except Exception as e:
-        print(f"[AkkiNodes] Warning: Could not read wildcard file {filename}. Error: {e}")
+        log.warning("[AkkiNodes] Warning: Could not read wildcard file %s. Error: %s", filename, e)
     return [f"Could not load {filename}"]
 
+def _scan_prompt_dir(directory):
+    if not os.path.isdir(directory):
+        # Logged once: the missing directory is cached until it is created.
+        log.warning("[AkkiNodes] Prompt directory not found; add your .txt prompts to %s", directory)
+        return None
+    return sorted(f for f in os.listdir(directory) if f.endswith('.txt'))
+
+def list_prompt_files(directory, node_name="AkkiNodes"):
+    """
+    The .txt prompt files in `directory`, sorted, for a node's prompt
+    combo. Cached by the directory's mtime, and read-only: a missing
+    directory is reported, not created.
+    """
+    try: files = _scan_cache.get(directory, _scan_prompt_dir)
+    except OSError as e:
+        log.error("[%s] Error scanning prompt directory %s: %s", node_name, directory, e)
+        return ["Error loading prompts"]
+    return list(files) if files else ["No .txt files found"]
+
 def report_token_usage(node_name, completion_output):
     try:
         usage = completion_output.get("usage", {})
         prompt_tokens = usage.get("prompt_tokens", 0)
         completion_tokens = usage.get("completion_tokens", 0)
         total_tokens = usage.get("total_tokens", 0)
-        print(f"[{node_name}] Token Usage: TOTAL: {total_tokens} (Input: {prompt_tokens} + Output: {completion_tokens})")
+        cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+        if cached_tokens: prompt_tokens = f"{prompt_tokens} [{cached_tokens} from prefix cache]"
+        source = " [served from completion cache]" if completion_output.get("cache_hit") else ""
+        if completion_output.get("replayed"): source = " [replayed from cassette]"
+        timings = completion_output.get("timings") or {}
+        if timings.get("latency_s") is not None and not completion_output.get("cache_hit"):
+            source += f" | {timings['latency_s']:.2f}s"
+            if timings.get("ttft_s") is not None: source += f", first token {timings['ttft_s']:.2f}s"
+            if timings.get("tokens_per_second"): source += f", {timings['tokens_per_second']:.1f} tok/s"
+        log.info("[%s] Token Usage: TOTAL: %s (Input: %s + Output: %s)%s", node_name, total_tokens, prompt_tokens, completion_tokens, source)
     except Exception as e:
-        print(f"[{node_name}] Warning: Could not generate token report. Error: {e}")
+        log.warning("[%s] Warning: Could not generate token report. Error: %s", node_name, e)
 
 def extract_tagged_content(text, tag="main_output"):
     start_tag = f"//---START_{tag.upper()}--//"
     end_tag = f"//---END_{tag.upper()}--//"
+    if not isinstance(text, str):
+        text = _consume_until(text, end_tag)
     start_index = text.find(start_tag)
     if start_index == -1: return text
     start_index += len(start_tag)
@@ -36,18 +122,1650 @@ def extract_tagged_content(text, tag="main_output"):
     if end_index == -1: return text[start_index:].strip()
     return text[start_index:end_index].strip()
 
-class LMStudioLlamaProxy:
+class ProcessLog:
+    """
+    Append-only file for a node's prompts and replies, written section by
+    section as the node runs instead of being built up in a string that
+    ComfyUI would then hold as a cached output. Files go to
+    `<output>/<project_path>/DATA/process_logs`, or `<output>/AkkiNodes/
+    process_logs` without a project (the temp directory outside ComfyUI);
+    nodes return `summary()`, which leads with the file path, in place of
+    the full text.
+    """
+    _counter = itertools.count(1)
+
+    def __init__(self, node_name, project_path=None, label=None):
+        base_dir = folder_paths.get_output_directory() if folder_paths else tempfile.gettempdir()
+        log_dir = os.path.join(base_dir, project_path, "DATA", "process_logs") if project_path else os.path.join(base_dir, "AkkiNodes", "process_logs")
+        os.makedirs(log_dir, exist_ok=True)
+        name = re.sub(r'[<>:"/\\|?*\s]+', '_', f"{node_name}_{label}" if label else node_name).strip("_")
+        self.path = os.path.normpath(os.path.join(log_dir, f"{name}_{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}-{next(self._counter)}.log"))
+        self.node_name = node_name
+        self.sections = 0
+        self.chars = 0
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def write(self, title, text):
+        entry = f"--- {title} ---\n{text}\n\n"
+        self._file.write(entry)
+        self._file.flush()
+        self.sections += 1
+        self.chars += len(entry)
+
+    def close(self):
+        if not self._file.closed: self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def summary(self, note=None):
+        text = f"{self.path}\n{self.node_name}: {self.sections} log section(s), {self.chars / 1024:.1f} KB."
+        return f"{text} {note}" if note else text
+
+def _consume_until(fragments, end_tag):
+    """Joins a token iterator, stopping (and closing it) once end_tag has arrived."""
+    collected, tail_len = [], len(end_tag)
+    tail = ""
+    try:
+        for piece in fragments:
+            collected.append(piece)
+            tail = (tail + piece)[-(tail_len + len(piece)):]
+            if end_tag in tail: break
+    finally:
+        close = getattr(fragments, "close", None)
+        if close: close()
+    return "".join(collected)
+
+class CompletionStream:
+    """
+    Streams a completion from any LLM_MODEL (a llama.cpp `Llama` or an
+    LMStudioLlamaProxy) and yields text fragments as they arrive. As soon as
+    one of `end_tags` appears in the generated text, the fragment is trimmed
+    just after the tag and the upstream stream is closed, which stops the
+    backend from generating (and billing) the tokens a model rambles on with
+    after its closing marker. Iterate it directly, hand it to
+    `extract_tagged_content`, or call `to_completion()` for the usual dict.
+    """
+    def __init__(self, llm_model, prompt, end_tags=None, **kwargs):
+        self.llm_model = llm_model
+        self.prompt = prompt
+        self.end_tags = [tag for tag in (end_tags or []) if tag]
+        self.kwargs = kwargs
+        self.text = ""
+        self.completion_tokens = 0
+        self.finish_reason = None
+        self.server_usage = None
+        self._stream = None
+        self._source = None
+        self._iterator = None
+
+    def __iter__(self):
+        if self._iterator is None: self._iterator = self._generate()
+        return self._iterator
+
+    def _find_end_tag(self, search_from):
+        hits = [(self.text.find(tag, search_from), tag) for tag in self.end_tags]
+        hits = [(index, tag) for index, tag in hits if index != -1]
+        if not hits: return -1
+        index, tag = min(hits)
+        return index + len(tag)
+
+    def _generate(self):
+        self._stream = self._source = self.llm_model.create_completion(prompt=self.prompt, stream=True, **self.kwargs)
+        longest_tag = max((len(tag) for tag in self.end_tags), default=0)
+        try:
+            for chunk in self._stream:
+                if chunk.get("usage"): self.server_usage = chunk["usage"]
+                choice = (chunk.get("choices") or [{}])[0]
+                piece = choice.get("text") or ""
+                if choice.get("finish_reason"): self.finish_reason = choice["finish_reason"]
+                if not piece: continue
+                self.completion_tokens += 1
+                search_from = max(0, len(self.text) - longest_tag)
+                emitted_len = len(self.text)
+                self.text += piece
+                cut_at = self._find_end_tag(search_from) if self.end_tags else -1
+                if cut_at != -1:
+                    self.text = self.text[:cut_at]
+                    self.finish_reason = "end_tag"
+                    if cut_at > emitted_len: yield self.text[emitted_len:]
+                    return
+                yield piece
+        finally:
+            self.close()
+
+    def close(self):
+        close = getattr(self._stream, "close", None)
+        self._stream = None
+        if close: close()
+
+    def _count_prompt_tokens(self):
+        tokenize = getattr(self.llm_model, "tokenize", None)
+        if not tokenize: return 0
+        try: return len(tokenize(self.prompt.encode("utf-8")))
+        except Exception: return 0
+
+    def to_completion(self):
+        for _ in self: pass
+        prompt_tokens = (self.server_usage or {}).get("prompt_tokens") or self._count_prompt_tokens()
+        # The server's count when it sent one (a grammar reply arrives as one rendered chunk); chunks are only a fallback.
+        completion_tokens = (self.server_usage or {}).get("completion_tokens") or self.completion_tokens
+        completion = {
+            "choices": [{"text": self.text, "finish_reason": self.finish_reason or "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+        cached_tokens = ((self.server_usage or {}).get("prompt_tokens_details") or {}).get("cached_tokens")
+        if cached_tokens: completion["usage"]["prompt_tokens_details"] = {"cached_tokens": cached_tokens}
+        record = getattr(self._source, "metrics", None)
+        if record: completion["timings"] = completion_timings(record)
+        return completion
+
+def create_completion_streaming(llm_model, prompt, end_tags=None, use_cache=True, **kwargs):
+    """Drop-in for `llm_model.create_completion` that stops at the first end tag."""
+    started = time.monotonic()
+    key_fn = getattr(llm_model, "completion_cache_key", None)
+    cache_key = key_fn(prompt, kwargs, end_tags=end_tags) if (use_cache and key_fn) else None
+    if cache_key:
+        cached = LLMCompletionCache.get_default().get(cache_key)
+        if cached is not None: return record_completion_metrics(cached, started, backend=getattr(llm_model, "metrics_backend", None))
+    stream = CompletionStream(llm_model, prompt, end_tags=end_tags, **kwargs)
+    completion = stream.to_completion()
+    if stream.finish_reason == "end_tag":
+        log.debug("[CompletionStream] End tag reached after %d tokens; generation stopped early.", stream.completion_tokens)
+    if cache_key and stream.finish_reason != "error":
+        LLMCompletionCache.get_default().put(cache_key, completion)
+    return completion
+
+TIMING_FIELDS = ("latency_s", "ttft_s", "prompt_eval_s", "eval_s", "tokens_per_second")
+
+def completion_timings(record):
+    return {field: record[field] for field in TIMING_FIELDS}
+
+def record_completion_metrics(output, started, backend=None, ttft_s=None):
+    """Records a finished completion in the metrics registry and attaches its `timings`."""
+    usage = output.get("usage") or {}
+    backend_timings = output.get("timings") or {}
+    record = METRICS.record_completion(
+        prompt_tokens=usage.get("prompt_tokens", 0), completion_tokens=usage.get("completion_tokens", 0),
+        latency_s=time.monotonic() - started, ttft_s=ttft_s,
+        prompt_eval_s=backend_timings.get("prompt_eval_s"), eval_s=backend_timings.get("eval_s"),
+        cache_hit=bool(output.get("cache_hit")), cached_prompt_tokens=(usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0),
+        error=output.get("error"), backend=backend)
+    output["timings"] = completion_timings(record)
+    return output
+
+class MeteredStream:
+    """
+    Wraps a completion stream and records it in the metrics registry when it
+    ends or is closed: time to first token, latency, and the usage/timings
+    the backend reported in its chunks. The record is left in `metrics`,
+    and `on_close` (e.g. releasing a scheduler slot) runs once it is done.
+    """
+    def __init__(self, stream, started, backend=None, cache_hit=False, on_close=None):
+        self._stream = iter(stream)
+        self.started = started
+        self.backend = backend
+        self.cache_hit = cache_hit
+        self._on_close = on_close
+        self.ttft_s = None
+        self.pieces = 0
+        self.usage = {}
+        self.backend_timings = {}
+        self.metrics = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try: chunk = next(self._stream)
+        except StopIteration:
+            self.close()
+            raise
+        except Exception as e:
+            self.close(error=type(e).__name__)
+            raise
+        if chunk.get("usage"): self.usage = chunk["usage"]
+        if chunk.get("timings"): self.backend_timings = chunk["timings"]
+        if (chunk.get("choices") or [{}])[0].get("text"):
+            self.pieces += 1
+            if self.ttft_s is None: self.ttft_s = time.monotonic() - self.started
+        return chunk
+
+    def close(self, error=None):
+        if self.metrics is not None: return
+        close = getattr(self._stream, "close", None)
+        if close: close()
+        latency_s = time.monotonic() - self.started
+        # A stream that arrived as one chunk (e.g. a rendered grammar reply) has no generation phase of its own.
+        generation_s = latency_s - self.ttft_s if (self.ttft_s is not None and self.pieces > 1) else latency_s
+        self.metrics = METRICS.record_completion(
+            prompt_tokens=self.usage.get("prompt_tokens", 0), completion_tokens=max(self.usage.get("completion_tokens", 0), self.pieces),
+            latency_s=latency_s, ttft_s=self.ttft_s, generation_s=generation_s,
+            prompt_eval_s=self.backend_timings.get("prompt_eval_s"), eval_s=self.backend_timings.get("eval_s"),
+            cached_prompt_tokens=(self.usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0), cache_hit=self.cache_hit,
+            error=error, backend=self.backend)
+        if self._on_close: self._on_close()
+
+def gbnf_literal(text):
+    """Quote `text` as a GBNF string literal."""
+    return '"' + text.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+
+class OutputGrammar:
+    """
+    Output contract for a structured node, passed as
+    `create_completion(..., grammar=OUTPUT_GRAMMAR)`. `gbnf` constrains
+    llama.cpp sampling to the node's text format directly. OpenAI-compatible
+    servers can only constrain JSON, so they get `json_schema` instead and
+    `render(data)` turns the reply back into the same text. Either way the
+    node parses exactly what it parsed before.
+    """
+    def __init__(self, name, gbnf, json_schema, render):
+        self.name = name
+        self.gbnf = gbnf
+        self.json_schema = json_schema
+        self.render = render
+        self._llama_grammar = None
+        digest = hashlib.sha256((gbnf + json.dumps(json_schema, sort_keys=True)).encode("utf-8")).hexdigest()
+        self.cache_token = f"grammar:{name}:{digest[:16]}"
+
+    def to_llama_grammar(self):
+        if self._llama_grammar is None:
+            from llama_cpp import LlamaGrammar
+            self._llama_grammar = LlamaGrammar.from_string(self.gbnf, verbose=False)
+        return self._llama_grammar
+
+    def response_format(self):
+        return {"type": "json_schema", "json_schema": {"name": self.name, "strict": True, "schema": self.json_schema}}
+
+    def render_json(self, text):
+        try: return self.render(json.loads(text))
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            log.warning("[OutputGrammar] Could not render the '%s' JSON reply; passing the raw text on. Error: %s", self.name, e)
+            return text
+
+def _common_prefix_len(a, b):
+    n = 0
+    for x, y in zip(a, b):
+        if x != y: break
+        n += 1
+    return n
+
+def _cache_json_default(value):
+    # Non-JSON parameters (e.g. compiled grammars) may expose a stable token;
+    # otherwise fall back to their type so the key stays deterministic.
+    return getattr(value, "cache_token", None) or type(value).__name__
+
+class LLMCompletionCache:
+    """
+    Persistent, content-addressed store of LLM completions shared by every
+    backend. Entries are keyed by a hash of the prompt, the sampling
+    parameters (seed and stop list included) and the model identity, so a
+    deterministic re-run of an unchanged upstream node is read back from disk
+    instead of being generated again. Only calls with a fixed seed or zero
+    temperature are cached, and the directory is held under `max_bytes` by
+    evicting the least recently used entries.
+    Configure with AKKI_LLM_CACHE=0 (disable), AKKI_LLM_CACHE_DIR and
+    AKKI_LLM_CACHE_MAX_MB; nodes bypass it per call with `use_cache=False`.
+    """
+    DEFAULT_DIR = os.path.join(os.path.dirname(__file__), "_cache", "completions")
+    DEFAULT_MAX_MB = 512
+
+    _default = None
+    _default_lock = threading.Lock()
+
+    @classmethod
+    def get_default(cls):
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls(os.environ.get("AKKI_LLM_CACHE_DIR") or cls.DEFAULT_DIR,
+                                   max_bytes=int(float(os.environ.get("AKKI_LLM_CACHE_MAX_MB", cls.DEFAULT_MAX_MB)) * 1024 * 1024),
+                                   enabled=os.environ.get("AKKI_LLM_CACHE", "1") != "0")
+            return cls._default
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_MB * 1024 * 1024, enabled=True):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = self.misses = self.evictions = 0
+        self.total_bytes = 0
+        self._index = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_deterministic(params):
+        seed, temperature = params.get("seed"), params.get("temperature", 1.0)
+        return (isinstance(seed, int) and seed >= 0) or (temperature is not None and temperature <= 0)
+
+    @staticmethod
+    def make_key(model_identity, prompt, params):
+        material = json.dumps({"model": model_identity, "prompt": prompt, "params": params},
+                              sort_keys=True, default=_cache_json_default)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _load_index(self):
+        if self._index is not None: return
+        entries = []
+        if os.path.isdir(self.cache_dir):
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    if not name.endswith(".json"): continue
+                    try: st = os.stat(os.path.join(root, name))
+                    except OSError: continue
+                    entries.append((st.st_mtime, name[:-5], st.st_size))
+        entries.sort()
+        self._index = OrderedDict((key, size) for _, key, size in entries)
+        self.total_bytes = sum(self._index.values())
+
+    def get(self, key):
+        with self._lock:
+            self._load_index()
+            if key not in self._index:
+                self.misses += 1
+                return None
+            path = self._path(key)
+            try:
+                with open(path, 'r', encoding='utf-8') as f: completion = json.load(f)
+                os.utime(path)
+            except (OSError, ValueError):
+                self.total_bytes -= self._index.pop(key)
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+            self.hits += 1
+        completion["cache_hit"] = True
+        log.debug("[LLMCompletionCache] Hit %s (%d hits / %d misses).", key[:12], self.hits, self.misses)
+        return completion
+
+    def put(self, key, completion):
+        data = json.dumps({k: v for k, v in completion.items() if k not in ("cache_hit", "timings")}, ensure_ascii=False).encode("utf-8")
+        path = self._path(key)
+        with self._lock:
+            self._load_index()
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'wb') as f: f.write(data)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                log.warning("[LLMCompletionCache] Warning: Could not write cache entry. Error: %s", e)
+                return
+            self.total_bytes += len(data) - self._index.pop(key, 0)
+            self._index[key] = len(data)
+            while self.total_bytes > self.max_bytes and len(self._index) > 1:
+                old_key, size = self._index.popitem(last=False)
+                self.total_bytes -= size
+                self.evictions += 1
+                try: os.remove(self._path(old_key))
+                except OSError: pass
+
+    def stats(self):
+        with self._lock:
+            self._load_index()
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                    "entries": len(self._index), "bytes": self.total_bytes, "max_bytes": self.max_bytes,
+                    "evictions": self.evictions, "enabled": self.enabled}
+
+    def clear(self):
+        with self._lock:
+            self._load_index()
+            for key in list(self._index):
+                try: os.remove(self._path(key))
+                except OSError: pass
+            self._index.clear()
+            self.total_bytes = 0
+        log.info("[LLMCompletionCache] Cache cleared.")
+
+def _error_completion(message):
+    return {"choices": [{"text": "", "finish_reason": "error"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            "error": message}
+
+def _run_batch_item(llm_model, item):
+    item = dict(item)
+    end_tags = item.pop("end_tags", None)
+    with metrics_scope(item=item.pop("metrics_item", None)):
+        if end_tags: return create_completion_streaming(llm_model, end_tags=end_tags, **item)
+        return llm_model.create_completion(**item)
+
+def run_completion_batch(llm_model, batch, max_concurrency=None):
+    """
+    Runs a list of create_completion kwarg dicts (optionally with `end_tags`)
+    and returns the completions in input order. Models that expose their own
+    `create_completions` fan out as they see fit; anything else runs serially.
+    An item's optional `metrics_item` (e.g. "Scene 3") labels its completion
+    in the metrics registry. Items are scheduled in the "batch" priority
+    class unless an `llm_request_scope` says otherwise.
+    A failed item never aborts the batch: its slot holds a completion with an
+    empty text and an `error` key, see `raise_batch_failures`.
+    """
+    batch = list(batch)
+    # Fan-outs queue behind single calls unless the caller chose a class.
+    with llm_request_scope(priority=_REQUEST_SCOPE.get().get("priority") or "batch"):
+        if hasattr(llm_model, "create_completions"):
+            return llm_model.create_completions(batch, max_concurrency=max_concurrency)
+        return _fan_out(lambda item: _run_batch_item(llm_model, item), batch, 1)
+
+def _fan_out(call, batch, max_concurrency):
+    def guarded(item):
+        try: return call(item)
+        except Exception as e:
+            log.warning("[AkkiNodes] Batch item failed: %s", e)
+            return _error_completion(str(e))
+    workers = max(1, min(int(max_concurrency or 1), len(batch)))
+    if workers == 1: return [guarded(item) for item in batch]
+    # Worker threads inherit the caller's metrics scope.
+    contexts = [contextvars.copy_context() for _ in batch]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="akki-llm") as pool:
+        return list(pool.map(lambda context, item: context.run(guarded, item), contexts, batch))
+
+def batch_failures(results):
+    return [(index, result["error"]) for index, result in enumerate(results) if result.get("error")]
+
+def raise_batch_failures(results, label="item"):
+    failures = batch_failures(results)
+    if failures:
+        details = "; ".join(f"{label} {index + 1}: {error}" for index, error in failures)
+        raise RuntimeError(f"{len(failures)} of {len(results)} LLM requests failed ({details})")
+
+class PromptOverflowError(ValueError):
+    """A prompt that cannot be made to fit the model's context window."""
+
+class PromptTemplateError(ValueError):
+    """A prompt template that does not parse or uses a placeholder its node does not fill."""
+
+class PromptSection:
+    """
+    One variable part of a prompt template for PromptBudget.pack. When the
+    prompt is too long, sections give way in order of ascending `priority`:
+    "trim" cuts the section at a paragraph or line break, "summarize" has
+    the model condense it, "drop" removes it. A section never shrinks below
+    `min_tokens`.
+    """
+    STRATEGIES = ("trim", "summarize", "drop")
+
+    def __init__(self, text, priority=0, strategy="trim", min_tokens=0):
+        if strategy not in self.STRATEGIES: raise ValueError(f"Unknown prompt section strategy '{strategy}'.")
+        self.text = text or ""
+        self.priority = priority
+        self.strategy = strategy
+        self.min_tokens = min_tokens
+
+def context_window(llm_model):
+    """The model's context size in tokens, or None when the backend does not say."""
+    window = getattr(llm_model, "context_window", None)
+    if callable(window): return window()
+    n_ctx = getattr(llm_model, "n_ctx", None)
+    return n_ctx() if callable(n_ctx) else None
+
+class PromptBudget:
+    """
+    Fits prompts into `n_ctx - max_tokens`. Text is measured with the active
+    model's tokenizer when it has one (llama.cpp); OpenAI-compatible servers
+    expose none, so their counts are estimated from the character length.
+    `pack` fills a `str.format` template, shrinks the lowest-priority
+    sections until the prompt fits (see PromptSection), and reports the final
+    token count before the call is made. An unknown context size disables the
+    limit but still reports the size. `overflow="error"` raises
+    PromptOverflowError instead of shrinking anything. Summaries are kept
+    per budget, so prompts packed from the same sources reuse them.
+    """
+    CHARS_PER_TOKEN_ESTIMATE = 3.2
+    SAFETY_MARGIN = 16
+    TRIM_MARKER = "\n[... {name}: {omitted} tokens omitted to fit the context window ...]"
+    SUMMARY_PROMPT = ("Condense the following {name} to at most {words} words. Keep every name, place, relationship and plot fact; "
+                      "drop style and repetition. Reply with the condensed text only.\n\n{text}\n\nCondensed {name}:")
+
+    def __init__(self, llm_model, max_tokens, n_ctx=None, label="PromptBudget"):
+        self.llm_model = llm_model
+        self.max_tokens = max_tokens or 0
+        self.n_ctx = n_ctx or context_window(llm_model)
+        self.label = label
+        tokenize = getattr(llm_model, "tokenize", None)
+        self._tokenize = tokenize if callable(tokenize) else None
+        self.exact = self._tokenize is not None
+        self.last_report = None
+        self._summaries = {}
+
+    @property
+    def limit(self):
+        return None if not self.n_ctx else self.n_ctx - self.max_tokens - self.SAFETY_MARGIN
+
+    def count(self, text):
+        if not text: return 0
+        if self._tokenize is not None:
+            try: return len(self._tokenize(text.encode("utf-8"), add_bos=False, special=True))
+            except Exception: self._tokenize, self.exact = None, False
+        return int(len(text) / self.CHARS_PER_TOKEN_ESTIMATE) + 1
+
+    def fits(self, text):
+        return self.limit is None or self.count(text) <= self.limit
+
+    def pack(self, template, sections, overflow="trim", **fixed):
+        # Sections the template never mentions cannot make it any shorter.
+        if isinstance(template, PromptTemplate): fields, template = template.fields, template.text
+        else: fields = {field.split(".")[0].split("[")[0] for _, field, _, _ in string.Formatter().parse(template) if field}
+        sections = {name: s if isinstance(s, PromptSection) else PromptSection(s) for name, s in sections.items() if name in fields}
+        texts = {name: s.text for name, s in sections.items()}
+        prompt = template.format(**fixed, **texts)
+        total, limit, shrunk = self.count(prompt), self.limit, []
+        if limit is not None and total > limit:
+            if overflow == "error":
+                raise PromptOverflowError(f"{self.label}: prompt is {total} tokens but only {limit} fit ({self.n_ctx} context - {self.max_tokens} reserved for output).")
+            for name, section in sorted(sections.items(), key=lambda kv: (kv[1].priority, -len(kv[1].text))):
+                excess = total - limit
+                if excess <= 0: break
+                current = self.count(texts[name])
+                target = max(section.min_tokens, current - excess)
+                if target >= current: continue
+                texts[name] = self._shrink(name, texts[name], current, target, section.strategy)
+                prompt = template.format(**fixed, **texts)
+                total = self.count(prompt)
+                shrunk.append(f"{name} {current}->{self.count(texts[name])} ({section.strategy})" if texts[name] else f"{name} dropped")
+            if total > limit:
+                raise PromptOverflowError(f"{self.label}: prompt is still {total} tokens after shrinking every section; only {limit} fit "
+                                          f"({self.n_ctx} context - {self.max_tokens} reserved for output).")
+        self.last_report = {"prompt_tokens": total, "limit": limit, "n_ctx": self.n_ctx, "max_tokens": self.max_tokens,
+                            "exact": self.exact, "shrunk": shrunk}
+        self.report()
+        return prompt
+
+    def report(self):
+        r = self.last_report
+        size = f"{r['prompt_tokens']}{'' if r['exact'] else ' (estimated)'} prompt tokens + {r['max_tokens']} reserved for output"
+        window = f" of a {r['n_ctx']}-token context" if r["n_ctx"] else " (context size unknown)"
+        shrunk = f"; shrunk to fit: {', '.join(r['shrunk'])}" if r["shrunk"] else ""
+        log.info("[%s] Prompt budget: %s%s%s.", self.label, size, window, shrunk)
+
+    def _shrink(self, name, text, current, target, strategy):
+        if strategy == "drop" or target <= 0: return ""
+        if strategy == "summarize":
+            try: return self._summarize(name, text, current, target)
+            except Exception as e: log.warning("[%s] Could not summarize %s, trimming it instead. Error: %s", self.label, name, e)
+        return self.trim(text, target, name=name)
+
+    def trim(self, text, target_tokens, name="section"):
+        """Keeps the start of `text`, cut at a paragraph/line break, within `target_tokens` (marker included)."""
+        current = self.count(text)
+        if current <= target_tokens: return text
+        marker_tokens = self.count(self.TRIM_MARKER.format(name=name, omitted=current))
+        budget = max(0, target_tokens - marker_tokens)
+        keep = int(len(text) * budget / current)
+        while True:
+            cut = text[:keep]
+            for separator in ("\n\n", "\n", ". "):
+                at = cut.rfind(separator)
+                if at > keep // 2:
+                    cut = cut[:at + len(separator)].rstrip()
+                    break
+            kept = self.count(cut)
+            if kept <= budget or keep == 0: break
+            keep = int(keep * 0.9)
+        return cut + self.TRIM_MARKER.format(name=name, omitted=current - kept)
+
+    def _summarize(self, name, text, current, target):
+        key = (name, text)
+        summary = self._summaries.get(key)
+        if summary is not None:
+            summary_tokens = self.count(summary)
+            if summary_tokens <= target:
+                log.info("[%s] Reusing the summary of %s (%d tokens).", self.label, name, summary_tokens)
+                return summary
+            # Tighter than last time: condense the earlier summary rather than the full text.
+            text, current = summary, summary_tokens
+        instructions = self.count(self.SUMMARY_PROMPT.format(name=name, words=0, text=""))
+        room = (self.n_ctx - target - instructions - self.SAFETY_MARGIN) if self.n_ctx else current
+        source = self.trim(text, room, name=name) if current > room else text
+        words = max(1, int(target * 0.7))
+        log.info("[%s] Summarizing %s (%d tokens) to about %d words to fit the context window...", self.label, name, current, words)
+        with metrics_scope(stage=f"Summarize {name}"):
+            output = self.llm_model.create_completion(prompt=self.SUMMARY_PROMPT.format(name=name, words=words, text=source),
+                                                      max_tokens=target, temperature=0.2, top_p=0.95, top_k=40, seed=1)
+        summary = (output["choices"][0]["text"] or "").strip()
+        if not summary: raise ValueError("empty summary")
+        summary = self._summaries[key] = self.trim(summary, target, name=name)
+        return summary
+
+class PromptTemplate:
+    """
+    A prompt file parsed once when it is loaded: its `str.format` fields
+    and the static text around them, whose token count is what every
+    prompt built from the template costs before any data is added.
+    """
+    def __init__(self, name, text):
+        self.name = name
+        self.text = text
+        try: parsed = list(string.Formatter().parse(text))
+        except ValueError as e: raise PromptTemplateError(f"Prompt template '{name}' does not parse: {e}") from None
+        self.fields = frozenset(field.split(".")[0].split("[")[0] for _, field, _, _ in parsed if field is not None)
+        if "" in self.fields or any(field.isdigit() for field in self.fields):
+            raise PromptTemplateError(f"Prompt template '{name}' has positional {{}} fields; name every placeholder.")
+        self.static_text = "".join(literal for literal, _, _, _ in parsed)
+        self.estimated_static_tokens = int(len(self.static_text) / PromptBudget.CHARS_PER_TOKEN_ESTIMATE) + 1
+        self._static_tokens = weakref.WeakKeyDictionary()
+
+    def validate(self, fields):
+        """Raises PromptTemplateError if the template uses a placeholder that is not in `fields`."""
+        unknown = self.fields - set(fields)
+        if unknown:
+            raise PromptTemplateError(f"Prompt template '{self.name}' uses {', '.join('{' + f + '}' for f in sorted(unknown))}, "
+                                      f"which this node does not fill (available: {', '.join(sorted(fields))}).")
+        return self
+
+    def format(self, **values):
+        return self.text.format(**values)
+
+    def static_tokens(self, budget=None):
+        """Tokens of the template without its fields: counted once per model with `budget`'s tokenizer, else estimated."""
+        if budget is None or not budget.exact: return self.estimated_static_tokens
+        try: return self._static_tokens[budget.llm_model]
+        except (KeyError, TypeError): pass
+        count = budget.count(self.static_text)
+        try: self._static_tokens[budget.llm_model] = count
+        except TypeError: pass
+        return count
+
+class PromptRegistry:
+    """
+    The prompt templates under `_prompts/`, addressed by folder (e.g.
+    "LookdevCHR/stage1") and file name. Templates are read and parsed once
+    and reloaded when the file's mtime changes, so repeated runs and
+    per-shot loops do not go back to disk. `get(..., fields=...)` checks
+    the template's placeholders against the values the node fills, so a
+    template with an unknown placeholder fails when it is loaded, before
+    any LLM call, instead of with a KeyError partway through a run.
+    """
+    ROOT_DIR = os.path.join(os.path.dirname(__file__), "_prompts")
+
+    def __init__(self, root_dir=ROOT_DIR):
+        self.root_dir = root_dir
+        self._cache = MtimeCache()
+
+    def directory(self, folder):
+        return os.path.join(self.root_dir, *folder.split("/")) if folder else self.root_dir
+
+    def list(self, folder, node_name="AkkiNodes"):
+        """The template files of a folder, for a node's prompt combo."""
+        return list_prompt_files(self.directory(folder), node_name)
+
+    def _load(self, path):
+        with open(path, 'r', encoding='utf-8') as f: text = f.read()
+        return PromptTemplate(os.path.relpath(path, self.root_dir).replace(os.sep, "/"), text)
+
+    def get(self, folder, filename, fields=None):
+        directory = self.directory(folder)
+        path = os.path.normpath(os.path.join(directory, filename))
+        if os.path.dirname(path) != os.path.normpath(directory): raise PromptTemplateError(f"Invalid prompt file name: {filename}")
+        if not os.path.isfile(path): raise FileNotFoundError(f"Prompt file not found: {path}")
+        template = self._cache.get(path, self._load)
+        return template.validate(fields) if fields is not None else template
+
+PROMPTS = PromptRegistry()
+
+class LLMRequestError(RuntimeError):
+    """
+    A completion request failed. `kind` is one of "timeout", "connection",
+    "rate_limit", "server", "client" or "invalid_response"; `retryable` marks
+    failures worth another attempt (on the same or another endpoint).
+    """
+    def __init__(self, message, kind="client", retryable=False, endpoint=None):
+        super().__init__(message)
+        self.kind = kind
+        self.retryable = retryable
+        self.endpoint = endpoint
+
+class LLMTimeoutError(LLMRequestError):
+    """A request attempt timed out, or the call ran out of its deadline."""
+    def __init__(self, message, retryable=True, endpoint=None):
+        super().__init__(message, kind="timeout", retryable=retryable, endpoint=endpoint)
+
+class LatencyTracker:
+    """Rolling window of successful request latencies, used to decide when to hedge."""
+    def __init__(self, window=200, min_samples=20):
+        self._samples = deque(maxlen=window)
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock: self._samples.append(seconds)
+
+    def percentile(self, q):
+        with self._lock:
+            if len(self._samples) < self.min_samples: return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+# Scheduling classes, most urgent first.
+PRIORITY_CLASSES = ("interactive", "normal", "batch")
+# Model tiers for LLMRouter, cheapest first.
+LLM_TIERS = ("mechanical", "standard", "creative")
+_REQUEST_SCOPE = contextvars.ContextVar("akki_llm_request_scope", default={})
+
+@contextmanager
+def llm_request_scope(priority=None, workflow=None, tier=None):
+    """Sets the scheduling class, fairness key and model tier of the LLM calls made inside the block."""
+    if priority is not None and priority not in PRIORITY_CLASSES: raise ValueError(f"Unknown LLM priority '{priority}'.")
+    if tier is not None and tier not in LLM_TIERS: raise ValueError(f"Unknown LLM tier '{tier}'.")
+    fields = {key: value for key, value in (("priority", priority), ("workflow", workflow), ("tier", tier)) if value}
+    token = _REQUEST_SCOPE.set(dict(_REQUEST_SCOPE.get(), **fields))
+    try: yield
+    finally: _REQUEST_SCOPE.reset(token)
+
+class LLMScheduler:
+    """
+    Admission control in front of one model: at most `slots` requests run at
+    once (1 for a llama.cpp context) and the rest wait in line. Waiting
+    requests are served strictly by priority class ("interactive" before
+    "normal" before "batch"), and round-robin across workflows within a
+    class, so one workflow's whole-film batch cannot starve another's.
+    Priority and workflow come from `llm_request_scope`; the workflow falls
+    back to the calling node. Wait times and queue depth go to the metrics
+    registry under `name`.
+    """
+    def __init__(self, name, slots=1):
+        self.name = name
+        self.slots = max(1, int(slots))
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        self._waiting = {priority: OrderedDict() for priority in PRIORITY_CLASSES}
+        METRICS.register_queue(name, self.gauges)
+
+    def set_slots(self, slots):
+        with self._cond:
+            self.slots = max(1, int(slots))
+            self._cond.notify_all()
+
+    @staticmethod
+    def _resolve(priority, workflow):
+        scope = _REQUEST_SCOPE.get()
+        priority = priority or scope.get("priority") or "normal"
+        workflow = workflow or scope.get("workflow") or current_scope().get("node") or "default"
+        return priority, workflow
+
+    def _head(self):
+        for queues in self._waiting.values():
+            for line in queues.values(): return line[0]
+        return None
+
+    def acquire(self, priority=None, workflow=None):
+        """Blocks until a slot is free and it is this request's turn; returns the seconds waited."""
+        priority, workflow = self._resolve(priority, workflow)
+        started = time.monotonic()
+        with self._cond:
+            if self.in_flight >= self.slots or self._head() is not None:
+                ticket, queues = object(), self._waiting[priority]
+                queues.setdefault(workflow, deque()).append(ticket)
+                while self.in_flight >= self.slots or self._head() is not ticket: self._cond.wait()
+                line = queues.pop(workflow)
+                line.popleft()
+                # Re-inserting at the end puts this workflow behind the others in its class.
+                if line: queues[workflow] = line
+            self.in_flight += 1
+        waited = time.monotonic() - started
+        METRICS.record_queue_wait(self.name, priority, waited)
+        return waited
+
+    def try_acquire(self):
+        """Takes a slot only if one is free and nobody is waiting; never blocks."""
+        with self._cond:
+            if self.in_flight >= self.slots or self._head() is not None: return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority=None, workflow=None):
+        self.acquire(priority, workflow)
+        try: yield
+        finally: self.release()
+
+    def gauges(self):
+        with self._cond:
+            return {"slots": self.slots, "in_flight": self.in_flight,
+                    "depth": {priority: sum(len(line) for line in queues.values()) for priority, queues in self._waiting.items()}}
+
+# Hedged duplicates run here so they never wait behind the batch fan-out
+# that issued them.
+_HEDGE_EXECUTOR = ThreadPoolExecutor(max_workers=32, thread_name_prefix="akki-hedge")
+
+# Request options that change how a call is made, not what it returns.
+TRANSPORT_PARAMS = ("timeout", "deadline")
+
+class LLMProxyBase(ABC):
+    """
+    Common behaviour for the LLM_MODEL objects handed out by the AkkiNodes
+    loaders. `max_parallel` is how many requests the backend can usefully
+    serve at once; `create_completions` never runs more than that.
+    Network-backed proxies run each request through `_run_with_policy`: every
+    attempt is bounded by `request_timeout`, the whole call by an optional
+    `deadline` (seconds), retryable failures are retried up to `max_retries`
+    times with jittered exponential backoff, and with `hedge` on, an attempt
+    that outlives the p95 latency gets a duplicate if a second scheduler
+    slot is free; the first answer wins.
+    Failures surface as LLMRequestError / LLMTimeoutError.
+    Every call that reaches the backend first takes one of `max_parallel`
+    slots from the model's LLMScheduler (cache hits skip the line).
+    """
+    max_parallel = 1
+    default_max_concurrency = 4
+    metrics_backend = None
+    request_timeout = None
+    deadline = None
+    max_retries = 0
+    hedge = False
+    # Sampling options the backend never receives; they stay out of the cache key.
+    ignored_params = ()
+    RETRY_BACKOFF_BASE = 0.5
+    RETRY_BACKOFF_CAP = 8.0
+    HEDGE_PERCENTILE = 0.95
+
+    def configure_requests(self, request_timeout=None, deadline=None, max_retries=None, hedge=None):
+        if request_timeout is not None: self.request_timeout = request_timeout or None
+        if deadline is not None: self.deadline = deadline or None
+        if max_retries is not None: self.max_retries = max(0, int(max_retries))
+        if hedge is not None: self.hedge = bool(hedge)
+        return self
+
+    def _run_with_policy(self, send, timeout=None, deadline=None, hedge=None, track_latency=True):
+        """
+        Calls `send(attempt_timeout)` under the deadline/retry/hedge policy.
+        Pass track_latency=False for calls (like opening a stream) whose
+        duration says nothing about how long a full completion takes.
+        """
+        timeout = timeout or self.request_timeout
+        deadline = deadline or self.deadline
+        deadline_at = time.monotonic() + deadline if deadline else None
+        hedge = self.hedge if hedge is None else hedge
+        attempt = 0
+        while True:
+            attempt_timeout = timeout
+            if deadline_at is not None:
+                remaining = deadline_at - time.monotonic()
+                if remaining <= 0: raise LLMTimeoutError(f"Request deadline of {deadline:g}s exceeded.", retryable=False)
+                attempt_timeout = min(timeout, remaining) if timeout else remaining
+            try:
+                if not track_latency: return send(attempt_timeout)
+                return self._hedged(send, attempt_timeout) if hedge else self._timed(send, attempt_timeout)
+            except LLMRequestError as e:
+                if not e.retryable or attempt >= self.max_retries: raise
+                delay = random.uniform(0, min(self.RETRY_BACKOFF_CAP, self.RETRY_BACKOFF_BASE * 2 ** attempt))
+                if deadline_at is not None and time.monotonic() + delay >= deadline_at:
+                    raise LLMTimeoutError(f"Request deadline of {deadline:g}s exceeded after {attempt + 1} attempt(s): {e}", retryable=False) from e
+                attempt += 1
+                log.warning("[%s] %s Retrying in %.1fs (attempt %d/%d).", type(self).__name__, e, delay, attempt + 1, self.max_retries + 1)
+                time.sleep(delay)
+
+    def _timed(self, send, attempt_timeout):
+        started = time.monotonic()
+        result = send(attempt_timeout)
+        self._latency_tracker().record(time.monotonic() - started)
+        return result
+
+    def _latency_tracker(self):
+        tracker = self.__dict__.get("_latency")
+        if tracker is None: tracker = self.__dict__.setdefault("_latency", LatencyTracker())
+        return tracker
+
+    def _hedged(self, send, attempt_timeout):
+        hedge_after = self._latency_tracker().percentile(self.HEDGE_PERCENTILE)
+        if hedge_after is None or (attempt_timeout and hedge_after >= attempt_timeout): return self._timed(send, attempt_timeout)
+        primary = _HEDGE_EXECUTOR.submit(self._timed, send, attempt_timeout)
+        try: return primary.result(timeout=hedge_after)
+        except FutureTimeoutError: pass
+        # The duplicate needs a slot of its own, or it would run past `parallel_requests`.
+        scheduler = self.request_scheduler()
+        if not scheduler.try_acquire():
+            log.debug("[%s] Request passed the p95 latency (%.1fs) but no slot is free for a hedged duplicate.", type(self).__name__, hedge_after)
+            return primary.result()
+        def hedge(attempt_timeout):
+            try: return self._timed(send, attempt_timeout)
+            finally: scheduler.release()
+        log.info("[%s] Request passed the p95 latency (%.1fs); sending a hedged duplicate.", type(self).__name__, hedge_after)
+        self.hedged_requests = getattr(self, "hedged_requests", 0) + 1
+        pending, error = {primary, _HEDGE_EXECUTOR.submit(hedge, attempt_timeout)}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                # The loser keeps its server slot until it finishes; its answer is dropped.
+                try: return future.result()
+                except LLMRequestError as e: error = e
+        raise error
+
+    def scheduler_name(self):
+        return f"{type(self).__name__}@{id(self):x}"
+
+    def request_scheduler(self):
+        scheduler = self.__dict__.get("_request_scheduler")
+        if scheduler is None: scheduler = self.__dict__.setdefault("_request_scheduler", LLMScheduler(self.scheduler_name(), self.max_parallel))
+        return scheduler
+
+    def set_parallelism(self, slots):
+        """How many requests this backend serves at once (scheduler slots and batch fan-out)."""
+        self.max_parallel = max(1, int(slots))
+        self.request_scheduler().set_slots(self.max_parallel)
+        return self
+
+    def create_completion(self, prompt, stream=False, use_cache=True, **kwargs):
+        """Every call is recorded in the metrics registry (llm_metrics.METRICS)."""
+        scheduler = self.request_scheduler()
+        if stream:
+            scheduler.acquire()
+            started = time.monotonic()
+            try: return MeteredStream(self._create_completion(prompt, stream=True, **kwargs), started, self.metrics_backend, on_close=scheduler.release)
+            except Exception:
+                scheduler.release()
+                raise
+        started = time.monotonic()
+        cache_key = self.completion_cache_key(prompt, kwargs) if use_cache else None
+        if cache_key:
+            cached = LLMCompletionCache.get_default().get(cache_key)
+            if cached is not None: return record_completion_metrics(cached, started, self.metrics_backend)
+        with scheduler.slot():
+            # Latency is the backend's; time spent in line is reported by the scheduler.
+            started = time.monotonic()
+            try: output = self._create_completion(prompt, **kwargs)
+            except Exception as e:
+                METRICS.record_completion(latency_s=time.monotonic() - started, error=type(e).__name__, backend=self.metrics_backend)
+                raise
+        if cache_key and not output.get("error"):
+            LLMCompletionCache.get_default().put(cache_key, output)
+        return record_completion_metrics(output, started, self.metrics_backend)
+
+    @abstractmethod
+    def _create_completion(self, prompt, stream=False, **kwargs):
+        """One uncached call to the backend: a completion dict, or an iterator of chunks when `stream`."""
+
+    def model_identity(self):
+        """Everything that makes this model's output differ from another's; None disables caching."""
+        return None
+
+    def context_window(self):
+        """Context size in tokens (prompt + output), or None when unknown."""
+        return None
+
+    def completion_cache_key(self, prompt, params, **extra):
+        cache = LLMCompletionCache.get_default()
+        if not cache.enabled or not cache.is_deterministic(params): return None
+        identity = self.model_identity()
+        if identity is None: return None
+        params = {k: v for k, v in params.items() if k not in TRANSPORT_PARAMS and k not in self.ignored_params}
+        return cache.make_key(identity, prompt, dict(params, **extra))
+
+    def create_completions(self, batch, max_concurrency=None):
+        concurrency = min(max_concurrency or self.default_max_concurrency, self.max_parallel)
+        return _fan_out(lambda item: _run_batch_item(self, item), list(batch), concurrency)
+
+def _llama_perf_timings(llm, reset=False):
+    """Prompt-eval / eval time of the context's last completion (llama.cpp perf counters)."""
+    try:
+        import llama_cpp
+        ctx = llm._ctx.ctx
+        if reset:
+            llama_cpp.llama_perf_context_reset(ctx)
+            return None
+        data = llama_cpp.llama_perf_context(ctx)
+        return {"prompt_eval_s": data.t_p_eval_ms / 1000.0, "eval_s": data.t_eval_ms / 1000.0,
+                "prompt_eval_tokens": data.n_p_eval, "eval_tokens": data.n_eval}
+    except Exception:
+        return None
+
+class LlamaCppProxy(LLMProxyBase):
+    """
+    Thin wrapper around a llama.cpp `Llama` that adds the batch API. A single
+    llama.cpp context is not thread-safe, so calls (including the whole life
+    of a stream) are serialized behind a lock. Every other attribute is
+    forwarded to the wrapped model, so `metadata`, `tokenize` etc. still work.
+    An optional llama.cpp state cache (see `set_prefix_cache`) lets prompts
+    that share a prefix with an earlier call skip evaluating that prefix; the
+    number of reused prompt tokens is reported per call and in aggregate.
+    When the model carries a metered draft model (speculative decoding), the
+    draft acceptance rate and effective tokens/sec are reported the same way.
+    llama.cpp's prompt-eval / eval timings are attached to each completion
+    (streams carry them in their final chunk) for the metrics registry.
+    With a batch decoder attached (`set_batch_decoder`), `create_completions`
+    decodes independent prompts together as parallel sequences and reports
+    their aggregate tokens/sec against this model's sequential calls.
+    """
+    metrics_backend = "llama.cpp"
+    def __init__(self, llm):
+        self.llm = llm
+        self._lock = threading.Lock()
+        self._identity = None
+        self.prefix_cache_config = None
+        self.prompt_tokens_total = 0
+        self.cached_prompt_tokens_total = 0
+        self.drafted_tokens_total = 0
+        self.accepted_tokens_total = 0
+        self.speculative_tokens_total = 0
+        self.speculative_seconds_total = 0.0
+        self._reload = None
+        self._detached_cache = None
+        self.batch_decoder = None
+        self.sequential_tokens_total = 0
+        self.sequential_seconds_total = 0.0
+        self.batched_tokens_total = 0
+        self.batched_seconds_total = 0.0
+
+    def __getattr__(self, name):
+        if self.__dict__.get("llm") is None and self.__dict__.get("_reload") is not None: self._ensure_loaded()
+        llm = self.__dict__.get("llm")
+        if llm is None: raise AttributeError(name)
+        return getattr(llm, name)
+
+    def _ensure_loaded(self):
+        while self.llm is None:
+            if self._reload is None: raise RuntimeError("This model has been unloaded; re-run its LLM Loader node.")
+            self._reload(self)
+
+    @contextmanager
+    def _loaded(self):
+        # Reload outside the proxy lock: the model cache takes its own lock and
+        # may need ours to evict, so never hold both in that order.
+        while True:
+            self._ensure_loaded()
+            self._lock.acquire()
+            if self.llm is not None: break
+            self._lock.release()
+        try: yield self.llm
+        finally: self._lock.release()
+
+    def attach(self, llm):
+        with self._lock:
+            if self._detached_cache is not None: llm.set_cache(self._detached_cache)
+            self.llm, self._detached_cache = llm, None
+
+    def release(self, keep_weights=False):
+        """
+        Free the wrapped model (waiting for any in-flight call); `_reload` may
+        bring it back. With `keep_weights`, only the context is freed because
+        other contexts derived from this model still use its weights.
+        """
+        with self._lock:
+            llm, self.llm = self.llm, None
+            if llm is not None: self._detached_cache = getattr(llm, "cache", None)
+            # The batch context runs on the same weights; it is rebuilt on next use.
+            if self.batch_decoder is not None: self.batch_decoder.close()
+        if llm is None: return
+        if keep_weights and getattr(llm, "_base_llm", None) is None:
+            for name in ("_batch", "_ctx"):
+                close = getattr(getattr(llm, name, None), "close", None)
+                if close: close()
+            llm.input_ids = llm.scores = None
+            return
+        close = getattr(llm, "close", None)
+        if close: close()
+
+    def model_identity(self):
+        if self._identity is None:
+            model_path = getattr(self.llm, "model_path", None)
+            try: st = os.stat(model_path)
+            except (OSError, TypeError): return None
+            metadata = json.dumps(getattr(self.llm, "metadata", None) or {}, sort_keys=True, default=str)
+            self._identity = {"backend": "llama.cpp", "model_path": os.path.abspath(model_path), "size": st.st_size,
+                              "mtime": int(st.st_mtime), "metadata": hashlib.sha256(metadata.encode("utf-8")).hexdigest()}
+        return self._identity
+
+    def context_window(self):
+        self._ensure_loaded()
+        return self.llm.n_ctx()
+
+    def scheduler_name(self):
+        model_path = getattr(self.__dict__.get("llm"), "model_path", None)
+        return f"llama.cpp:{os.path.basename(model_path)}@{id(self):x}" if model_path else super().scheduler_name()
+
+    def set_prefix_cache(self, cache, config=None):
+        """Attach a llama.cpp `LlamaRAMCache`/`LlamaDiskCache` (or None to detach)."""
+        with self._loaded() as llm:
+            llm.set_cache(cache)
+            self.prefix_cache_config = config
+
+    def _reused_prefix_tokens(self, prompt):
+        # Mirrors Llama._create_completion: the prompt resumes from whichever is
+        # longer, the tokens already in the context or the best cached state.
+        try: tokens = self.llm.tokenize(prompt.encode("utf-8"), special=True)
+        except Exception: return 0, 0
+        input_ids = getattr(self.llm, "_input_ids", None)
+        reused = _common_prefix_len(input_ids.tolist(), tokens) if input_ids is not None else 0
+        find_key = getattr(getattr(self.llm, "cache", None), "_find_longest_prefix_key", None)
+        if find_key:
+            try: key = find_key(tokens)
+            except Exception: key = None
+            if key: reused = max(reused, _common_prefix_len(key, tokens))
+        # llama.cpp always re-evaluates at least the final prompt token.
+        return len(tokens), min(reused, max(len(tokens) - 1, 0))
+
+    def _record_prefix_reuse(self, prompt_tokens, cached_tokens):
+        self.prompt_tokens_total += prompt_tokens
+        self.cached_prompt_tokens_total += cached_tokens
+
+    def prefix_cache_stats(self):
+        total = self.prompt_tokens_total
+        return {"prompt_tokens": total, "cached_prompt_tokens": self.cached_prompt_tokens_total,
+                "hit_rate": (self.cached_prompt_tokens_total / total) if total else 0.0,
+                "config": self.prefix_cache_config}
+
+    @staticmethod
+    def _speculation_snapshot(llm):
+        draft = getattr(llm, "draft_model", None)
+        return (draft, draft.calls, draft.proposed, time.perf_counter()) if hasattr(draft, "proposed") else None
+
+    def _record_speculation(self, snapshot, completion_tokens):
+        if snapshot is None: return None
+        draft, calls, proposed, started = snapshot
+        calls, proposed, elapsed = draft.calls - calls, draft.proposed - proposed, time.perf_counter() - started
+        # Every verification pass emits its accepted draft tokens plus one
+        # sampled token, and the first pass (the prompt) has no draft at all.
+        accepted = max(min(completion_tokens - calls - 1, proposed), 0)
+        self.drafted_tokens_total += proposed
+        self.accepted_tokens_total += accepted
+        self.speculative_tokens_total += completion_tokens
+        self.speculative_seconds_total += elapsed
+        report = {"drafted_tokens": proposed, "accepted_tokens": accepted,
+                  "acceptance_rate": (accepted / proposed) if proposed else 0.0,
+                  "tokens_per_second": (completion_tokens / elapsed) if elapsed > 0 else 0.0}
+        log.info("[LlamaCppProxy] Speculative decoding: %d/%d drafted tokens accepted (%.0f%%); %.1f tokens/s.",
+                 accepted, proposed, report['acceptance_rate'] * 100, report['tokens_per_second'])
+        return report
+
+    def speculative_stats(self):
+        drafted, seconds = self.drafted_tokens_total, self.speculative_seconds_total
+        return {"drafted_tokens": drafted, "accepted_tokens": self.accepted_tokens_total,
+                "acceptance_rate": (self.accepted_tokens_total / drafted) if drafted else 0.0,
+                "tokens_per_second": (self.speculative_tokens_total / seconds) if seconds else 0.0}
+
+    @staticmethod
+    def _resolve_grammar(kwargs):
+        grammar = kwargs.get("grammar")
+        return dict(kwargs, grammar=grammar.to_llama_grammar()) if isinstance(grammar, OutputGrammar) else kwargs
+
+    def _create_completion(self, prompt, stream=False, **kwargs):
+        kwargs = self._resolve_grammar({k: v for k, v in kwargs.items() if k not in TRANSPORT_PARAMS})
+        if stream: return self._locked_stream(prompt, **kwargs)
+        with self._loaded() as llm:
+            prompt_tokens, cached_tokens = self._reused_prefix_tokens(prompt)
+            snapshot = self._speculation_snapshot(llm)
+            _llama_perf_timings(llm, reset=True)
+            started = time.monotonic()
+            output = llm.create_completion(prompt=prompt, **kwargs)
+            self.sequential_seconds_total += time.monotonic() - started
+            self.sequential_tokens_total += (output.get("usage") or {}).get("completion_tokens", 0)
+            timings = _llama_perf_timings(llm)
+            self._record_prefix_reuse(prompt_tokens, cached_tokens)
+            speculative = self._record_speculation(snapshot, (output.get("usage") or {}).get("completion_tokens", 0))
+        usage = output.get("usage")
+        if isinstance(usage, dict): usage["prompt_tokens_details"] = {"cached_tokens": cached_tokens}
+        if speculative: output["speculative"] = speculative
+        if timings: output["timings"] = timings
+        return output
+
+    def set_batch_decoder(self, decoder):
+        """Attach a batch decoder (see LlamaBatchDecoder in Akki_LLM_Loader) or None to decode one prompt at a time."""
+        with self._lock:
+            if self.batch_decoder is not None and self.batch_decoder is not decoder: self.batch_decoder.close()
+            self.batch_decoder = decoder
+
+    def create_completions(self, batch, max_concurrency=None):
+        batch = list(batch)
+        decoder = self.batch_decoder
+        if decoder is None or len(batch) < 2: return super().create_completions(batch, max_concurrency)
+        results, queued, keys = [None] * len(batch), [], {}
+        cache = LLMCompletionCache.get_default()
+        for index, item in enumerate(batch):
+            if not decoder.accepts(item): continue
+            if item.get("use_cache", True):
+                params = {k: v for k, v in item.items() if k not in ("prompt", "use_cache", "end_tags", "metrics_item")}
+                extra = {"end_tags": item["end_tags"]} if item.get("end_tags") else {}
+                keys[index] = self.completion_cache_key(item["prompt"], params, **extra)
+            cached = cache.get(keys[index]) if keys.get(index) else None
+            if cached is not None:
+                with metrics_scope(item=item.get("metrics_item")):
+                    results[index] = record_completion_metrics(cached, time.monotonic(), self.metrics_backend)
+            else: queued.append(index)
+
+        def on_result(index, output, ttft_s, started):
+            if keys.get(index): cache.put(keys[index], output)
+            with metrics_scope(item=batch[index].get("metrics_item")):
+                results[index] = record_completion_metrics(output, started, "llama.cpp-batch", ttft_s=ttft_s)
+
+        if len(queued) > 1:
+            try:
+                with self.request_scheduler().slot(), self._loaded() as llm:
+                    seconds, tokens = decoder.run(llm, [(index, batch[index]) for index in queued], on_result, max_sequences=max_concurrency)
+                self._record_batch(len(queued), tokens, seconds)
+            except Exception as e:
+                log.warning("[LlamaCppProxy] Batched decoding failed; finishing the batch one prompt at a time. Error: %s", e)
+        rest = [index for index, result in enumerate(results) if result is None]
+        for index, output in zip(rest, super().create_completions([batch[index] for index in rest], max_concurrency)): results[index] = output
+        return results
+
+    def _record_batch(self, prompts, tokens, seconds):
+        self.batched_tokens_total += tokens
+        self.batched_seconds_total += seconds
+        rate = tokens / seconds if seconds > 0 else 0.0
+        baseline = self.batch_stats()["sequential_tokens_per_second"]
+        comparison = f" vs {baseline:.1f} tok/s sequential ({rate / baseline:.1f}x)" if baseline else " (no sequential calls yet to compare with)"
+        log.info("[LlamaCppProxy] Batched decode: %d prompts, %d tokens in %.2fs; %.1f tok/s aggregate%s.", prompts, tokens, seconds, rate, comparison)
+
+    def batch_stats(self):
+        sequential, batched = self.sequential_seconds_total, self.batched_seconds_total
+        return {"sequential_tokens_per_second": (self.sequential_tokens_total / sequential) if sequential else 0.0,
+                "batched_tokens_per_second": (self.batched_tokens_total / batched) if batched else 0.0,
+                "batched_tokens": self.batched_tokens_total,
+                "sequences": getattr(self.batch_decoder, "n_seq", 1) if self.batch_decoder is not None else 1}
+
+    def _locked_stream(self, prompt, **kwargs):
+        with self._loaded() as llm:
+            prompt_tokens, cached_tokens = self._reused_prefix_tokens(prompt)
+            self._record_prefix_reuse(prompt_tokens, cached_tokens)
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": 0, "total_tokens": prompt_tokens,
+                     "prompt_tokens_details": {"cached_tokens": cached_tokens}}
+            snapshot, chunks = self._speculation_snapshot(llm), 0
+            _llama_perf_timings(llm, reset=True)
+            stream = llm.create_completion(prompt=prompt, stream=True, **kwargs)
+            try:
+                # llama.cpp streams carry no usage; report the prompt side up
+                # front (it survives an early close) and the rest at the end.
+                yield {"choices": [{"text": ""}], "usage": dict(usage)}
+                for chunk in stream:
+                    chunks += 1
+                    yield chunk
+                yield {"choices": [{"text": ""}], "usage": dict(usage, completion_tokens=chunks, total_tokens=prompt_tokens + chunks),
+                       "timings": _llama_perf_timings(llm)}
+            finally:
+                close = getattr(stream, "close", None)
+                if close: close()
+                self._record_speculation(snapshot, chunks)
+
+class LlamaModelCache:
+    """
+    LRU cache of loaded llama.cpp models held under a RAM (and optional VRAM)
+    budget. Each entry's footprint is estimated up front from the GGUF file
+    size plus the KV cache needed for its n_ctx, and least recently used
+    entries are closed to make room before a new one is loaded. Entries with
+    the same `weights_key` (same file and GPU split) can be built with
+    `derive_fn` on top of an already resident model, so only their KV cache
+    costs memory; the weights are counted once per group and stay resident
+    until the group's last context goes. Memory an entry brings with it
+    (e.g. a speculative draft model) is passed as `extra_footprint` and
+    counted with its own context. An evicted LlamaCppProxy reloads itself
+    transparently if something still uses it. Budgets of None mean
+    "no limit".
+    """
+    KV_BYTES_PER_TOKEN_FALLBACK = 128 * 1024  # f16 KV for a typical 7-8B GQA model
+    KV_ELEMENT_BYTES = 2
+
+    def __init__(self, ram_budget_bytes=None, vram_budget_bytes=None):
+        self.ram_budget_bytes = ram_budget_bytes
+        self.vram_budget_bytes = vram_budget_bytes
+        self.evictions = 0
+        self.derived_loads = 0
+        self._entries = OrderedDict()
+        self._proxies = weakref.WeakValueDictionary()
+        self._metadata = {}
+        self._lock = threading.RLock()
+
+    def set_budgets(self, ram_budget_bytes=None, vram_budget_bytes=None):
+        with self._lock:
+            self.ram_budget_bytes, self.vram_budget_bytes = ram_budget_bytes, vram_budget_bytes
+            self._make_room({"ram": 0, "vram": 0})
+
+    @classmethod
+    def kv_bytes_per_token(cls, metadata):
+        arch = (metadata or {}).get("general.architecture")
+        try:
+            n_layer = int(metadata[f"{arch}.block_count"])
+            n_head = int(metadata[f"{arch}.attention.head_count"])
+            n_head_kv = int(metadata.get(f"{arch}.attention.head_count_kv", n_head))
+            head_dim = int(metadata.get(f"{arch}.attention.key_length", int(metadata[f"{arch}.embedding_length"]) // n_head))
+        except (KeyError, TypeError, ValueError, ZeroDivisionError):
+            return cls.KV_BYTES_PER_TOKEN_FALLBACK, None
+        return 2 * n_layer * n_head_kv * head_dim * cls.KV_ELEMENT_BYTES, n_layer
+
+    def estimate_footprint(self, model_path, n_ctx, n_gpu_layers, metadata=None, extra_footprint=None):
+        kv_per_token, n_layer = self.kv_bytes_per_token(metadata or self._metadata.get(model_path))
+        # Offloaded layers take their weights and KV to the GPU with them.
+        gpu_fraction = 1.0 if n_gpu_layers < 0 else min(n_gpu_layers / ((n_layer or 32) + 1), 1.0)
+        extra = extra_footprint or {}
+        # Extra memory belongs to this context alone, so it is counted like its KV cache.
+        return {"weights": os.path.getsize(model_path), "kv": kv_per_token * n_ctx + extra.get("weights", 0) + extra.get("kv", 0),
+                "gpu_fraction": gpu_fraction}
+
+    @staticmethod
+    def _split(nbytes, gpu_fraction):
+        return {"ram": int(nbytes * (1.0 - gpu_fraction)), "vram": int(nbytes * gpu_fraction)}
+
+    def _occupancy(self):
+        used, groups = {"ram": 0, "vram": 0}, {}
+        for entry in self._entries.values():
+            footprint = entry["footprint"]
+            groups[entry["weights_key"]] = footprint
+            for res, n in self._split(footprint["kv"], footprint["gpu_fraction"]).items(): used[res] += n
+        for footprint in groups.values():
+            for res, n in self._split(footprint["weights"], footprint["gpu_fraction"]).items(): used[res] += n
+        return used
+
+    def _make_room(self, needed, protect=()):
+        budgets = {"ram": self.ram_budget_bytes, "vram": self.vram_budget_bytes}
+        while True:
+            used = self._occupancy()
+            over = [res for res, budget in budgets.items() if budget is not None and used[res] + needed[res] > budget]
+            victim = next((key for key in self._entries if key not in protect), None)
+            if not over or victim is None:
+                if over: log.warning("[LlamaModelCache] Warning: Estimated %s use exceeds the budget and nothing more can be evicted.", "/".join(over).upper())
+                return
+            entry = self._entries.pop(victim)
+            shares_weights = any(e["weights_key"] == entry["weights_key"] for e in self._entries.values())
+            log.info("[LlamaModelCache] Evicting %s (ctx %s) to stay within the %s budget.", os.path.basename(victim[0]), victim[3], "/".join(over).upper())
+            entry["proxy"].release(keep_weights=shares_weights)
+            self.evictions += 1
+            gc.collect()
+
+    def get(self, key, load_fn, model_path, n_ctx, n_gpu_layers, weights_key=None, derive_fn=None, metadata=None, extra_footprint=None):
+        """
+        Return the cached proxy for `key`, loading it with `load_fn()` if needed.
+        If another entry with the same `weights_key` is resident, `derive_fn(llm)`
+        is tried first to build the new context on top of its weights.
+        `metadata` (e.g. read from the GGUF header) sizes the KV cache before
+        the first load; otherwise the fallback per-token estimate is used.
+        `extra_footprint` ({"weights", "kv"} bytes) is memory that lives and
+        goes with this entry, such as its draft model.
+        """
+        with self._lock:
+            if metadata: self._metadata.setdefault(model_path, metadata)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry["proxy"]
+            proxy = self._proxies.get(key) or LlamaCppProxy(None)
+            proxy._reload = lambda p: self._load_into(key, p, load_fn, model_path, n_ctx, n_gpu_layers, weights_key or key, derive_fn, extra_footprint)
+            self._proxies[key] = proxy
+            proxy._ensure_loaded()
+            return proxy
+
+    def _load_into(self, key, proxy, load_fn, model_path, n_ctx, n_gpu_layers, weights_key, derive_fn, extra_footprint=None):
+        with self._lock:
+            if proxy.llm is not None: return
+            donor_key = next((k for k, e in self._entries.items() if e["weights_key"] == weights_key), None) if derive_fn else None
+            footprint = self.estimate_footprint(model_path, n_ctx, n_gpu_layers, extra_footprint=extra_footprint)
+            needed = footprint["kv"] + (0 if donor_key else footprint["weights"])
+            self._make_room(self._split(needed, footprint["gpu_fraction"]), protect={key, donor_key})
+            llm = None
+            if donor_key:
+                try:
+                    llm = derive_fn(self._entries[donor_key]["proxy"].llm)
+                    self.derived_loads += 1
+                    log.info("[LlamaModelCache] Built a new context (ctx %d) on the resident weights of %s.", n_ctx, os.path.basename(model_path))
+                except Exception as e:
+                    log.warning("[LlamaModelCache] Could not reuse resident weights, loading from disk instead. Error: %s", e)
+            proxy.attach(llm if llm is not None else load_fn())
+            metadata = getattr(proxy.llm, "metadata", None)
+            if metadata: self._metadata[model_path] = metadata
+            self._entries[key] = {"proxy": proxy, "weights_key": weights_key,
+                                  "footprint": self.estimate_footprint(model_path, n_ctx, n_gpu_layers, metadata, extra_footprint)}
+            self._make_room({"ram": 0, "vram": 0}, protect={key})
+            log.info("[LlamaModelCache] %s", self.format_stats())
+
+    def stats(self):
+        with self._lock:
+            used = self._occupancy()
+            return {"models": len(self._entries), "weight_sets": len({e["weights_key"] for e in self._entries.values()}),
+                    "ram_bytes": used["ram"], "vram_bytes": used["vram"],
+                    "ram_budget_bytes": self.ram_budget_bytes, "vram_budget_bytes": self.vram_budget_bytes,
+                    "evictions": self.evictions, "derived_loads": self.derived_loads,
+                    "entries": [{"model": os.path.basename(key[0]), "n_ctx": key[3], **entry["footprint"]} for key, entry in self._entries.items()]}
+
+    def format_stats(self):
+        st = self.stats()
+        _gb = lambda n: "unlimited" if n is None else f"{n / 1024**3:.1f} GB"
+        return (f"{st['models']} context(s) on {st['weight_sets']} weight set(s); est. RAM {_gb(st['ram_bytes'])} / {_gb(st['ram_budget_bytes'])}, "
+                f"VRAM {_gb(st['vram_bytes'])} / {_gb(st['vram_budget_bytes'])}; {st['evictions']} eviction(s).")
+
+    def clear(self):
+        with self._lock:
+            entries, self._entries = self._entries, OrderedDict()
+            # Derived contexts go first so no context outlives the weights it runs on.
+            for entry in sorted(entries.values(), key=lambda e: getattr(e["proxy"].llm, "_base_llm", None) is None):
+                entry["proxy"].release()
+            gc.collect()
+
+class LlamaTuningProfiles:
+    """
+    JSON file of tuned llama.cpp load settings (n_batch, thread counts,
+    mmap/mlock), one per GGUF file and host, written by the LLM Loader's
+    "tune" mode and applied on every later load. The model is keyed by file
+    name and size and the host by name and CPU count, so a profile shared
+    with a different render node is simply not found there.
+    """
+    DEFAULT_PATH = os.path.join(os.path.dirname(__file__), "_cache", "llm_tuning_profiles.json")
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def host_key():
+        return f"{platform.node() or 'unknown-host'}/{os.cpu_count() or 0}cpu"
+
+    @classmethod
+    def profile_key(cls, model_path):
+        return f"{os.path.basename(model_path)}:{os.path.getsize(model_path)}@{cls.host_key()}"
+
+    def _read(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f: return json.load(f)
+        except FileNotFoundError: return {}
+        except (OSError, ValueError) as e:
+            log.warning("[LlamaTuningProfiles] Warning: Could not read %s; ignoring saved profiles. Error: %s", self.path, e)
+            return {}
+
+    def get(self, model_path):
+        with self._lock: return self._read().get(self.profile_key(model_path))
+
+    def put(self, model_path, settings, results=None):
+        profile = {"model": os.path.basename(model_path), "host": self.host_key(), "settings": settings,
+                   "tuned_at": time.strftime("%Y-%m-%d %H:%M:%S"), "results": results or {}}
+        with self._lock:
+            profiles = self._read()
+            profiles[self.profile_key(model_path)] = profile
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f: json.dump(profiles, f, indent=2)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                log.warning("[LlamaTuningProfiles] Warning: Could not save the profile. Error: %s", e)
+        return profile
+
+class OpenAIClientRegistry:
+    """
+    Process-wide registry of long-lived OpenAI clients, keyed by base_url.
+    Every LMStudioLlamaProxy that points at the same server shares a single
+    client, and therefore a single keep-alive connection pool, so the
+    back-to-back requests of the per-scene and per-block loops reuse open
+    sockets instead of paying for a fresh connection on every workflow run.
+    """
+    MAX_CONNECTIONS = 16
+    MAX_KEEPALIVE_CONNECTIONS = 8
+    KEEPALIVE_EXPIRY = 120.0
+    CONNECT_TIMEOUT = 10.0
+    READ_TIMEOUT = 600.0
+
+    _clients = {}
+    _stats = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _normalize_url(base_url):
+        return (base_url or "").strip().rstrip("/")
+
+    @classmethod
+    def get_client(cls, base_url):
+        key = cls._normalize_url(base_url)
+        with cls._lock:
+            if key in cls._clients:
+                cls._stats[key]["reuse_count"] += 1
+                return cls._clients[key]
+
+            stats = {"created_at": time.time(), "reuse_count": 0, "requests": 0, "responses": 0, "connections_opened": 0}
+            seen_connections = set()
+
+            def on_request(request):
+                with cls._lock: stats["requests"] += 1
+
+            def on_response(response):
+                pool = cls._get_connection_pool(cls._clients.get(key))
+                with cls._lock:
+                    stats["responses"] += 1
+                    for conn in getattr(pool, "connections", []) or []:
+                        if id(conn) not in seen_connections:
+                            seen_connections.add(id(conn))
+                            stats["connections_opened"] += 1
+
+            http_client = httpx.Client(
+                limits=httpx.Limits(max_connections=cls.MAX_CONNECTIONS,
+                                    max_keepalive_connections=cls.MAX_KEEPALIVE_CONNECTIONS,
+                                    keepalive_expiry=cls.KEEPALIVE_EXPIRY),
+                timeout=httpx.Timeout(cls.READ_TIMEOUT, connect=cls.CONNECT_TIMEOUT),
+                event_hooks={"request": [on_request], "response": [on_response]},
+            )
+            client = openai.OpenAI(base_url=key, api_key="not-needed", http_client=http_client)
+            cls._clients[key] = client
+            cls._stats[key] = stats
+            log.info("[OpenAIClientRegistry] Created pooled client for %s (max_connections=%d, keepalive=%d).", key, cls.MAX_CONNECTIONS, cls.MAX_KEEPALIVE_CONNECTIONS)
+            return client
+
+    @staticmethod
+    def _get_connection_pool(client):
+        # Reaches into httpx/httpcore internals; only used for reporting, so any
+        # layout change in those libraries simply yields empty socket stats.
+        try: return client._client._transport._pool
+        except AttributeError: return None
+
+    @classmethod
+    def get_pool_stats(cls, base_url=None):
+        keys = [cls._normalize_url(base_url)] if base_url else list(cls._clients.keys())
+        report = {}
+        for key in keys:
+            if key not in cls._clients: continue
+            pool = cls._get_connection_pool(cls._clients[key])
+            connections = list(getattr(pool, "connections", []) or [])
+            stats = dict(cls._stats[key])
+            stats["open_sockets"] = sum(1 for c in connections if not c.is_closed())
+            stats["idle_sockets"] = sum(1 for c in connections if c.is_idle())
+            stats["reused_requests"] = max(0, stats["responses"] - stats["connections_opened"])
+            report[key] = stats
+        return report
+
+    @classmethod
+    def format_pool_stats(cls, base_url=None):
+        lines = []
+        for key, s in cls.get_pool_stats(base_url).items():
+            lines.append(f"{key}: client reused {s['reuse_count']}x | requests {s['requests']} | "
+                         f"connections opened {s['connections_opened']} | requests on reused sockets {s['reused_requests']} | "
+                         f"open sockets {s['open_sockets']} ({s['idle_sockets']} idle)")
+        return "\n".join(lines) if lines else "No pooled clients."
+
+    @classmethod
+    def close_all(cls):
+        with cls._lock:
+            for client in cls._clients.values():
+                try: client.close()
+                except Exception: pass
+            cls._clients, cls._stats = {}, {}
+        log.info("[OpenAIClientRegistry] All pooled clients closed.")
+
+class LMStudioLlamaProxy(LLMProxyBase):
     """
     Acts as a proxy to an LM Studio server.
     v1.3 provides a definitive fix for the 'stop' token issue by building the
-    request payload manually for maximum robustness.
+    request payload manually for maximum robustness. v1.4 borrows its client
+    from the OpenAIClientRegistry so connections survive across workflow runs,
+    and v1.5 adds the concurrent `create_completions` batch API and the
+    persistent completion cache. v1.6 bounds every call (request timeout,
+    deadline, jittered retries, optional hedging; see LLMProxyBase) and raises
+    LLMRequestError instead of returning "ERROR: ..." as completion text.
+    v1.7 lets `parallel_requests` cap the requests in flight (the rest wait
+    in this server's LLMScheduler queue). v1.8 sends the caller's `seed`, so seeded
+    completions are reproducible and safe to cache.
     """
-    def __init__(self, base_url="http://localhost:1234/v1"):
-        self.client = OpenAI(base_url=base_url, api_key="not-needed")
+    # LM Studio queues requests beyond its parallel slots, so allow the
+    # registry's connection limit and let the server decide.
+    max_parallel = OpenAIClientRegistry.MAX_CONNECTIONS
+    metrics_backend = "openai-compatible"
+    # The chat completions API has no top_k, so it is never sent.
+    ignored_params = ("top_k",)
+
+    def __init__(self, base_url="http://localhost:1234/v1", request_timeout=600, deadline=None, max_retries=2, hedge=False, parallel_requests=None):
+        self.base_url = base_url
+        if parallel_requests: self.max_parallel = max(1, int(parallel_requests))
+        # Retries are ours (jittered, deadline-aware); the SDK's own would stack on top.
+        self.client = OpenAIClientRegistry.get_client(base_url).with_options(max_retries=0)
         self.model_name = "lm-studio"
+        self._served_models = None
+        self._context_window = None
+        self.configure_requests(request_timeout, deadline, max_retries, hedge)
+
+    def get_pool_stats(self):
+        return OpenAIClientRegistry.get_pool_stats(self.base_url)
+
+    def scheduler_name(self):
+        return OpenAIClientRegistry._normalize_url(self.base_url)
+
+    def model_identity(self):
+        # "lm-studio" routes to whatever the server has loaded, so key the
+        # cache on the model ids the server reports.
+        if self._served_models is None:
+            try: self._served_models = sorted(m.id for m in self.client.models.list(timeout=self.request_timeout).data)
+            except Exception as e:
+                log.warning("[LMStudioLlamaProxy] Could not list served models; completion cache bypassed. Error: %s", e)
+                return None
+        return {"backend": "openai-compatible", "base_url": OpenAIClientRegistry._normalize_url(self.base_url),
+                "model": self.model_name, "served_models": self._served_models}
+
+    def context_window(self):
+        # The OpenAI-compatible API does not expose it; LM Studio's own REST API does.
+        if self._context_window is None:
+            url = re.sub(r"/v1/?$", "", self.base_url.rstrip("/")) + "/api/v0/models"
+            try:
+                models = httpx.get(url, timeout=min(self.request_timeout or 10, 10)).json().get("data", [])
+                loaded = [m for m in models if m.get("state") == "loaded"] or models
+                sizes = [m.get("loaded_context_length") or m.get("max_context_length") for m in loaded]
+                self._context_window = min((size for size in sizes if size), default=0)
+            except Exception as e:
+                log.warning("[LMStudioLlamaProxy] Could not read the context size from %s; prompt budgets are unchecked. Error: %s", url, e)
+                self._context_window = 0
+        return self._context_window or None
+
+    def _request_error(self, e):
+        """Maps an OpenAI SDK exception to an LLMRequestError."""
+        if isinstance(e, LLMRequestError): return e
+        details = f"LM Studio request to {self.base_url} failed"
+        if isinstance(e, openai.APITimeoutError): return LLMTimeoutError(f"LM Studio request to {self.base_url} timed out.", endpoint=self.base_url)
+        if isinstance(e, openai.APIConnectionError):
+            return LLMRequestError(f"{details}. Is the server running? Details: {e}", kind="connection", retryable=True, endpoint=self.base_url)
+        if isinstance(e, openai.RateLimitError): return LLMRequestError(f"{details} (rate limited): {e}", kind="rate_limit", retryable=True, endpoint=self.base_url)
+        if isinstance(e, openai.InternalServerError): return LLMRequestError(f"{details} (server error): {e}", kind="server", retryable=True, endpoint=self.base_url)
+        if isinstance(e, openai.APIStatusError): return LLMRequestError(f"{details}: {e}", kind="client", endpoint=self.base_url)
+        return LLMRequestError(f"{details}: {type(e).__name__}: {e}", kind="invalid_response", endpoint=self.base_url)
+
+    def _create_completion(self, prompt, max_tokens=2048, temperature=0.7, top_p=0.95, top_k=40, stop=None, seed=None, stream=False, grammar=None,
+                           timeout=None, deadline=None, **kwargs):
+        if stream and grammar is not None:
+            # Partial JSON is of no use to a streaming consumer; answer in one rendered chunk.
+            output = self._create_completion(prompt, max_tokens, temperature, top_p, top_k, stop, seed, grammar=grammar, timeout=timeout, deadline=deadline, **kwargs)
+            return iter([{"choices": [dict(output["choices"][0], finish_reason="stop")], "usage": output["usage"]}])
 
-    def create_completion(self, prompt, max_tokens=2048, temperature=0.7, top_p=0.95, top_k=40, stop=None, seed=0, **kwargs):
-        
         # --- DEFINITIVE FIX: Manually construct the API payload ---
         # This ensures that all parameters are of the correct type and that
         # the 'stop' parameter is only included when it is a non-empty list.
@@ -63,16 +1781,31 @@ class LMStudioLlamaProxy:
         # Only add the 'stop' key if the 'stop' list is valid and not empty.
         if stop and isinstance(stop, list) and len(stop) > 0:
             payload['stop'] = stop
+        # Only a seed the caller fixed; without one (or with -1) the server samples at random.
+        if isinstance(seed, int) and seed >= 0:
+            payload['seed'] = seed
+        if grammar is not None:
+            payload['response_format'] = grammar.response_format()
 
-        print("\n[LMStudioLlamaProxy] Preparing to send request to LM Studio Server...")
-        print(f"[LMStudioLlamaProxy] API Payload being sent:\n{json.dumps(payload, indent=2)}\n")
+        log.debug("[LMStudioLlamaProxy] Preparing to send request to LM Studio Server...")
+        log_payload(log, "[LMStudioLlamaProxy] API Payload being sent", payload)
         # --- END OF FIX ---
 
+        if stream:
+            payload["stream"] = True
+            payload["stream_options"] = {"include_usage": True}
+            return self._stream_completion(payload, timeout=timeout, deadline=deadline)
+        return self._run_with_policy(lambda attempt_timeout: self._send(payload, grammar, attempt_timeout), timeout, deadline)
+
+    def _send(self, payload, grammar, timeout):
+        """One attempt, no retries."""
         try:
             # Use the manually constructed payload
-            completion = self.client.chat.completions.create(**payload)
+            completion = self.client.chat.completions.create(**payload, timeout=timeout)
             
             response_text = completion.choices[0].message.content
+            if response_text is None: raise ValueError("the server returned no message content")
+            if grammar is not None: response_text = grammar.render_json(response_text)
             usage_data = completion.usage
 
             formatted_output = {
@@ -85,8 +1818,492 @@ class LMStudioLlamaProxy:
             }
             return formatted_output
         except Exception as e:
-            print(f"[LMStudioLlamaProxy] API call failed: {e}")
-            return {
-                "choices": [{"text": f"ERROR: API call to LM Studio failed. Is the server running? Details: {e}"}],
-                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
-            }
\ No newline at end of file
+            error = self._request_error(e)
+            log.warning("[LMStudioLlamaProxy] API call failed: %s", error)
+            raise error from e
+
+    def _stream_completion(self, payload, timeout=None, deadline=None):
+        """
+        Yields llama.cpp-style chunks; closing the generator closes the HTTP
+        stream. Opening the stream follows the retry policy (no hedging);
+        a failure after the first chunk is raised as is.
+        """
+        def open_stream(attempt_timeout):
+            try: return self.client.chat.completions.create(**payload, timeout=attempt_timeout)
+            except Exception as e:
+                error = self._request_error(e)
+                log.warning("[LMStudioLlamaProxy] API call failed: %s", error)
+                raise error from e
+        response = self._run_with_policy(open_stream, timeout, deadline, track_latency=False)
+        try:
+            for chunk in response:
+                if getattr(chunk, "usage", None):
+                    yield {"choices": [{"text": ""}], "usage": {
+                        "prompt_tokens": chunk.usage.prompt_tokens,
+                        "completion_tokens": chunk.usage.completion_tokens,
+                        "total_tokens": chunk.usage.total_tokens,
+                    }}
+                if not chunk.choices: continue
+                choice = chunk.choices[0]
+                yield {"choices": [{"text": (choice.delta.content if choice.delta else None) or "", "finish_reason": choice.finish_reason}]}
+        except Exception as e:
+            raise self._request_error(e) from e
+        finally:
+            response.close()
+
+class LMStudioPoolProxy(LLMProxyBase):
+    """
+    Spreads completions over several OpenAI-compatible servers (LM Studio
+    boxes) serving the same model. Each call goes to the healthy endpoint with
+    the fewest requests in flight, ties broken by a rolling (EWMA) latency.
+    An endpoint that times out or refuses connections is ejected for
+    `eject_seconds`; once the ejection lapses it gets traffic again. Retries
+    and hedged duplicates (see LLMProxyBase) go to an endpoint the call has
+    not tried yet whenever there is one. Every request holds a slot in its
+    endpoint's own LLMScheduler while it runs, so `parallel_requests` caps
+    each server, not just the pool as a whole.
+    """
+    metrics_backend = "openai-compatible-pool"
+    ignored_params = LMStudioLlamaProxy.ignored_params
+    EJECTING_ERRORS = ("timeout", "connection")
+    LATENCY_ALPHA = 0.3
+
+    def __init__(self, base_urls, request_timeout=None, eject_seconds=30.0, deadline=None, max_retries=None, hedge=False, parallel_requests=None):
+        if not base_urls: raise ValueError("LMStudioPoolProxy needs at least one endpoint.")
+        self.eject_seconds = eject_seconds
+        self.endpoints = [{"url": url, "proxy": LMStudioLlamaProxy(base_url=url, request_timeout=request_timeout, max_retries=0, parallel_requests=parallel_requests),
+                           "in_flight": 0, "latency_ewma": None, "requests": 0, "failures": 0, "ejections": 0, "ejected_until": 0.0}
+                          for url in dict.fromkeys(base_urls)]
+        self.max_parallel = sum(endpoint["proxy"].max_parallel for endpoint in self.endpoints)
+        self._lock = threading.Lock()
+        # By default every endpoint gets one shot at a failing call.
+        self.configure_requests(request_timeout, deadline, len(self.endpoints) - 1 if max_retries is None else max_retries, hedge)
+
+    def _acquire_endpoint(self, exclude=()):
+        with self._lock:
+            now = time.monotonic()
+            candidates = [e for e in self.endpoints if e["url"] not in exclude]
+            if not candidates: return None
+            healthy = [e for e in candidates if e["ejected_until"] <= now]
+            # With everything ejected, probe the endpoint that comes back first.
+            endpoint = (min(healthy, key=lambda e: (e["in_flight"], e["latency_ewma"] or 0.0)) if healthy
+                        else min(candidates, key=lambda e: e["ejected_until"]))
+            endpoint["in_flight"] += 1
+            endpoint["requests"] += 1
+            return endpoint
+
+    def _acquire_untried(self, tried):
+        endpoint = self._acquire_endpoint(exclude=tried) or self._acquire_endpoint()
+        tried.append(endpoint["url"])
+        return endpoint
+
+    def _release_endpoint(self, endpoint, started, error=None):
+        with self._lock:
+            endpoint["in_flight"] -= 1
+            if error is None:
+                elapsed = time.monotonic() - started
+                previous = endpoint["latency_ewma"]
+                endpoint["latency_ewma"] = elapsed if previous is None else previous + self.LATENCY_ALPHA * (elapsed - previous)
+                endpoint["ejected_until"] = 0.0
+                return
+            endpoint["failures"] += 1
+            kind = getattr(error, "kind", None)
+            if kind in self.EJECTING_ERRORS:
+                endpoint["ejected_until"] = time.monotonic() + self.eject_seconds
+                endpoint["ejections"] += 1
+                log.warning("[LMStudioPoolProxy] Ejecting %s for %.0fs after a %s error.", endpoint['url'], self.eject_seconds, kind)
+
+    def model_identity(self):
+        served = set()
+        for endpoint in self.endpoints:
+            identity = endpoint["proxy"].model_identity()
+            if identity: served.update(identity["served_models"])
+        if not served: return None
+        return {"backend": "openai-compatible-pool", "served_models": sorted(served)}
+
+    def _create_completion(self, prompt, stream=False, timeout=None, deadline=None, **kwargs):
+        if stream: return self._stream_completion(prompt, timeout, deadline, **kwargs)
+        tried = []
+        def send(attempt_timeout):
+            endpoint = self._acquire_untried(tried)
+            with endpoint["proxy"].request_scheduler().slot():
+                started = time.monotonic()
+                try: output = endpoint["proxy"]._create_completion(prompt, timeout=attempt_timeout, **kwargs)
+                except Exception as e:
+                    self._release_endpoint(endpoint, started, e)
+                    raise
+            self._release_endpoint(endpoint, started)
+            return output
+        return self._run_with_policy(send, timeout, deadline)
+
+    def _stream_completion(self, prompt, timeout=None, deadline=None, **kwargs):
+        tried = []
+        def open_stream(attempt_timeout):
+            # A stream has "connected" once its first chunk arrives; until
+            # then a failure can still move to another endpoint.
+            endpoint = self._acquire_untried(tried)
+            scheduler = endpoint["proxy"].request_scheduler()
+            scheduler.acquire()
+            started, stream = time.monotonic(), None
+            try:
+                stream = endpoint["proxy"]._create_completion(prompt, stream=True, timeout=attempt_timeout, **kwargs)
+                return endpoint, scheduler, started, stream, next(stream, None)
+            except Exception as e:
+                close = getattr(stream, "close", None)
+                if close: close()
+                scheduler.release()
+                self._release_endpoint(endpoint, started, e)
+                raise
+        endpoint, scheduler, started, stream, first = self._run_with_policy(open_stream, timeout, deadline, track_latency=False)
+        error = None
+        try:
+            if first is not None: yield first
+            yield from stream
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            close = getattr(stream, "close", None)
+            if close: close()
+            scheduler.release()
+            self._release_endpoint(endpoint, started, error)
+
+    def scheduler_name(self):
+        return "pool:" + ",".join(OpenAIClientRegistry._normalize_url(endpoint["url"]) for endpoint in self.endpoints)
+
+    def context_window(self):
+        windows = [endpoint["proxy"].context_window() for endpoint in self.endpoints]
+        return min((window for window in windows if window), default=None)
+
+    def get_endpoint_stats(self):
+        with self._lock:
+            now = time.monotonic()
+            return [{"url": e["url"], "in_flight": e["in_flight"], "latency_ewma_s": e["latency_ewma"], "requests": e["requests"],
+                     "failures": e["failures"], "ejections": e["ejections"], "healthy": e["ejected_until"] <= now} for e in self.endpoints]
+
+    def format_endpoint_stats(self):
+        lines = []
+        for e in self.get_endpoint_stats():
+            latency = f"{e['latency_ewma_s']:.2f}s" if e["latency_ewma_s"] is not None else "n/a"
+            lines.append(f"{e['url']}: {'healthy' if e['healthy'] else 'EJECTED'}, in-flight {e['in_flight']}, latency {latency}, "
+                         f"{e['requests']} requests, {e['failures']} failures")
+        return "\n".join(lines)
+
+class LLMCassette:
+    """
+    A recording of LLM calls kept in one JSONL file (usually inside the
+    project folder): each line maps a request key (hash of the prompt and
+    the sampling parameters) to the completion or stream chunks the model
+    produced, with its usage and timing. Lines are only ever appended, so an
+    interrupted recording keeps everything up to the last finished call; a
+    key recorded twice resolves to its latest line. One instance is shared
+    per file, see `open`.
+    """
+    VERSION = 1
+    _open = {}
+    _open_lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path):
+        path = os.path.abspath(path)
+        with cls._open_lock:
+            cassette = cls._open.get(path)
+            if cassette is None: cassette = cls._open[path] = cls(path)
+            return cassette
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.hits = self.misses = self.recorded = 0
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._load()
+
+    def _load(self):
+        try: mtime = os.path.getmtime(self.path)
+        except OSError: return
+        if mtime == self._mtime: return
+        entries, skipped = {}, 0
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip(): continue
+                try:
+                    entry = json.loads(line)
+                    entries[entry["key"]] = entry
+                except (ValueError, KeyError, TypeError):
+                    skipped += 1
+        if skipped: log.warning("[LLMCassette] Warning: Skipped %d unreadable line(s) in %s.", skipped, self.path)
+        self.entries, self._mtime = entries, mtime
+
+    @staticmethod
+    def make_key(prompt, params, stream=False):
+        params = {k: v for k, v in params.items() if k not in TRANSPORT_PARAMS and k != "use_cache"}
+        material = json.dumps({"prompt": prompt, "params": params, "stream": bool(stream)}, sort_keys=True, default=_cache_json_default)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            self._load()
+            entry = self.entries.get(key)
+            if entry is None: self.misses += 1
+            else: self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        entry = dict(entry, key=key, version=self.VERSION, recorded_at=time.strftime("%Y-%m-%dT%H:%M:%S"))
+        line = json.dumps(entry, ensure_ascii=False, default=_cache_json_default) + "\n"
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path, 'a', encoding='utf-8') as f: f.write(line)
+                self._mtime = os.path.getmtime(self.path)
+            except OSError as e:
+                log.warning("[LLMCassette] Warning: Could not write to %s. Error: %s", self.path, e)
+                return
+            self.entries[key] = entry
+            self.recorded += 1
+
+    def stats(self):
+        with self._lock:
+            return {"path": self.path, "entries": len(self.entries), "hits": self.hits, "misses": self.misses, "recorded": self.recorded}
+
+    def format_stats(self):
+        s = self.stats()
+        return f"{s['entries']} entries, {s['hits']} replayed, {s['misses']} missed, {s['recorded']} recorded this session ({s['path']})"
+
+class CassetteProxy(LLMProxyBase):
+    """
+    Wraps any LLM_MODEL with an LLMCassette. In "record" mode every call goes
+    to the wrapped model and its answer is written to the cassette; in
+    "replay" mode calls are answered from the cassette alone (no model
+    needed) and a prompt that was never recorded raises LLMRequestError;
+    "replay_or_record" replays what it can and records the rest.
+    Replays return instantly by default, which isolates the Python stages
+    for profiling; replay_timing="recorded" sleeps for the recorded latency
+    instead, to reproduce the original run's pacing. The completion cache is
+    bypassed above the cassette, so every call reaches it.
+    """
+    MODES = ("replay_or_record", "replay", "record")
+    REPLAY_TIMINGS = ("instant", "recorded")
+    metrics_backend = "cassette"
+    REPLAY_PARALLEL = 64
+
+    def __init__(self, cassette, llm_model=None, mode="replay_or_record", replay_timing="instant"):
+        if mode not in self.MODES: raise ValueError(f"Unknown cassette mode '{mode}'.")
+        if replay_timing not in self.REPLAY_TIMINGS: raise ValueError(f"Unknown replay timing '{replay_timing}'.")
+        if llm_model is None and mode != "replay": raise ValueError(f"Cassette mode '{mode}' needs an llm_model to record from.")
+        self.cassette = cassette if isinstance(cassette, LLMCassette) else LLMCassette.open(cassette)
+        self.llm_model = llm_model
+        self.mode = mode
+        self.replay_timing = replay_timing
+
+    def __getattr__(self, name):
+        # tokenize, metadata etc. come from the wrapped model when there is one.
+        llm_model = self.__dict__.get("llm_model")
+        if llm_model is None: raise AttributeError(name)
+        return getattr(llm_model, name)
+
+    @property
+    def max_parallel(self):
+        if self.mode == "replay" or self.llm_model is None: return self.REPLAY_PARALLEL
+        return getattr(self.llm_model, "max_parallel", 1)
+
+    @property
+    def default_max_concurrency(self):
+        return getattr(self.llm_model, "default_max_concurrency", LLMProxyBase.default_max_concurrency)
+
+    def create_completion(self, prompt, stream=False, use_cache=True, **kwargs):
+        key = self.cassette.make_key(prompt, kwargs, stream=stream)
+        entry = self.cassette.get(key) if self.mode != "record" else None
+        if entry is not None: return self._replay(entry, stream)
+        if self.mode == "replay":
+            raise LLMRequestError(f"No cassette entry for this request ({key[:12]}) in {self.cassette.path}.", kind="client")
+        if isinstance(self.llm_model, LLMProxyBase): kwargs["use_cache"] = use_cache
+        if stream: return self._record_stream(key, prompt, kwargs)
+        started = time.monotonic()
+        output = self.llm_model.create_completion(prompt=prompt, **kwargs)
+        if not output.get("error"):
+            self.cassette.put(key, {"completion": {"choices": output.get("choices"), "usage": output.get("usage")},
+                                    "timings": output.get("timings") or {"latency_s": time.monotonic() - started}})
+        return output
+
+    def _create_completion(self, prompt, stream=False, **kwargs):
+        # create_completion is overridden, so the cassette is consulted on every path.
+        return self.create_completion(prompt, stream=stream, **kwargs)
+
+    def _record_stream(self, key, prompt, kwargs):
+        started, ttft_s, chunks, failed = time.monotonic(), None, [], False
+        stream = self.llm_model.create_completion(prompt=prompt, stream=True, **kwargs)
+        try:
+            for chunk in stream:
+                if ttft_s is None and (chunk.get("choices") or [{}])[0].get("text"): ttft_s = time.monotonic() - started
+                chunks.append(chunk)
+                yield chunk
+        except GeneratorExit:
+            raise
+        except Exception:
+            failed = True
+            raise
+        finally:
+            close = getattr(stream, "close", None)
+            if close: close()
+            # A stream the caller closed early (end tag reached) is recorded as far as it was read.
+            if chunks and not failed:
+                record = getattr(stream, "metrics", None)
+                timings = completion_timings(record) if record else {"latency_s": time.monotonic() - started, "ttft_s": ttft_s}
+                self.cassette.put(key, {"chunks": chunks, "timings": timings})
+
+    def _replay(self, entry, stream):
+        started = time.monotonic()
+        timings = entry.get("timings") or {}
+        paced = self.replay_timing == "recorded"
+        if stream: return MeteredStream(self._replay_chunks(entry, timings if paced else None), started, self.metrics_backend, cache_hit=not paced)
+        if paced and timings.get("latency_s"): time.sleep(timings["latency_s"])
+        output = json.loads(json.dumps(entry["completion"]))
+        output["replayed"] = True
+        if not paced: output["cache_hit"] = True
+        return record_completion_metrics(output, started, self.metrics_backend)
+
+    @staticmethod
+    def _replay_chunks(entry, timings):
+        chunks = entry.get("chunks")
+        if chunks is None:
+            completion = entry["completion"]
+            chunks = [{"choices": completion["choices"]}, {"choices": [], "usage": completion.get("usage")}]
+        text_chunks = sum(1 for chunk in chunks if (chunk.get("choices") or [{}])[0].get("text"))
+        first_token_s = (timings or {}).get("ttft_s") or 0.0
+        per_chunk_s = max(0.0, ((timings or {}).get("latency_s") or 0.0) - first_token_s) / max(1, text_chunks - 1)
+        emitted = 0
+        for chunk in chunks:
+            if timings and (chunk.get("choices") or [{}])[0].get("text"):
+                time.sleep(first_token_s if emitted == 0 else per_chunk_s)
+                emitted += 1
+            yield json.loads(json.dumps(chunk))
+
+    def model_identity(self):
+        return None
+
+    def context_window(self):
+        return context_window(self.llm_model) if self.llm_model is not None else None
+
+    def get_cassette_stats(self):
+        return self.cassette.stats()
+
+class PrioritizedLLMProxy:
+    """
+    Hands out an LLM_MODEL whose calls all run under one
+    `llm_request_scope`: a scheduling class for the shared model's queue and
+    a workflow name for fair queuing. Everything else is the wrapped model's.
+    """
+    def __init__(self, llm_model, priority="normal", workflow=None):
+        if priority not in PRIORITY_CLASSES: raise ValueError(f"Unknown LLM priority '{priority}'.")
+        self.llm_model = llm_model
+        self.priority = priority
+        self.workflow = workflow or None
+
+    def __getattr__(self, name):
+        llm_model = self.__dict__.get("llm_model")
+        if llm_model is None: raise AttributeError(name)
+        return getattr(llm_model, name)
+
+    def create_completion(self, *args, **kwargs):
+        with llm_request_scope(self.priority, self.workflow): return self.llm_model.create_completion(*args, **kwargs)
+
+    def create_completions(self, batch, max_concurrency=None):
+        with llm_request_scope(self.priority, self.workflow): return run_completion_batch(self.llm_model, batch, max_concurrency=max_concurrency)
+
+class LLMRouter:
+    """
+    An LLM_MODEL that fronts one loaded model per tier (LLM_TIERS, cheapest
+    first). Each call goes to the smallest model whose tier is at least the
+    one the calling stage declared with `llm_request_scope(tier=...)`;
+    undeclared calls get `default_tier`, and a tier with nothing loaded at
+    or above it falls back to the most capable model. Every routed call is
+    logged with an estimate of the time saved against the top model, from
+    the seconds per generated token each model has shown so far.
+    Everything else (tokenize, context_window, cache keys) is the routed
+    model's.
+    """
+    RATE_SMOOTHING = 0.3
+
+    def __init__(self, models, default_tier="creative"):
+        if default_tier not in LLM_TIERS: raise ValueError(f"Unknown LLM tier '{default_tier}'.")
+        self.routes = [(tier, models[tier]) for tier in LLM_TIERS if models.get(tier) is not None]
+        if not self.routes: raise ValueError("LLMRouter needs at least one model.")
+        self.default_tier = default_tier
+        self._lock = threading.Lock()
+        self._rates = {}
+        self._stats = {tier: {"model": self.describe(llm_model), "requests": 0, "seconds": 0.0, "completion_tokens": 0, "saved_s": 0.0}
+                       for tier, llm_model in self.routes}
+
+    @staticmethod
+    def describe(llm_model):
+        name_fn = getattr(llm_model, "scheduler_name", None)
+        name = name_fn() if name_fn else type(llm_model).__name__
+        return re.sub(r"^llama\.cpp:|@[0-9a-f]+$", "", name)
+
+    def route(self, tier=None):
+        """Returns (tier, llm_model) for a call declared as `tier` (default: the current request scope's)."""
+        rank = LLM_TIERS.index(tier or _REQUEST_SCOPE.get().get("tier") or self.default_tier)
+        for route_tier, llm_model in self.routes:
+            if LLM_TIERS.index(route_tier) >= rank: return route_tier, llm_model
+        return self.routes[-1]
+
+    def __getattr__(self, name):
+        if name.startswith("_") or "routes" not in self.__dict__: raise AttributeError(name)
+        return getattr(self.route()[1], name)
+
+    def create_completion(self, prompt, stream=False, **kwargs):
+        tier, llm_model = self.route()
+        if stream:
+            self._record(tier, None, 0, 1)
+            return llm_model.create_completion(prompt=prompt, stream=True, **kwargs)
+        started = time.monotonic()
+        output = llm_model.create_completion(prompt=prompt, **kwargs)
+        self._record(tier, time.monotonic() - started, (output.get("usage") or {}).get("completion_tokens", 0), 1)
+        return output
+
+    def create_completions(self, batch, max_concurrency=None):
+        batch = list(batch)
+        tier, llm_model = self.route()
+        started = time.monotonic()
+        outputs = run_completion_batch(llm_model, batch, max_concurrency=max_concurrency)
+        tokens = sum((output.get("usage") or {}).get("completion_tokens", 0) for output in outputs)
+        self._record(tier, time.monotonic() - started, tokens, len(batch))
+        return outputs
+
+    def _record(self, tier, seconds, completion_tokens, requests):
+        top_tier, top_model = self.routes[-1]
+        stats, scope = self._stats[tier], current_scope()
+        where = "/".join(part for part in (scope.get("node"), scope.get("stage")) if part) or "LLM call"
+        route = f"{where}: tier '{_REQUEST_SCOPE.get().get('tier') or self.default_tier}' -> {stats['model']}"
+        if seconds is None:
+            with self._lock: stats["requests"] += requests
+            log.info("[LLMRouter] %s (streamed)", route)
+            return
+        saved = None
+        with self._lock:
+            stats["requests"] += requests
+            stats["seconds"] += seconds
+            stats["completion_tokens"] += completion_tokens
+            if completion_tokens:
+                rate = seconds / completion_tokens
+                previous = self._rates.get(tier)
+                self._rates[tier] = rate if previous is None else previous + self.RATE_SMOOTHING * (rate - previous)
+            top_rate = self._rates.get(top_tier)
+            if tier != top_tier and top_rate is not None and completion_tokens:
+                saved = completion_tokens * top_rate - seconds
+                stats["saved_s"] += saved
+        detail = f"{requests} request{'s' if requests != 1 else ''}, {completion_tokens} tokens in {seconds:.2f}s"
+        if saved is not None: detail += f"; ~{saved:.1f}s saved vs {self.describe(top_model)}"
+        elif tier != top_tier and top_rate is None: detail += f"; time saved unknown until {self.describe(top_model)} has served a request"
+        log.info("[LLMRouter] %s (%s)", route, detail)
+
+    def get_router_stats(self):
+        with self._lock: return {tier: dict(stats) for tier, stats in self._stats.items()}
+
+    def format_stats(self):
+        lines = [f"{tier} -> {stats['model']}: {stats['requests']} requests, {stats['seconds']:.1f}s"
+                 + (f", ~{stats['saved_s']:.1f}s saved" if stats["saved_s"] else "")
+                 for tier, stats in self.get_router_stats().items()]
+        return "; ".join(lines)
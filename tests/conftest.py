@@ -0,0 +1,27 @@
+# Loads suite modules without running the package __init__, which imports
+# ComfyUI and registers every node. Run from the repository root:
+#   python -m pytest -q tests
+
+import os
+import sys
+import importlib
+import importlib.util
+import pytest
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE_NAME = "akkinodes_tests"
+
+def import_suite_module(name):
+    if PACKAGE_NAME not in sys.modules:
+        spec = importlib.util.spec_from_file_location(PACKAGE_NAME, os.path.join(PACKAGE_DIR, "__init__.py"),
+                                                      submodule_search_locations=[PACKAGE_DIR])
+        sys.modules[PACKAGE_NAME] = importlib.util.module_from_spec(spec)
+    return importlib.import_module(f"{PACKAGE_NAME}.{name}")
+
+@pytest.fixture(scope="session")
+def shared_utils():
+    return import_suite_module("shared_utils")
+
+@pytest.fixture(scope="session")
+def gguf_index():
+    return import_suite_module("gguf_index")
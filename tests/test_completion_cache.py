@@ -0,0 +1,56 @@
+import pytest
+
+def completion(text):
+    return {"choices": [{"text": text}], "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}}
+
+@pytest.fixture
+def cache(shared_utils, tmp_path):
+    return shared_utils.LLMCompletionCache(str(tmp_path / "completions"))
+
+def test_key_is_stable_and_covers_every_input(shared_utils):
+    make_key = shared_utils.LLMCompletionCache.make_key
+    model = {"backend": "llama.cpp", "model_path": "/models/a.gguf"}
+    key = make_key(model, "prompt", {"seed": 1, "temperature": 0.7, "stop": ["</a>"]})
+    assert key == make_key(dict(reversed(list(model.items()))), "prompt", {"stop": ["</a>"], "temperature": 0.7, "seed": 1})
+    assert key != make_key(model, "prompt ", {"seed": 1, "temperature": 0.7, "stop": ["</a>"]})
+    assert key != make_key(model, "prompt", {"seed": 2, "temperature": 0.7, "stop": ["</a>"]})
+    assert key != make_key(model, "prompt", {"seed": 1, "temperature": 0.7, "stop": ["</b>"]})
+    assert key != make_key(dict(model, model_path="/models/b.gguf"), "prompt", {"seed": 1, "temperature": 0.7, "stop": ["</a>"]})
+
+@pytest.mark.parametrize("params, deterministic", [
+    ({"seed": 0, "temperature": 0.7}, True),
+    ({"seed": 42}, True),
+    ({"seed": -1, "temperature": 0.7}, False),
+    ({"temperature": 0.0}, True),
+    ({"temperature": 0.7}, False),
+    ({}, False),
+])
+def test_only_reproducible_calls_are_cached(shared_utils, params, deterministic):
+    assert shared_utils.LLMCompletionCache.is_deterministic(params) is deterministic
+
+def test_round_trip_marks_hits_and_drops_timings(cache):
+    assert cache.get("ab" * 32) is None
+    cache.put("ab" * 32, dict(completion("hello"), timings={"latency_s": 1.0}))
+    hit = cache.get("ab" * 32)
+    assert hit["choices"][0]["text"] == "hello"
+    assert hit["cache_hit"] is True
+    assert "timings" not in hit
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_entries_survive_a_new_instance(shared_utils, cache):
+    cache.put("cd" * 32, completion("kept"))
+    reopened = shared_utils.LLMCompletionCache(cache.cache_dir)
+    assert reopened.get("cd" * 32)["choices"][0]["text"] == "kept"
+
+def test_least_recently_used_entry_is_evicted(shared_utils, tmp_path):
+    entry_size = len(shared_utils.json.dumps(completion("x" * 10)).encode("utf-8"))
+    cache = shared_utils.LLMCompletionCache(str(tmp_path / "lru"), max_bytes=entry_size * 2)
+    first, second, third = ("1" * 64, "2" * 64, "3" * 64)
+    cache.put(first, completion("x" * 10))
+    cache.put(second, completion("x" * 10))
+    assert cache.get(first) is not None  # now the most recently used
+    cache.put(third, completion("x" * 10))
+    assert cache.get(second) is None
+    assert cache.get(first) is not None and cache.get(third) is not None
+    assert cache.evictions == 1
+    assert cache.stats()["bytes"] <= cache.max_bytes
@@ -0,0 +1,69 @@
+import os
+import struct
+import pytest
+
+def gguf_string(text, count_format="<Q"):
+    data = text.encode("utf-8")
+    return struct.pack(count_format, len(data)) + data
+
+def write_gguf(path, context_length=4096, version=3, truncate=0):
+    """A GGUF header with a few typical keys and a tokenizer array, followed by fake tensor data."""
+    count = "<I" if version == 1 else "<Q"
+    s = lambda text: gguf_string(text, count)
+    kvs = [
+        s("general.architecture") + struct.pack("<I", 8) + s("llama"),
+        s("general.name") + struct.pack("<I", 8) + s("Tiny Llama"),
+        s("general.file_type") + struct.pack("<I", 4) + struct.pack("<I", 15),
+        s("llama.context_length") + struct.pack("<I", 4) + struct.pack("<I", context_length),
+        s("llama.rope.freq_base") + struct.pack("<I", 6) + struct.pack("<f", 10000.0),
+        s("tokenizer.ggml.tokens") + struct.pack("<I", 9) + struct.pack("<I", 8) + struct.pack(count, 3) + s("<s>") + s("a") + s("b"),
+        s("tokenizer.ggml.token_type") + struct.pack("<I", 9) + struct.pack("<I", 5) + struct.pack(count, 3) + struct.pack("<3i", 1, 1, 1),
+    ]
+    header = b"GGUF" + struct.pack("<I", version) + struct.pack(count, 2) + struct.pack(count, len(kvs)) + b"".join(kvs)
+    with open(path, "wb") as f: f.write(header[:len(header) - truncate] if truncate else header + b"\0" * 256)
+    return path
+
+def test_header_is_parsed_without_the_arrays(gguf_index, tmp_path):
+    metadata = gguf_index.read_gguf_metadata(write_gguf(tmp_path / "tiny.gguf"))
+    assert metadata["gguf.version"] == 3
+    assert metadata["gguf.tensor_count"] == 2
+    assert metadata["general.architecture"] == "llama"
+    assert metadata["llama.context_length"] == 4096
+    assert metadata["llama.rope.freq_base"] == pytest.approx(10000.0)
+    assert metadata["tokenizer.ggml.tokens"] == {"array_length": 3}
+    assert metadata["tokenizer.ggml.token_type"] == {"array_length": 3}
+
+def test_version_1_uses_32_bit_counts(gguf_index, tmp_path):
+    metadata = gguf_index.read_gguf_metadata(write_gguf(tmp_path / "v1.gguf", version=1))
+    assert metadata["gguf.version"] == 1
+    assert metadata["llama.context_length"] == 4096
+
+def test_summary_names_architecture_quantization_and_context(gguf_index, tmp_path):
+    path = write_gguf(tmp_path / "tiny.gguf")
+    summary = gguf_index.summarize_gguf(str(path), gguf_index.read_gguf_metadata(path), os.path.getsize(path))
+    assert (summary["architecture"], summary["quantization"], summary["context_length"]) == ("llama", "Q4_K_M", 4096)
+    assert summary["name"] == "Tiny Llama"
+    assert "tokenizer.ggml.tokens" not in summary["metadata"]
+
+def test_bad_files_raise_a_format_error(gguf_index, tmp_path):
+    not_gguf = tmp_path / "model.bin"
+    not_gguf.write_bytes(b"PK\x03\x04 not a model")
+    with pytest.raises(gguf_index.GGUFFormatError):
+        gguf_index.read_gguf_metadata(not_gguf)
+    with pytest.raises(gguf_index.GGUFFormatError):
+        gguf_index.read_gguf_metadata(write_gguf(tmp_path / "cut.gguf", truncate=50))
+
+def test_index_rereads_a_file_only_when_it_changes(gguf_index, tmp_path, monkeypatch):
+    path = write_gguf(tmp_path / "tiny.gguf")
+    index = gguf_index.GGUFIndex(str(tmp_path / "index.json"))
+    reads = []
+    read = gguf_index.read_gguf_metadata
+    monkeypatch.setattr(gguf_index, "read_gguf_metadata", lambda p: reads.append(p) or read(p))
+    assert index.get(str(path))["context_length"] == 4096
+    assert gguf_index.GGUFIndex(index.path).get(str(path))["context_length"] == 4096
+    assert len(reads) == 1
+    write_gguf(path, context_length=8192)
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1_000_000))
+    assert index.get(str(path))["context_length"] == 8192
+    assert len(reads) == 2
+    assert index.get(str(tmp_path / "missing.gguf")) is None
@@ -0,0 +1,48 @@
+import time
+import threading
+import pytest
+
+@pytest.fixture
+def slow_proxy(shared_utils):
+    class SlowProxy(shared_utils.LLMProxyBase):
+        """Answers every request after `delay` seconds and records how many ran at once."""
+        def __init__(self, slots, delay=0.3):
+            self.max_parallel = slots
+            self.delay = delay
+            self.running = self.peak = 0
+            self._count_lock = threading.Lock()
+            self.configure_requests(hedge=True)
+            # A p95 of 10ms, so the first slow request is hedged.
+            for _ in range(20): self._latency_tracker().record(0.01)
+
+        def _send(self, attempt_timeout):
+            with self._count_lock:
+                self.running += 1
+                self.peak = max(self.peak, self.running)
+            time.sleep(self.delay)
+            with self._count_lock: self.running -= 1
+            return {"choices": [{"text": "ok"}], "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}}
+
+        def _create_completion(self, prompt, stream=False, **kwargs):
+            return self._run_with_policy(self._send)
+
+    return SlowProxy
+
+def wait_idle(scheduler, timeout=5.0):
+    end = time.monotonic() + timeout
+    while scheduler.gauges()["in_flight"] and time.monotonic() < end: time.sleep(0.01)
+    return scheduler.gauges()["in_flight"]
+
+def test_hedge_is_skipped_without_a_free_slot(slow_proxy):
+    proxy = slow_proxy(slots=1)
+    assert proxy.create_completion("x", use_cache=False)["choices"][0]["text"] == "ok"
+    assert proxy.peak == 1
+    assert getattr(proxy, "hedged_requests", 0) == 0
+    assert wait_idle(proxy.request_scheduler()) == 0
+
+def test_hedge_takes_a_second_slot_and_returns_it(slow_proxy):
+    proxy = slow_proxy(slots=2)
+    assert proxy.create_completion("x", use_cache=False)["choices"][0]["text"] == "ok"
+    assert proxy.hedged_requests == 1
+    assert proxy.peak == 2
+    assert wait_idle(proxy.request_scheduler()) == 0
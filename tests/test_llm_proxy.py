@@ -0,0 +1,12 @@
+import pytest
+
+def test_a_proxy_without_create_completion_fails_at_construction(shared_utils):
+    class Incomplete(shared_utils.LLMProxyBase):
+        pass
+    with pytest.raises(TypeError):
+        Incomplete()
+
+def test_cassette_proxy_is_constructible_in_replay_mode(shared_utils, tmp_path):
+    proxy = shared_utils.CassetteProxy(str(tmp_path / "run.cassette.jsonl"), mode="replay")
+    with pytest.raises(shared_utils.LLMRequestError):
+        proxy.create_completion("never recorded")
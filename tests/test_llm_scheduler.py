@@ -0,0 +1,66 @@
+import time
+import threading
+
+def wait_for(condition, timeout=5.0):
+    end = time.monotonic() + timeout
+    while not condition() and time.monotonic() < end: time.sleep(0.005)
+    return condition()
+
+def queued(scheduler):
+    return sum(scheduler.gauges()["depth"].values())
+
+def run_in_order(scheduler, requests):
+    """Queues `requests` (priority, workflow, label) behind a held slot, in order, and returns the order they were served in."""
+    served = []
+    def worker(priority, workflow, label):
+        scheduler.acquire(priority, workflow)
+        served.append(label)
+        scheduler.release()
+    scheduler.acquire("normal", "holder")
+    threads = []
+    for n, request in enumerate(requests, 1):
+        thread = threading.Thread(target=worker, args=request)
+        thread.start()
+        threads.append(thread)
+        assert wait_for(lambda: queued(scheduler) == n)
+    scheduler.release()
+    for thread in threads: thread.join(5)
+    return served
+
+def test_higher_priority_classes_are_served_first(shared_utils):
+    scheduler = shared_utils.LLMScheduler("test-priority", slots=1)
+    served = run_in_order(scheduler, [("batch", "w", "batch"), ("normal", "w", "normal"), ("interactive", "w", "interactive")])
+    assert served == ["interactive", "normal", "batch"]
+
+def test_workflows_take_turns_within_a_class(shared_utils):
+    scheduler = shared_utils.LLMScheduler("test-round-robin", slots=1)
+    served = run_in_order(scheduler, [("batch", "a", "a1"), ("batch", "a", "a2"), ("batch", "a", "a3"), ("batch", "b", "b1"), ("batch", "b", "b2")])
+    assert served == ["a1", "b1", "a2", "b2", "a3"]
+
+def test_slots_cap_requests_in_flight(shared_utils):
+    scheduler = shared_utils.LLMScheduler("test-slots", slots=2)
+    lock, running, peak = threading.Lock(), [0], [0]
+    def worker():
+        with scheduler.slot():
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.02)
+            with lock: running[0] -= 1
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join(5)
+    assert peak[0] == 2
+    assert scheduler.gauges()["in_flight"] == 0
+
+def test_try_acquire_takes_only_a_free_slot(shared_utils):
+    scheduler = shared_utils.LLMScheduler("test-try-acquire", slots=2)
+    assert scheduler.try_acquire()
+    assert scheduler.try_acquire()
+    assert not scheduler.try_acquire()
+    assert scheduler.gauges()["in_flight"] == 2
+    scheduler.release()
+    assert scheduler.try_acquire()
+    scheduler.release()
+    scheduler.release()
+    assert scheduler.gauges()["in_flight"] == 0
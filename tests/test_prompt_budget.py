@@ -0,0 +1,77 @@
+import pytest
+
+class WordModel:
+    """One token per whitespace-separated word; summaries are a fixed short text."""
+    def __init__(self, summary="condensed facts only", fail=False):
+        self.summary = summary
+        self.fail = fail
+        self.summary_calls = 0
+
+    def tokenize(self, data, add_bos=False, special=True):
+        return data.split()
+
+    def create_completion(self, prompt, **kwargs):
+        self.summary_calls += 1
+        if self.fail: raise RuntimeError("model unavailable")
+        return {"choices": [{"text": self.summary}], "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}}
+
+TEMPLATE = "Write a scene.\n{world}\n{story}\n{cast}"
+
+def paragraphs(word, count, words_each=10):
+    return "\n\n".join(" ".join([word] * words_each) for _ in range(count))
+
+def sections(shared_utils, strategy="trim", world_min=0):
+    return {"world": shared_utils.PromptSection(paragraphs("w", 6), priority=1, strategy=strategy, min_tokens=world_min),
+            "story": shared_utils.PromptSection(paragraphs("s", 3), priority=2),
+            "cast": shared_utils.PromptSection("Mira and Jon", priority=3)}
+
+def test_a_prompt_that_fits_is_left_alone(shared_utils):
+    budget = shared_utils.PromptBudget(WordModel(), max_tokens=10, n_ctx=1000)
+    prompt = budget.pack(TEMPLATE, sections(shared_utils))
+    assert prompt == TEMPLATE.format(world=paragraphs("w", 6), story=paragraphs("s", 3), cast="Mira and Jon")
+    assert budget.last_report["shrunk"] == []
+    assert budget.exact
+
+def test_trim_shrinks_the_lowest_priority_section_first(shared_utils):
+    budget = shared_utils.PromptBudget(WordModel(), max_tokens=20, n_ctx=120)
+    prompt = budget.pack(TEMPLATE, sections(shared_utils))
+    assert budget.count(prompt) <= budget.limit
+    assert "world: " in prompt and "tokens omitted" in prompt
+    assert paragraphs("s", 3) in prompt and "Mira and Jon" in prompt
+    assert [entry.split()[0] for entry in budget.last_report["shrunk"]] == ["world"]
+
+def test_drop_removes_the_section(shared_utils):
+    budget = shared_utils.PromptBudget(WordModel(), max_tokens=20, n_ctx=120)
+    prompt = budget.pack(TEMPLATE, sections(shared_utils, strategy="drop"))
+    assert " w " not in f" {prompt} "
+    assert budget.last_report["shrunk"] == ["world dropped"]
+
+def test_error_overflow_raises_instead_of_shrinking(shared_utils):
+    budget = shared_utils.PromptBudget(WordModel(), max_tokens=20, n_ctx=120)
+    with pytest.raises(shared_utils.PromptOverflowError):
+        budget.pack(TEMPLATE, sections(shared_utils), overflow="error")
+
+def test_min_tokens_that_cannot_fit_raise(shared_utils):
+    budget = shared_utils.PromptBudget(WordModel(), max_tokens=20, n_ctx=60)
+    with pytest.raises(shared_utils.PromptOverflowError):
+        budget.pack("{world}", {"world": shared_utils.PromptSection(paragraphs("w", 6), min_tokens=50)})
+
+def test_summaries_are_reused_across_packs(shared_utils):
+    model = WordModel()
+    budget = shared_utils.PromptBudget(model, max_tokens=20, n_ctx=120)
+    first = budget.pack(TEMPLATE, sections(shared_utils, strategy="summarize"))
+    second = budget.pack(TEMPLATE + "\nDraft: {draft}", sections(shared_utils, strategy="summarize"), draft="a short draft")
+    assert "condensed facts only" in first and "condensed facts only" in second
+    assert model.summary_calls == 1
+
+def test_a_failed_summary_falls_back_to_trimming(shared_utils):
+    budget = shared_utils.PromptBudget(WordModel(fail=True), max_tokens=20, n_ctx=120)
+    prompt = budget.pack(TEMPLATE, sections(shared_utils, strategy="summarize"))
+    assert "tokens omitted" in prompt
+    assert budget.count(prompt) <= budget.limit
+
+def test_an_unknown_context_size_disables_the_limit(shared_utils):
+    budget = shared_utils.PromptBudget(WordModel(), max_tokens=20)
+    assert budget.limit is None
+    prompt = budget.pack(TEMPLATE, sections(shared_utils))
+    assert budget.last_report["shrunk"] == [] and "tokens omitted" not in prompt